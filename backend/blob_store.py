@@ -0,0 +1,177 @@
+"""
+Armazenamento deduplicado das imagens das roupas
+
+Cada imagem é guardada uma única vez por usuário na coleção `image_blobs`,
+com chave derivada do SHA-256 dos bytes e um contador de referências. Enviar
+a mesma foto de novo só incrementa o contador; apagar uma roupa só remove a
+imagem quando a última referência é liberada. Com IMAGE_DEDUP_PERCEPTUAL=true
+também são calculados um dHash (Pillow) e a cor média por canal, e uma foto
+reencodada ou redimensionada (dHash a poucos bits e mesma cor média de um blob
+existente) passa a apontar para esse blob. O dHash é em tons de cinza: sem a
+cor, a mesma peça em outra cor seria tratada como a mesma foto.
+"""
+import asyncio
+import base64
+import io
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import Binary
+from PIL import Image, ImageStat
+from pymongo import ReturnDocument
+
+from image_upload import UploadedImage
+
+logger = logging.getLogger(__name__)
+
+PERCEPTUAL_DEDUP = os.environ.get('IMAGE_DEDUP_PERCEPTUAL', 'false').lower() == 'true'
+DHASH_MAX_DISTANCE = 4  # bits diferentes tolerados entre fotos "iguais"
+COLOR_MAX_DIFFERENCE = 12  # diferença máxima da cor média, por canal (0-255)
+
+
+def blob_id_for(user_id: str, sha256: str) -> str:
+    return f"{user_id}:{sha256}"
+
+
+def fingerprint(data: bytes, size: int = 8) -> Optional[Tuple[str, List[int]]]:
+    """
+    (dHash de 64 bits em hexadecimal, cor média [R, G, B]); None se o Pillow
+    não abrir a imagem ou se ela for lisa
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.draft("RGB", (size * 4, size * 4))  # JPEG: decodifica já reduzido
+            small = img.convert("RGB").resize((size + 1, size), Image.LANCZOS)
+    except Exception as e:
+        logger.debug("dHash indisponível para a imagem: %s", e)
+        return None
+    pixels = list(small.convert("L").getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    if bits == 0 or bits == (1 << (size * size)) - 1:
+        return None  # imagem lisa ou gradiente: hash sem informação, colidiria com qualquer outra
+    mean_color = [round(value) for value in ImageStat.Stat(small).mean]
+    return f"{bits:0{size * size // 4}x}", mean_color
+
+
+async def _find_similar(collection, user_id: str, image_dhash: str, mean_color: List[int]) -> Optional[str]:
+    """Blob do usuário com a mesma cor média e dHash a até DHASH_MAX_DISTANCE bits de distância"""
+    target = int(image_dhash, 16)
+    best_id, best_distance = None, DHASH_MAX_DISTANCE + 1
+    async for blob in collection.find(
+        {"user_id": user_id, "dhash": {"$ne": None}, "cor_media": {"$ne": None}, "refcount": {"$gt": 0}},
+        {"dhash": 1, "cor_media": 1}
+    ):
+        if max(abs(a - b) for a, b in zip(mean_color, blob["cor_media"])) > COLOR_MAX_DIFFERENCE:
+            continue
+        distance = bin(target ^ int(blob["dhash"], 16)).count("1")
+        if distance < best_distance:
+            best_id, best_distance = blob["_id"], distance
+    return best_id
+
+
+async def ensure_indexes(collection) -> None:
+    await collection.create_index([("user_id", 1), ("dhash", 1)], sparse=True)
+
+
+async def store(collection, user_id: str, image: UploadedImage) -> str:
+    """Guarda (ou reaproveita) a imagem do usuário e retorna o id do blob com uma referência a mais"""
+    blob_id = blob_id_for(user_id, image.sha256)
+
+    image_dhash = mean_color = None
+    if PERCEPTUAL_DEDUP:
+        image_fingerprint = await asyncio.to_thread(fingerprint, image.data)
+        if image_fingerprint:
+            image_dhash, mean_color = image_fingerprint
+        similar_id = await _find_similar(collection, user_id, image_dhash, mean_color) if image_dhash else None
+        if similar_id and similar_id != blob_id:
+            similar = await collection.find_one_and_update(
+                {"_id": similar_id, "refcount": {"$gt": 0}},
+                {"$inc": {"refcount": 1}},
+                projection={"_id": 1},
+            )
+            if similar:
+                logger.info("Imagem reaproveitada por dHash para o usuário %s", user_id)
+                return similar_id
+
+    doc = await collection.find_one_and_update(
+        {"_id": blob_id},
+        {
+            "$inc": {"refcount": 1},
+            "$setOnInsert": {
+                "user_id": user_id,
+                "sha256": image.sha256,
+                "content_type": image.content_type,
+                "size": image.size,
+                "data": Binary(image.data),
+                "dhash": image_dhash,
+                "cor_media": mean_color,
+                "created_at": datetime.utcnow(),
+            },
+        },
+        projection={"_id": 0, "refcount": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc["refcount"] > 1:
+        logger.info("Imagem duplicada reaproveitada para o usuário %s (%d referências)", user_id, doc["refcount"])
+    return blob_id
+
+
+async def release(collection, blob_id: str) -> None:
+    """Libera uma referência; o blob é apagado quando ninguém mais o usa"""
+    doc = await collection.find_one_and_update(
+        {"_id": blob_id},
+        {"$inc": {"refcount": -1}},
+        projection={"_id": 0, "refcount": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc is not None and doc["refcount"] <= 0:
+        # Condicional: um upload concorrente pode ter voltado a referenciar o blob
+        await collection.delete_one({"_id": blob_id, "refcount": {"$lte": 0}})
+
+
+async def load_data_uris(collection, blob_ids: Iterable[str]) -> Dict[str, str]:
+    """Busca vários blobs numa única consulta e devolve id -> data URI"""
+    ids = list({blob_id for blob_id in blob_ids if blob_id})
+    if not ids:
+        return {}
+    blobs = await collection.find(
+        {"_id": {"$in": ids}}, {"data": 1, "content_type": 1}
+    ).to_list(len(ids))
+    return {
+        blob["_id"]: f"data:{blob['content_type']};base64,{base64.b64encode(blob['data']).decode('ascii')}"
+        for blob in blobs
+    }
+
+
+async def load_bytes(collection, blob_ids: Iterable[str]) -> Dict[str, bytes]:
+    """Busca vários blobs numa única consulta e devolve id -> bytes da imagem"""
+    ids = list({blob_id for blob_id in blob_ids if blob_id})
+    if not ids:
+        return {}
+    blobs = await collection.find({"_id": {"$in": ids}}, {"data": 1}).to_list(len(ids))
+    return {blob["_id"]: bytes(blob["data"]) for blob in blobs}
+
+
+async def load_image(collection, blob_id: str) -> Optional[UploadedImage]:
+    blob = await collection.find_one({"_id": blob_id}, {"data": 1, "content_type": 1, "sha256": 1})
+    if blob is None:
+        return None
+    return UploadedImage(bytes(blob["data"]), blob["content_type"], blob["sha256"])
+
+
+async def hydrate_images(collection, items: List[dict], field: str = "imagem_original") -> List[dict]:
+    """Preenche `field` (imagem da roupa ou do look) dos itens que guardam a imagem no blob store"""
+    images = await load_data_uris(collection, (item.get("imagem_blob_id") for item in items))
+    for item in items:
+        blob_id = item.get("imagem_blob_id")
+        if blob_id and not item.get(field):
+            item[field] = images.get(blob_id)
+    return items
@@ -0,0 +1,104 @@
+"""
+Limite de tamanho do corpo das requisições
+
+Middleware ASGI puro: recusa com 413 pelo Content-Length antes de ler
+qualquer byte e, para corpos sem Content-Length (chunked), conta os bytes
+enquanto o app lê o stream e interrompe assim que o limite da rota é
+ultrapassado, antes do parse do JSON/form. Os bytes já recebidos e ainda não
+liberados ficam expostos por rota em request_body_bytes_in_flight.
+"""
+import logging
+from typing import Mapping, Tuple
+
+from fastapi.responses import JSONResponse
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+body_bytes_in_flight = registry.gauge(
+    "request_body_bytes_in_flight", "Bytes de corpo de requisição recebidos e em processamento", ["route"]
+)
+body_rejections_total = registry.counter(
+    "request_body_rejections_total", "Requisições recusadas por tamanho do corpo", ["route", "reason"]
+)
+
+
+def _too_large(limit: int) -> JSONResponse:
+    return JSONResponse(
+        status_code=413,
+        content={"detail": f"Requisição muito grande. O tamanho máximo é {limit / (1024 * 1024):.1f} MB."},
+    )
+
+
+class BodySizeLimitMiddleware:
+    def __init__(self, app, limits: Mapping[Tuple[str, str], int], default_limit: int):
+        self.app = app
+        self.limits = limits
+        self.default_limit = default_limit
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        key = (scope["method"], scope["path"])
+        limit = self.limits.get(key, self.default_limit)
+        # Rotas sem limite próprio ficam agregadas para não explodir a cardinalidade
+        route = scope["path"] if key in self.limits else "other"
+
+        content_length = None
+        for name, value in scope.get("headers", ()):
+            if name == b"content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    content_length = None
+                break
+
+        if content_length is not None and content_length > limit:
+            body_rejections_total.inc(route=route, reason="content_length")
+            logger.warning("Corpo de %d bytes recusado em %s (limite %d)", content_length, scope["path"], limit)
+            return await _too_large(limit)(scope, receive, send)
+
+        received = 0
+        response_started = False
+        rejected = False
+        replied = False
+
+        async def limited_receive():
+            nonlocal received, response_started, rejected, replied
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                size = len(message.get("body", b""))
+                received += size
+                body_bytes_in_flight.inc(size, route=route)
+                if received > limit:
+                    body_rejections_total.inc(route=route, reason="stream")
+                    logger.warning("Corpo recusado durante a leitura em %s (limite %d)", scope["path"], limit)
+                    # Responder 413 já e simular desconexão para o app abandonar o parse;
+                    # exceções aqui seriam embrulhadas pelos BaseHTTPMiddleware em erro 400
+                    rejected = True
+                    if not response_started:
+                        response_started = replied = True
+                        await _too_large(limit)(scope, receive, send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def tracked_send(message):
+            nonlocal response_started
+            if replied:
+                return  # a resposta 413 já foi enviada
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except Exception:
+            if not rejected:
+                raise
+            logger.debug("Erro do app após recusar o corpo em %s ignorado", scope["path"], exc_info=True)
+        finally:
+            body_bytes_in_flight.dec(received, route=route)
@@ -0,0 +1,394 @@
+"""
+Harmonia de cores e compatibilidade de estilos entre peças (NumPy)
+
+As cores das roupas são levadas para o espaço Lab (CIE 1976): pelas cores
+dominantes extraídas da foto no cadastro ou, para peças antigas, pelo nome
+livre do campo `cor` numa paleta de referência. A compatibilidade entre
+todas as peças do usuário vira uma matriz N x N calculada de uma vez, e
+combinações inteiras (milhares) são pontuadas em lote indexando essa matriz,
+sem laços em Python.
+"""
+import io
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from garment_taxonomy import (
+    BOTTOMS,
+    ONE_PIECES,
+    OUTERWEAR_CATEGORY,
+    SHOES,
+    TOPS,
+    lookup as lookup_garment,
+    normalize,
+)
+from versioned_cache import VersionedLRU
+
+logger = logging.getLogger(__name__)
+
+NEUTRAL_CHROMA = 15.0  # abaixo disso a cor é tratada como neutra (preto, branco, cinza, bege)
+UNKNOWN_PAIR_SCORE = 0.6
+COLOR_WEIGHT = 0.75  # o restante vem da compatibilidade de estilo
+MAX_COMBINATIONS = 200_000
+HARMONY_CACHE_SIZE = 256
+# Cada matriz tem N x N float32 (4 MB com 1000 peças): o cache é limitado pelo total de bytes
+HARMONY_CACHE_BYTES = int(os.environ.get('HARMONY_CACHE_MB', '64')) * 1024 * 1024
+MERGE_DELTA_E = 10.0  # cores dominantes mais próximas que isso são a mesma cor
+
+# Paleta de referência (sRGB) para o campo livre `cor`
+PALETTE_RGB: Dict[str, tuple] = {
+    "preto": (20, 20, 20),
+    "branco": (245, 245, 245),
+    "cinza": (128, 128, 128),
+    "grafite": (65, 65, 70),
+    "bege": (220, 200, 170),
+    "creme": (240, 230, 200),
+    "nude": (225, 190, 165),
+    "caqui": (190, 175, 130),
+    "marrom": (110, 70, 40),
+    "caramelo": (175, 110, 50),
+    "vermelho": (200, 30, 40),
+    "vinho": (110, 20, 40),
+    "bordo": (110, 20, 40),
+    "rosa": (235, 130, 170),
+    "pink": (230, 50, 140),
+    "laranja": (240, 130, 30),
+    "coral": (245, 115, 90),
+    "amarelo": (240, 210, 40),
+    "mostarda": (200, 160, 30),
+    "verde": (40, 140, 60),
+    "oliva": (110, 115, 50),
+    "militar": (85, 95, 55),
+    "azul": (40, 80, 180),
+    "marinho": (25, 35, 80),
+    "jeans": (70, 95, 140),
+    "turquesa": (40, 190, 190),
+    "roxo": (110, 50, 150),
+    "lilas": (190, 160, 215),
+    "dourado": (200, 165, 60),
+    "prata": (190, 190, 195),
+}
+_MODIFIERS = {"claro": 15.0, "escuro": -15.0}
+
+# Grupos de estilo e compatibilidade entre grupos (simétrica)
+_STYLE_GROUPS = {
+    "casual": "casual", "basico": "casual", "despojado": "casual", "streetwear": "casual", "jeans": "casual",
+    "esportivo": "esportivo", "esporte": "esportivo", "fitness": "esportivo", "academia": "esportivo",
+    "social": "formal", "formal": "formal", "elegante": "formal", "trabalho": "formal", "classico": "formal",
+    "festa": "festa", "noite": "festa", "balada": "festa",
+    "praia": "praia", "verao": "praia",
+}
+_STYLE_COMPAT = {
+    ("casual", "esportivo"): 0.7,
+    ("casual", "formal"): 0.6,
+    ("casual", "festa"): 0.6,
+    ("casual", "praia"): 0.8,
+    ("esportivo", "formal"): 0.2,
+    ("esportivo", "festa"): 0.3,
+    ("esportivo", "praia"): 0.6,
+    ("formal", "festa"): 0.7,
+    ("formal", "praia"): 0.3,
+    ("festa", "praia"): 0.4,
+}
+UNKNOWN_STYLE_SCORE = 0.7
+
+_SRGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+])
+_D65_WHITE = np.array([0.95047, 1.0, 1.08883])
+
+
+def srgb_to_lab(rgb) -> np.ndarray:
+    """Converte cores sRGB (0-255, shape (..., 3)) para Lab"""
+    c = np.asarray(rgb, dtype=np.float64) / 255.0
+    linear = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ _SRGB_TO_XYZ.T / _D65_WHITE
+    epsilon, kappa = 216 / 24389, 24389 / 27
+    f = np.where(xyz > epsilon, np.cbrt(xyz), (kappa * xyz + 16) / 116)
+    return np.stack([
+        116 * f[..., 1] - 16,
+        500 * (f[..., 0] - f[..., 1]),
+        200 * (f[..., 1] - f[..., 2]),
+    ], axis=-1)
+
+
+_PALETTE_LAB = {name: srgb_to_lab(rgb) for name, rgb in PALETTE_RGB.items()}
+
+
+def color_from_name(cor: Optional[str]) -> Optional[np.ndarray]:
+    """Lab aproximado para o texto livre de `cor` ('Azul claro' -> azul mais claro); None se desconhecido"""
+    words = normalize(cor or "").replace("-", " ").split()
+    for word in words:
+        singular = word[:-1] if word.endswith("s") else word  # plural: 'pretas'
+        candidates = (word, singular, singular[:-1] + "o" if singular.endswith("a") else None)  # 'preta' -> 'preto'
+        lab = next((_PALETTE_LAB[c] for c in candidates if c in _PALETTE_LAB), None)
+        if lab is not None:
+            lab = lab.copy()
+            for modifier in words:
+                lab[0] = np.clip(lab[0] + _MODIFIERS.get(modifier, 0.0), 0, 100)
+            return lab
+    return None
+
+
+def load_foreground(data: bytes, size: int = 64) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Foto reduzida (RGB float, H x W x 3) e máscara da peça (H x W), sem
+    transparência nem o fundo liso típico de foto de produto; None se ilegível
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.draft("RGB", (size, size))
+            img = ImageOps.exif_transpose(img).convert("RGBA")
+            img.thumbnail((size, size))
+            pixels = np.asarray(img)
+    except Exception as e:
+        logger.debug("Imagem ilegível para análise de cor: %s", e)
+        return None
+
+    opaque = pixels[..., 3] > 128
+    rgb = pixels[..., :3].astype(np.float64)
+
+    # Fundo: borda opaca e quase uniforme
+    border = np.concatenate([rgb[0], rgb[-1], rgb[:, 0], rgb[:, -1]])
+    border_opaque = np.concatenate([opaque[0], opaque[-1], opaque[:, 0], opaque[:, -1]])
+    keep = opaque
+    if border_opaque.mean() > 0.9 and border[border_opaque].std(axis=0).max() < 12:
+        background = srgb_to_lab(np.median(border[border_opaque], axis=0))
+        keep = keep & (np.linalg.norm(srgb_to_lab(rgb) - background, axis=-1) > 12)
+    return rgb, keep
+
+
+def dominant_colors(data: bytes, k: int = 3, size: int = 64) -> List[dict]:
+    """Até `k` cores dominantes da peça na foto ({"lab": [L, a, b], "peso": fração})"""
+    foreground = load_foreground(data, size)
+    if foreground is None:
+        return []
+    rgb, keep = foreground
+    selected = rgb[keep].astype(np.uint8)
+    if len(selected) < 20:
+        return []
+
+    quantized = Image.fromarray(selected.reshape(1, -1, 3), "RGB").quantize(colors=k, method=Image.Quantize.MEDIANCUT)
+    palette = quantized.getpalette()
+    total = float(len(selected))
+    colors: List[dict] = []
+    for count, index in sorted(quantized.getcolors(), reverse=True):
+        lab = srgb_to_lab(palette[index * 3:index * 3 + 3])
+        # Tons quase iguais (bordas suavizadas pela redução) somam no mais frequente
+        similar = next((c for c in colors if np.linalg.norm(c["lab"] - lab) < MERGE_DELTA_E), None)
+        if similar is not None:
+            similar["peso"] += count / total
+        else:
+            colors.append({"lab": lab, "peso": count / total})
+    return [
+        {"lab": [round(float(v), 1) for v in c["lab"]], "peso": round(c["peso"], 3)}
+        for c in colors
+    ]
+
+
+def garment_lab(roupa: dict) -> Optional[np.ndarray]:
+    """Cor principal da peça: a dominante da foto ou, sem ela, a do nome"""
+    cores = roupa.get("cores_dominantes")
+    if cores:
+        return np.asarray(cores[0]["lab"], dtype=np.float64)
+    return color_from_name(roupa.get("cor"))
+
+
+def color_pair_matrix(labs: np.ndarray) -> np.ndarray:
+    """
+    Harmonia entre todas as cores (N x N, 0 a 1). Linhas NaN (cor desconhecida)
+    recebem UNKNOWN_PAIR_SCORE.
+    """
+    lightness = labs[:, 0]
+    chroma = np.hypot(labs[:, 1], labs[:, 2])
+    hue = np.degrees(np.arctan2(labs[:, 2], labs[:, 1]))
+    neutral = chroma < NEUTRAL_CHROMA
+
+    hue_diff = np.abs(hue[:, None] - hue[None, :]) % 360
+    hue_diff = np.minimum(hue_diff, 360 - hue_diff)
+
+    def bump(center: float, width: float) -> np.ndarray:
+        return np.exp(-((hue_diff - center) / width) ** 2)
+
+    # Análogas, complementares e tríades combinam; o resto tende a brigar
+    chromatic = 0.3 + 0.7 * np.maximum.reduce([bump(0, 25), 0.85 * bump(180, 25), 0.7 * bump(120, 20)])
+    # Duas cores muito saturadas e não análogas pesam mais
+    loud = (chroma[:, None] > 60) & (chroma[None, :] > 60) & (hue_diff > 40)
+    chromatic = np.where(loud, chromatic * 0.85, chromatic)
+
+    lightness_contrast = np.minimum(np.abs(lightness[:, None] - lightness[None, :]) / 50, 1)
+    both_neutral = neutral[:, None] & neutral[None, :]
+    any_neutral = neutral[:, None] | neutral[None, :]
+
+    scores = np.where(any_neutral, 0.9, chromatic)
+    scores = np.where(both_neutral, 0.75 + 0.25 * lightness_contrast, scores)
+
+    unknown = np.isnan(labs).any(axis=1)
+    scores[unknown, :] = UNKNOWN_PAIR_SCORE
+    scores[:, unknown] = UNKNOWN_PAIR_SCORE
+    return scores
+
+
+def style_pair_matrix(estilos: Sequence[Optional[str]]) -> np.ndarray:
+    groups = [_STYLE_GROUPS.get(normalize(estilo or "")) for estilo in estilos]
+    names = sorted({group for group in groups if group})
+    table = np.full((len(names) + 1, len(names) + 1), UNKNOWN_STYLE_SCORE)  # último índice: desconhecido
+    for i, a in enumerate(names):
+        table[i, i] = 1.0
+        for j, b in enumerate(names):
+            if i != j:
+                table[i, j] = _STYLE_COMPAT.get((a, b), _STYLE_COMPAT.get((b, a), 0.5))
+    codes = np.array([names.index(group) if group else len(names) for group in groups], dtype=np.intp)
+    return table[codes[:, None], codes[None, :]]
+
+
+def score_outfits(pair_scores: np.ndarray, outfits: np.ndarray) -> np.ndarray:
+    """
+    Pontua M combinações de uma vez. `outfits` é (M, K) com índices das peças
+    e -1 nas posições vazias; o resultado mistura a média e o pior par.
+    """
+    outfits = np.asarray(outfits, dtype=np.intp)
+    if outfits.ndim != 2 or outfits.shape[1] < 2:
+        return np.full(len(outfits), np.nan)
+    valid = outfits >= 0
+    safe = np.where(valid, outfits, 0)
+    first, second = np.triu_indices(outfits.shape[1], 1)
+    pairs = pair_scores[safe[:, first], safe[:, second]]
+    mask = valid[:, first] & valid[:, second]
+    count = mask.sum(axis=1)
+    mean = np.where(mask, pairs, 0).sum(axis=1) / np.maximum(count, 1)
+    worst = np.where(mask, pairs, np.inf).min(axis=1)
+    return np.where(count > 0, 0.7 * mean + 0.3 * worst, np.nan)
+
+
+def _product(*groups: np.ndarray) -> np.ndarray:
+    grids = np.meshgrid(*groups, indexing="ij")
+    return np.stack([grid.ravel() for grid in grids], axis=1)
+
+
+def _fit_budget(groups: List[np.ndarray], optional: List[bool], budget: int) -> List[np.ndarray]:
+    """
+    Corta as peças menos relevantes (fim de cada grupo, já ordenado) do maior
+    grupo até o produto caber em `budget`; grupos opcionais ganham o -1 (sem a peça)
+    """
+    sizes = [len(group) for group in groups]
+
+    def total() -> int:
+        return int(np.prod([size + extra for size, extra in zip(sizes, optional)], dtype=np.float64))
+
+    while total() > budget:
+        # Grupo obrigatório nunca fica vazio; opcional pode ficar só com o -1
+        shrinkable = [j for j, size in enumerate(sizes) if size > (0 if optional[j] else 1)]
+        if not shrinkable:
+            break
+        j = max(shrinkable, key=lambda j: sizes[j] + optional[j])
+        sizes[j] -= 1
+    return [
+        np.append(group[:size], -1) if extra else group[:size]
+        for group, size, extra in zip(groups, sizes, optional)
+    ]
+
+
+@dataclass
+class WardrobeHarmony:
+    """Matriz de compatibilidade das peças de um usuário"""
+    ids: List[str]
+    categories: List[Optional[str]]
+    pair_scores: np.ndarray
+
+    @classmethod
+    def from_clothing(cls, roupas: Sequence[dict]) -> "WardrobeHarmony":
+        labs = np.array([
+            lab if (lab := garment_lab(roupa)) is not None else [np.nan] * 3 for roupa in roupas
+        ], dtype=np.float64).reshape(-1, 3)
+        categories = []
+        for roupa in roupas:
+            garment = lookup_garment(roupa.get("tipo"))
+            categories.append(roupa.get("categoria") or (garment.category if garment else None))
+        pair_scores = (
+            COLOR_WEIGHT * color_pair_matrix(labs)
+            + (1 - COLOR_WEIGHT) * style_pair_matrix([roupa.get("estilo") for roupa in roupas])
+        )
+        return cls([roupa["id"] for roupa in roupas], categories, pair_scores.astype(np.float32))
+
+    @property
+    def nbytes(self) -> int:
+        return self.pair_scores.nbytes
+
+    def score(self, combinations: Sequence[Sequence[str]]) -> List[Optional[float]]:
+        """Pontuação de cada combinação de ids (None se tiver menos de 2 peças conhecidas)"""
+        if not combinations:
+            return []
+        position = {item_id: i for i, item_id in enumerate(self.ids)}
+        width = max(2, max(len(combination) for combination in combinations))
+        outfits = np.full((len(combinations), width), -1, dtype=np.intp)
+        for row, combination in enumerate(combinations):
+            indices = [position[item_id] for item_id in combination if item_id in position]
+            outfits[row, :len(indices)] = indices
+        scores = score_outfits(self.pair_scores, outfits)
+        return [None if np.isnan(value) else round(float(value), 3) for value in scores]
+
+    def candidate_outfits(self) -> np.ndarray:
+        """
+        Todas as combinações parte de cima + parte de baixo ou peça única, com
+        terceira peça e calçado opcionais (-1 = sem a peça)
+        """
+        # Relevância da peça: harmonia média com todas as outras. Em guarda-roupas
+        # grandes só as mais relevantes de cada categoria entram no produto, que
+        # nunca passa de MAX_COMBINATIONS linhas.
+        n = len(self.ids)
+        relevance = (self.pair_scores.sum(axis=1) - np.diag(self.pair_scores)) / max(n - 1, 1)
+
+        def indices(*categories: str) -> np.ndarray:
+            members = np.array([i for i, c in enumerate(self.categories) if c in categories], dtype=np.intp)
+            return members[np.argsort(-relevance[members], kind="stable")]
+
+        outer, shoes = indices(OUTERWEAR_CATEGORY), indices(SHOES)
+        tops, bottoms, one_pieces = indices(TOPS), indices(BOTTOMS), indices(ONE_PIECES)
+        bases = []
+        if len(tops) and len(bottoms):
+            bases.append((tops, bottoms))
+        if len(one_pieces):
+            bases.append((one_pieces, None))
+        if not bases:
+            return np.empty((0, 4), dtype=np.intp)
+
+        budget = MAX_COMBINATIONS // len(bases)
+        blocks = []
+        for first, second in bases:
+            if second is None:
+                first, outer_fit, shoes_fit = _fit_budget([first, outer, shoes], [False, True, True], budget)
+                second = np.array([-1], dtype=np.intp)
+            else:
+                first, second, outer_fit, shoes_fit = _fit_budget(
+                    [first, second, outer, shoes], [False, False, True, True], budget
+                )
+            blocks.append(_product(first, second, outer_fit, shoes_fit))
+        return np.concatenate(blocks)
+
+    def best_outfits(self, limit: int = 10) -> List[dict]:
+        outfits = self.candidate_outfits()
+        if not len(outfits):
+            return []
+        scores = score_outfits(self.pair_scores, outfits)
+        ranked = np.argsort(-scores, kind="stable")  # NaN (peça única sozinha) fica no fim
+        top = ranked[~np.isnan(scores[ranked])][:limit]
+        return [
+            {
+                "roupas_ids": [self.ids[i] for i in outfits[row] if i >= 0],
+                "pontuacao": round(float(scores[row]), 3),
+            }
+            for row in top
+        ]
+
+
+# (user_id, roupas_versao) -> matriz do usuário
+harmony_cache: "VersionedLRU[WardrobeHarmony]" = VersionedLRU(
+    HARMONY_CACHE_SIZE, max_weight=HARMONY_CACHE_BYTES, weigh=lambda harmony: harmony.nbytes
+)
@@ -0,0 +1,187 @@
+"""
+Governador de concorrência por provedor externo (backpressure)
+
+Limita quantas chamadas simultâneas fazemos a um provedor (ex.: fal.ai),
+enfileira o excedente com tempo máximo de espera e ajusta o limite de forma
+adaptativa (AIMD): sobe devagar enquanto a latência está saudável e corta
+quando aparecem erros, 429 ou latência alta. Quando a fila está cheia, falha
+rápido com uma estimativa de espera em vez de deixar o usuário esperar por
+um timeout.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+governor_in_flight = registry.gauge(
+    "provider_in_flight", "Chamadas em andamento por provedor", ["provider"]
+)
+governor_limit = registry.gauge(
+    "provider_concurrency_limit", "Limite de concorrência atual por provedor", ["provider"]
+)
+governor_queue_depth = registry.gauge(
+    "provider_queue_depth", "Chamadas aguardando vaga por provedor", ["provider"]
+)
+governor_queue_wait_seconds = registry.histogram(
+    "provider_queue_wait_seconds", "Tempo de espera na fila do governador", ["provider"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0),
+)
+governor_rejections_total = registry.counter(
+    "provider_rejections_total", "Chamadas rejeitadas por saturação", ["provider", "reason"]
+)
+
+
+class ProviderSaturated(Exception):
+    def __init__(self, provider: str, estimated_wait: float, reason: str):
+        super().__init__(f"{provider} saturado ({reason}), espera estimada {estimated_wait:.0f}s")
+        self.provider = provider
+        self.estimated_wait = estimated_wait
+        self.reason = reason
+
+
+class Permit:
+    """Vaga concedida pelo governador; marque `ok = False` para respostas 429/5xx"""
+
+    __slots__ = ("ok", "queued_for")
+
+    def __init__(self, queued_for: float):
+        self.ok = True
+        self.queued_for = queued_for
+
+
+class AdaptiveConcurrencyLimiter:
+    def __init__(
+        self,
+        provider: str,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 8,
+        max_queue: int = 32,
+        queue_timeout: float = 20.0,
+        target_latency: float = 25.0,
+    ):
+        self.provider = provider
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.avg_latency = target_latency / 2  # EWMA das chamadas concluídas
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._publish()
+
+    def _publish(self) -> None:
+        governor_in_flight.set(self.in_flight, provider=self.provider)
+        governor_limit.set(self.limit, provider=self.provider)
+        governor_queue_depth.set(len(self._waiters), provider=self.provider)
+
+    def estimated_wait(self) -> float:
+        """Espera estimada para uma nova chamada, em segundos"""
+        slots = max(1, int(self.limit))
+        return (len(self._waiters) // slots + 1) * self.avg_latency
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    async def acquire(self) -> float:
+        start = time.perf_counter()
+        if self._has_capacity() and not self._waiters:
+            self.in_flight += 1
+            self._publish()
+            return 0.0
+
+        if len(self._waiters) >= self.max_queue:
+            governor_rejections_total.inc(provider=self.provider, reason="queue_full")
+            raise ProviderSaturated(self.provider, self.estimated_wait(), "queue_full")
+
+        if self.estimated_wait() > self.queue_timeout + self.avg_latency:
+            # Nem adianta enfileirar: o tempo de fila estimado já estoura o limite
+            governor_rejections_total.inc(provider=self.provider, reason="estimated_wait")
+            raise ProviderSaturated(self.provider, self.estimated_wait(), "estimated_wait")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._publish()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # A vaga chegou junto com o timeout: devolvê-la
+                self._release_slot()
+            else:
+                waiter.cancel()
+            self._remove_waiter(waiter)
+            governor_rejections_total.inc(provider=self.provider, reason="queue_timeout")
+            raise ProviderSaturated(self.provider, self.estimated_wait(), "queue_timeout")
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            else:
+                waiter.cancel()
+            self._remove_waiter(waiter)
+            raise
+
+        queued_for = time.perf_counter() - start
+        governor_queue_wait_seconds.observe(queued_for, provider=self.provider)
+        return queued_for
+
+    def _remove_waiter(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        self._publish()
+
+    def _release_slot(self) -> None:
+        self.in_flight -= 1
+        self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        while self._waiters and self._has_capacity():
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+        self._publish()
+
+    def _adjust(self, latency: float, ok: bool) -> None:
+        self.avg_latency = 0.8 * self.avg_latency + 0.2 * latency
+        if not ok or latency > self.target_latency * 1.5:
+            # Decréscimo multiplicativo: o provedor está sofrendo
+            new_limit = max(self.min_limit, self.limit * 0.75)
+            if int(new_limit) < int(self.limit):
+                logger.warning("Reduzindo concorrência de %s para %d", self.provider, int(new_limit))
+            self.limit = new_limit
+        elif latency <= self.target_latency:
+            # Acréscimo aditivo: ~+1 por janela de `limit` chamadas saudáveis
+            self.limit = min(self.max_limit, self.limit + 1.0 / max(1.0, self.limit))
+
+    def release(self, latency: float, ok: bool) -> None:
+        self._adjust(latency, ok)
+        self._release_slot()
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Reserva uma vaga para uma chamada ao provedor. Levanta
+        ProviderSaturated se não houver vaga dentro do tempo de fila.
+        """
+        queued_for = await self.acquire()
+        permit = Permit(queued_for)
+        start = time.perf_counter()
+        try:
+            yield permit
+        except BaseException:
+            permit.ok = False
+            raise
+        finally:
+            self.release(time.perf_counter() - start, permit.ok)
@@ -6,6 +6,7 @@ import logging
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
 from dotenv import load_dotenv
+from metrics import track_external
 
 load_dotenv()
 
@@ -142,17 +143,18 @@ class EmailService:
             )
             
             sg = SendGridAPIClient(self.api_key)
-            response = sg.send(message)
+            with track_external("sendgrid", "send"):
+                response = sg.send(message)
             
             if response.status_code == 202:
-                logger.info(f"Email sent successfully to {to_email}")
+                logger.info("Email sent successfully to %s", to_email)
                 return True
             else:
-                logger.error(f"Email send failed with status code: {response.status_code}")
+                logger.error("Email send failed with status code: %s", response.status_code)
                 return False
                 
         except Exception as e:
-            logger.error(f"Error sending email to {to_email}: {str(e)}")
+            logger.error("Error sending email to %s: %s", to_email, e)
             return False
 
 # Instância global do serviço
@@ -0,0 +1,123 @@
+"""
+Embeddings visuais das roupas e índice de similaridade por usuário
+
+Cada foto vira no cadastro um vetor curto (histograma de cor HSV + histograma
+de orientação de bordas, como textura), normalizado e guardado na roupa como
+float16 compactado (`embedding`, 408 bytes). Para as consultas, os vetores do
+usuário ficam numa matriz NumPy em memória, em cache por versão do
+guarda-roupa (`roupas_versao`), e o top-k por cosseno é um único produto
+matriz-vetor, sem chamadas externas.
+"""
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from color_harmony import load_foreground
+from versioned_cache import VersionedLRU
+
+logger = logging.getLogger(__name__)
+
+HUE_BINS, SAT_BINS, VAL_BINS = 12, 4, 4
+EDGE_BINS = 12
+EMBEDDING_DIM = HUE_BINS * SAT_BINS * VAL_BINS + EDGE_BINS
+EDGE_MIN_MAGNITUDE = 8.0  # em níveis de cinza (0-255) por pixel
+TEXTURE_WEIGHT = 0.5  # peso do bloco de textura em relação ao de cor
+DUPLICATE_SIMILARITY = 0.95  # acima disso a nova foto é tratada como possível duplicata
+INDEX_CACHE_SIZE = 256
+
+# (user_id, roupas_versao) -> índice do usuário
+index_cache: "VersionedLRU[SimilarityIndex]" = VersionedLRU(INDEX_CACHE_SIZE)
+
+
+def _hsv(rgb: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    rgb = rgb / 255.0
+    value = rgb.max(axis=-1)
+    chroma = value - rgb.min(axis=-1)
+    saturation = np.divide(chroma, value, out=np.zeros_like(value), where=value > 0)
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    safe = np.where(chroma > 0, chroma, 1.0)
+    hue = np.select(
+        [value == r, value == g],
+        [((g - b) / safe) % 6, (b - r) / safe + 2],
+        (r - g) / safe + 4,
+    ) / 6.0
+    return hue, saturation, value
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def embed_image(data: bytes, size: int = 64) -> Optional[bytes]:
+    """Embedding da peça na foto (float16 compactado); None se a imagem não puder ser analisada"""
+    foreground = load_foreground(data, size)
+    if foreground is None:
+        return None
+    rgb, keep = foreground
+    if keep.sum() < 20:
+        return None
+
+    hue, saturation, value = _hsv(rgb[keep])
+    color, _ = np.histogramdd(
+        np.stack([hue, saturation, value], axis=1),
+        bins=(HUE_BINS, SAT_BINS, VAL_BINS),
+        range=((0, 1), (0, 1), (0, 1)),
+    )
+
+    gray = rgb @ np.array([0.299, 0.587, 0.114])
+    dy, dx = np.gradient(gray)
+    magnitude = np.hypot(dx, dy)[keep]
+    orientation = (np.arctan2(dy, dx)[keep] % np.pi) / np.pi  # sem sentido: 0..1
+    strong = magnitude > EDGE_MIN_MAGNITUDE  # ignora ruído de compressão JPEG
+    edges, _ = np.histogram(orientation[strong], bins=EDGE_BINS, range=(0, 1), weights=magnitude[strong])
+
+    # sqrt (Hellinger): histogramas comparáveis por cosseno sem uma classe dominar
+    vector = np.concatenate([
+        _unit(np.sqrt(color.ravel())),
+        TEXTURE_WEIGHT * _unit(np.sqrt(edges)),
+    ])
+    return _unit(vector).astype(np.float16).tobytes()
+
+
+def unpack(data: bytes) -> Optional[np.ndarray]:
+    if not data or len(data) != EMBEDDING_DIM * 2:
+        return None
+    return np.frombuffer(data, dtype=np.float16).astype(np.float32)
+
+
+class SimilarityIndex:
+    """Embeddings de um usuário numa matriz (N x EMBEDDING_DIM), linhas de norma 1"""
+
+    def __init__(self, docs: Sequence[dict]):
+        ids, rows = [], []
+        for doc in docs:
+            vector = unpack(doc.get("embedding"))
+            if vector is not None:
+                ids.append(doc["id"])
+                rows.append(vector)
+        self.ids: List[str] = ids
+        self.position = {item_id: i for i, item_id in enumerate(ids)}
+        matrix = np.array(rows, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix / np.where(norms > 0, norms, 1.0)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def vector(self, item_id: str) -> Optional[np.ndarray]:
+        row = self.position.get(item_id)
+        return None if row is None else self.matrix[row]
+
+    def top_k(self, query: np.ndarray, k: int, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Até `k` (id, similaridade por cosseno), da mais parecida para a menos"""
+        if not len(self.ids) or k <= 0:
+            return []
+        scores = self.matrix @ _unit(np.asarray(query, dtype=np.float32))
+        if exclude in self.position:
+            scores[self.position[exclude]] = -np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[i], round(float(scores[i]), 4)) for i in top if np.isfinite(scores[i])]
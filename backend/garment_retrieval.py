@@ -0,0 +1,140 @@
+"""
+Pré-seleção das roupas enviadas ao prompt de /sugerir-look
+
+Em guarda-roupas grandes só as SUGGESTION_TOP_K peças mais relevantes para o
+pedido (ocasião, temperatura e detalhes) entram no prompt, então o tamanho do
+prompt e a latência do modelo não crescem com o guarda-roupa. Cada roupa tem
+um embedding de texto (OpenAI) guardado na própria roupa como float16, com o
+hash do texto de origem: só é recalculado quando a descrição muda. Os
+embeddings faltantes e o do pedido saem numa única chamada em lotes, e os
+vetores do usuário ficam numa matriz em memória (cache por versão do
+guarda-roupa) para a similaridade por cosseno.
+"""
+import asyncio
+import hashlib
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from garment_taxonomy import lookup as lookup_garment
+from versioned_cache import VersionedLRU
+
+EMBEDDING_MODEL = os.environ.get('SUGGESTION_EMBEDDING_MODEL', 'text-embedding-3-small')
+EMBEDDING_DIMENSIONS = 256  # text-embedding-3 aceita vetores reduzidos
+EMBEDDING_BATCH_SIZE = 512  # textos por chamada à API
+TOP_K = int(os.environ.get('SUGGESTION_TOP_K', '40'))
+PER_CATEGORY = 4  # mínimo por categoria, para sempre sobrar uma combinação completa
+INDEX_CACHE_SIZE = 256
+QUERY_CACHE_SIZE = 1024
+
+EmbedFn = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+# (user_id, roupas_versao) -> índice do usuário; hash do texto do pedido -> embedding
+index_cache: "VersionedLRU[TextIndex]" = VersionedLRU(INDEX_CACHE_SIZE)
+query_cache: "VersionedLRU[np.ndarray]" = VersionedLRU(QUERY_CACHE_SIZE)
+
+
+def garment_text(roupa) -> str:
+    """Descrição da roupa (ClothingSummary) que é embedada"""
+    garment = lookup_garment(roupa.tipo)
+    tipo = f"{garment.key} ({garment.category_label})" if garment else roupa.tipo
+    return f"{roupa.nome}: {tipo}, cor {roupa.cor}, estilo {roupa.estilo}"
+
+
+def query_text(ocasiao: str, temperatura: Optional[str], detalhes: Optional[str]) -> str:
+    parts = [f"Roupa para {ocasiao}"]
+    if temperatura:
+        parts.append(f"temperatura {temperatura}")
+    if detalhes:
+        parts.append(detalhes)
+    return ", ".join(parts)
+
+
+def text_hash(text: str) -> str:
+    # Inclui modelo e dimensão: trocar qualquer um invalida os vetores guardados
+    return hashlib.sha256(f"{EMBEDDING_MODEL}:{EMBEDDING_DIMENSIONS}:{text}".encode()).hexdigest()[:16]
+
+
+def pack(vector: np.ndarray) -> bytes:
+    return np.asarray(vector, dtype=np.float16).tobytes()
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+async def embed_batched(embed: EmbedFn, texts: Sequence[str]) -> np.ndarray:
+    """Vetores (normalizados) dos textos, com as chamadas em lotes concorrentes"""
+    if not texts:
+        return np.empty((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+    batches = [list(texts[i:i + EMBEDDING_BATCH_SIZE]) for i in range(0, len(texts), EMBEDDING_BATCH_SIZE)]
+    results = await asyncio.gather(*(embed(batch) for batch in batches))
+    vectors = np.array([vector for result in results for vector in result], dtype=np.float32)
+    return _unit_rows(vectors.reshape(len(texts), EMBEDDING_DIMENSIONS))
+
+
+class TextIndex:
+    """Embeddings de texto das roupas de um usuário (N x EMBEDDING_DIMENSIONS)"""
+
+    def __init__(self, ids: List[str], categories: List[Optional[str]], matrix: np.ndarray):
+        self.ids = ids
+        self.categories = np.array([c or "" for c in categories])
+        self.matrix = matrix
+
+    def select(self, query: np.ndarray, k: int = TOP_K, per_category: int = PER_CATEGORY) -> List[str]:
+        """
+        Ids das `k` roupas mais próximas do pedido, garantindo até `per_category`
+        de cada categoria, da mais próxima para a menos
+        """
+        scores = self.matrix @ query
+        order = np.argsort(-scores, kind="stable")
+        # Posição de cada peça dentro da sua categoria, seguindo a ordem global
+        rank_in_category = np.empty(len(order), dtype=np.intp)
+        for category in np.unique(self.categories):
+            members = order[self.categories[order] == category]
+            rank_in_category[members] = np.arange(len(members))
+        guaranteed = order[rank_in_category[order] < per_category]
+        rest = order[rank_in_category[order] >= per_category]
+        chosen = np.concatenate([guaranteed, rest])[:k]
+        chosen = chosen[np.argsort(-scores[chosen], kind="stable")]
+        return [self.ids[i] for i in chosen]
+
+
+async def build_index(
+    roupas: Sequence,
+    stored: Dict[str, dict],
+    embed: EmbedFn,
+    extra_texts: Sequence[str] = (),
+) -> Tuple[TextIndex, Dict[str, Tuple[str, bytes]], np.ndarray]:
+    """
+    Índice das roupas reaproveitando os embeddings guardados ({id: {"hash", "vetor"}}).
+    Retorna o índice, os vetores novos a gravar ({id: (hash, bytes)}) e os
+    vetores de `extra_texts`, embedados na mesma chamada.
+    """
+    texts = {roupa.id: garment_text(roupa) for roupa in roupas}
+    hashes = {item_id: text_hash(text) for item_id, text in texts.items()}
+    stale = [
+        item_id for item_id in texts
+        if (stored.get(item_id) or {}).get("hash") != hashes[item_id]
+    ]
+
+    vectors = await embed_batched(embed, list(extra_texts) + [texts[item_id] for item_id in stale])
+    extra, fresh = vectors[:len(extra_texts)], dict(zip(stale, vectors[len(extra_texts):]))
+
+    rows = []
+    for roupa in roupas:
+        if roupa.id in fresh:
+            rows.append(fresh[roupa.id])
+        else:
+            rows.append(np.frombuffer(stored[roupa.id]["vetor"], dtype=np.float16))
+    matrix = _unit_rows(np.array(rows, dtype=np.float32).reshape(-1, EMBEDDING_DIMENSIONS))
+
+    categories = []
+    for roupa in roupas:
+        garment = lookup_garment(roupa.tipo)
+        categories.append(roupa.categoria or (garment.category if garment else None))
+    index = TextIndex([roupa.id for roupa in roupas], categories, matrix)
+    updates = {item_id: (hashes[item_id], pack(vector)) for item_id, vector in fresh.items()}
+    return index, updates, extra
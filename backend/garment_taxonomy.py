@@ -0,0 +1,126 @@
+"""
+Taxonomia das peças de roupa
+
+Fonte única para interpretar o campo `tipo` das roupas: categoria, camada do
+try-on, categoria da Fal.ai e descrição em inglês. A tabela é montada uma vez
+na importação, com as chaves normalizadas (sem acento, caixa baixa), e é
+somente leitura.
+"""
+import unicodedata
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+# Camadas do try-on, na ordem em que são aplicadas sobre a foto
+ONE_PIECE, BOTTOM, TOP, OUTERWEAR = 0, 1, 2, 3
+
+# Categorias
+TOPS = "tops"
+BOTTOMS = "bottoms"
+ONE_PIECES = "one-pieces"
+OUTERWEAR_CATEGORY = "outerwear"
+SHOES = "shoes"
+ACCESSORIES = "accessories"
+
+CATEGORY_LABELS: Mapping[str, str] = MappingProxyType({
+    TOPS: "parte de cima",
+    BOTTOMS: "parte de baixo",
+    ONE_PIECES: "peça única",
+    OUTERWEAR_CATEGORY: "sobreposição",
+    SHOES: "calçado",
+    ACCESSORIES: "acessório",
+})
+
+# Categoria -> (categoria da Fal.ai, camada); None = não renderizável no try-on
+_RENDERING = {
+    TOPS: ("tops", TOP),
+    BOTTOMS: ("bottoms", BOTTOM),
+    ONE_PIECES: ("one-pieces", ONE_PIECE),
+    OUTERWEAR_CATEGORY: ("tops", OUTERWEAR),
+    SHOES: (None, None),
+    ACCESSORIES: (None, None),
+}
+
+
+@dataclass(frozen=True)
+class GarmentType:
+    key: str  # tipo canônico, como o app envia
+    category: str
+    description_en: str
+    fal_category: Optional[str]
+    layer: Optional[int]
+
+    @property
+    def renderable(self) -> bool:
+        return self.fal_category is not None
+
+    @property
+    def category_label(self) -> str:
+        return CATEGORY_LABELS[self.category]
+
+
+def normalize(tipo: str) -> str:
+    """'Calça ' -> 'calca', 'Óculos' -> 'oculos'"""
+    decomposed = unicodedata.normalize("NFKD", tipo.strip().casefold())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+# (tipo, categoria, descrição em inglês, sinônimos)
+_TYPES = (
+    ("camiseta", TOPS, "t-shirt", ("tshirt", "t-shirt", "regata")),
+    ("camisa", TOPS, "shirt", ()),
+    ("blusa", TOPS, "blouse", ()),
+    ("blusinha", TOPS, "blouse", ()),
+    ("cropped", TOPS, "crop top", ()),
+    ("calca", BOTTOMS, "pants", ("calcas",)),
+    ("jeans", BOTTOMS, "jeans", ()),
+    ("shorts", BOTTOMS, "shorts", ("short", "bermuda")),
+    ("saia", BOTTOMS, "skirt", ()),
+    ("vestido", ONE_PIECES, "dress", ()),
+    ("macacao", ONE_PIECES, "jumpsuit", ()),
+    ("jaqueta", OUTERWEAR_CATEGORY, "jacket", ()),
+    ("casaco", OUTERWEAR_CATEGORY, "coat", ()),
+    ("moletom", OUTERWEAR_CATEGORY, "hoodie", ()),
+    ("sapato", SHOES, "shoes", ()),
+    ("tenis", SHOES, "sneakers", ()),
+    ("sandalia", SHOES, "sandals", ()),
+    ("bota", SHOES, "boots", ()),
+    ("acessorio", ACCESSORIES, "accessory", ()),
+    ("bone", ACCESSORIES, "cap", ()),
+    ("chapeu", ACCESSORIES, "hat", ()),
+    ("oculos", ACCESSORIES, "sunglasses", ()),
+    ("relogio", ACCESSORIES, "watch", ()),
+    ("bolsa", ACCESSORIES, "bag", ()),
+    ("colar", ACCESSORIES, "necklace", ()),
+    ("pulseira", ACCESSORIES, "bracelet", ()),
+)
+
+
+def _build() -> Mapping[str, GarmentType]:
+    table = {}
+    for key, category, description_en, aliases in _TYPES:
+        fal_category, layer = _RENDERING[category]
+        garment = GarmentType(key, category, description_en, fal_category, layer)
+        for name in (key, *aliases):
+            table[normalize(name)] = garment
+    return MappingProxyType(table)
+
+
+GARMENT_TYPES: Mapping[str, GarmentType] = _build()
+
+
+def lookup(tipo: Optional[str]) -> Optional[GarmentType]:
+    """Tipo da peça pelo nome livre enviado pelo app; None se desconhecido"""
+    if not tipo:
+        return None
+    return GARMENT_TYPES.get(normalize(tipo))
+
+
+
+def garment_fields(tipo: Optional[str]) -> dict:
+    """Campos derivados do tipo gravados com a roupa (None quando o tipo é desconhecido)"""
+    garment = lookup(tipo)
+    return {
+        "tipo_canonico": garment.key if garment else None,
+        "categoria": garment.category if garment else None,
+    }
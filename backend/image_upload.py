@@ -0,0 +1,98 @@
+"""
+Leitura de imagens enviadas pelo app
+
+Aceita os dois formatos durante a migração: upload multipart (UploadFile,
+que o Starlette já mantém em SpooledTemporaryFile, indo para disco acima de
+1 MB) e o formato antigo de data URI base64. O arquivo é lido em blocos,
+com o hash SHA-256 calculado durante a leitura e o tamanho limitado sem
+carregar o corpo inteiro antes da verificação.
+"""
+import base64
+import binascii
+import hashlib
+import os
+from dataclasses import dataclass
+
+from fastapi import HTTPException, UploadFile
+
+MAX_IMAGE_BYTES = int(os.environ.get('IMAGE_UPLOAD_MAX_BYTES', str(10 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+
+# Assinaturas dos formatos aceitos
+_MAGIC = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+@dataclass(frozen=True)
+class UploadedImage:
+    data: bytes
+    content_type: str
+    sha256: str
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    def to_data_uri(self) -> str:
+        """Formato armazenado hoje no MongoDB e esperado pelo app"""
+        return f"data:{self.content_type};base64,{base64.b64encode(self.data).decode('ascii')}"
+
+
+def sniff_content_type(head: bytes) -> str:
+    for magic, content_type in _MAGIC:
+        if head.startswith(magic):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:12] in (b"ftypheic", b"ftypheix", b"ftypmif1", b"ftypmsf1"):
+        return "image/heic"
+    raise HTTPException(status_code=400, detail="Formato de imagem não suportado. Envie PNG, JPEG, WEBP ou HEIC.")
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Imagem muito grande. O tamanho máximo é {max_bytes / (1024 * 1024):.1f} MB."
+    )
+
+
+async def read_upload(upload: UploadFile, max_bytes: int = MAX_IMAGE_BYTES) -> UploadedImage:
+    """Lê um UploadFile em blocos, calculando o hash e limitando o tamanho"""
+    digest = hashlib.sha256()
+    chunks = []
+    total = 0
+    while True:
+        chunk = await upload.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise _too_large(max_bytes)
+        digest.update(chunk)
+        chunks.append(chunk)
+
+    if not total:
+        raise HTTPException(status_code=400, detail="Arquivo de imagem vazio.")
+    data = b"".join(chunks)
+    return UploadedImage(data, sniff_content_type(data[:16]), digest.hexdigest())
+
+
+def decode_data_uri(value: str, max_bytes: int = MAX_IMAGE_BYTES) -> UploadedImage:
+    """Formato antigo: data:image/...;base64,<dados>"""
+    header, sep, payload = value.partition(",")
+    if not sep or not header.startswith("data:image/") or not header.endswith(";base64"):
+        raise HTTPException(status_code=400, detail="Imagem inválida. Envie um arquivo ou um data URI base64.")
+    # Base64 ocupa 4/3 do tamanho original: recusar antes de decodificar
+    if len(payload) * 3 // 4 > max_bytes + 2:
+        raise _too_large(max_bytes)
+    try:
+        data = base64.b64decode(payload, validate=True)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Imagem base64 inválida.")
+    if not data:
+        raise HTTPException(status_code=400, detail="Arquivo de imagem vazio.")
+    return UploadedImage(data, sniff_content_type(data[:16]), hashlib.sha256(data).hexdigest())
@@ -0,0 +1,47 @@
+"""
+Locks de tarefas de manutenção entre processos
+
+Com vários workers (uvicorn/gunicorn), cada um executa o startup. Tarefas
+que percorrem a base inteira (backfills) pegam antes um lock com prazo na
+coleção job_locks: só o processo dono executa, e se ele morrer o lock expira
+sozinho e outro worker pode assumir no próximo startup. O dono renova o prazo
+a cada lote enquanto trabalha.
+"""
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+LOCK_TTL = timedelta(minutes=10)
+
+# Identifica este processo como dono dos locks que ele pega
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+async def ensure_indexes(collection) -> None:
+    await collection.create_index("expires_at", expireAfterSeconds=0)
+
+
+async def acquire(collection, name: str, ttl: timedelta = LOCK_TTL) -> bool:
+    """
+    Pega (ou renova, se já for do processo) o lock `name`.
+
+    Retorna False se outro processo tem o lock ainda dentro do prazo.
+    """
+    now = datetime.utcnow()
+    try:
+        await collection.find_one_and_update(
+            {"_id": name, "$or": [{"owner": OWNER}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": OWNER, "expires_at": now + ttl}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # O documento existe e pertence a outro processo
+        return False
+    return True
+
+
+async def release(collection, name: str) -> None:
+    await collection.delete_one({"_id": name, "owner": OWNER})
@@ -0,0 +1,207 @@
+"""
+Configuração de logging da API: redação de campos sensíveis, truncamento de
+base64/data URIs, amostragem de logs INFO de alto volume e escrita assíncrona
+via fila (a mensagem é montada na thread que loga; o I/O e a formatação final
+acontecem numa thread separada)
+
+Variáveis de ambiente:
+    LOG_LEVEL          padrão: INFO
+    LOG_FORMAT         text (padrão) | json
+    LOG_SAMPLE_RATE    fração dos logs marcados como amostráveis que são emitidos (padrão: 0.1)
+    LOG_MAX_FIELD_LEN  tamanho máximo de cada valor logado (padrão: 512)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+from datetime import datetime, timezone
+from typing import Any
+
+REDACTED = "***"
+
+# Campos cujo valor nunca deve aparecer nos logs
+SENSITIVE_FIELDS = frozenset({
+    "password", "password_hash", "new_password", "token", "reset_code", "code",
+    "purchasetoken", "purchase_token", "google_play_purchase_token",
+    "transactionreceipt", "client_secret", "authorization", "api_key",
+})
+
+# Campos que carregam imagens; são resumidos em vez de logados
+IMAGE_FIELDS = frozenset({"imagem", "imagem_original", "imagem_look", "foto_corpo", "tryon_image", "model_image", "garment_image"})
+
+_DATA_URI_RE = re.compile(r"data:([\w/+.-]+);base64,[A-Za-z0-9+/=]{16,}")
+_LONG_BASE64_RE = re.compile(r"[A-Za-z0-9+/=]{256,}")
+
+
+def _size_label(length: int) -> str:
+    if length >= 1024 * 1024:
+        return f"{length / (1024 * 1024):.1f}MB"
+    if length >= 1024:
+        return f"{length / 1024:.1f}KB"
+    return f"{length}B"
+
+
+def _summarize_image(value: Any) -> str:
+    if not isinstance(value, str):
+        return f"<{type(value).__name__}>"
+    match = _DATA_URI_RE.match(value)
+    kind = match.group(1) if match else "base64"
+    return f"<{kind} {_size_label(len(value))}>"
+
+
+def redact_text(text: str, max_len: int) -> str:
+    """Substitui data URIs e blocos base64 longos e trunca o texto"""
+    if len(text) > 64:
+        text = _DATA_URI_RE.sub(lambda m: f"<{m.group(1)} {_size_label(len(m.group(0)))}>", text)
+        text = _LONG_BASE64_RE.sub(lambda m: f"<base64 {_size_label(len(m.group(0)))}>", text)
+    if len(text) > max_len:
+        text = f"{text[:max_len]}…(+{len(text) - max_len} chars)"
+    return text
+
+
+def redact(value: Any, max_len: int = 512, _depth: int = 0) -> Any:
+    """
+    Retorna uma cópia de `value` segura para log: campos sensíveis mascarados,
+    imagens resumidas e strings longas truncadas
+    """
+    if _depth > 6:
+        return "…"
+    if isinstance(value, str):
+        return redact_text(value, max_len)
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            lowered = str(key).lower()
+            if lowered in SENSITIVE_FIELDS:
+                result[key] = REDACTED
+            elif lowered in IMAGE_FIELDS:
+                result[key] = _summarize_image(item) if item else item
+            else:
+                result[key] = redact(item, max_len, _depth + 1)
+        return result
+    if isinstance(value, (list, tuple)):
+        items = [redact(item, max_len, _depth + 1) for item in value[:50]]
+        if len(value) > 50:
+            items.append(f"…(+{len(value) - 50} itens)")
+        return items
+    if hasattr(value, "dict") and callable(value.dict):
+        # Modelos pydantic
+        return redact(value.dict(), max_len, _depth + 1)
+    return value
+
+
+class RedactingFilter(logging.Filter):
+    """
+    Aplica `redact` aos argumentos e à mensagem do record. Roda no handler da
+    fila, antes de a mensagem ser montada, e só para os records que passaram
+    pela amostragem.
+    """
+
+    def __init__(self, max_len: int = 512):
+        super().__init__()
+        self.max_len = max_len
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.args:
+            if isinstance(record.args, dict):
+                record.args = redact(record.args, self.max_len)
+            else:
+                record.args = tuple(redact(arg, self.max_len) for arg in record.args)
+        if isinstance(record.msg, str):
+            record.msg = redact_text(record.msg, self.max_len * 4)
+        else:
+            record.msg = redact(record.msg, self.max_len)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Descarta uma fração dos logs INFO/DEBUG marcados com extra={"sample": True}.
+    WARNING e acima são sempre emitidos.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not getattr(record, "sample", False):
+            return True
+        return random.random() < self.rate
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que só monta a mensagem (getMessage) antes de enfileirar: os
+    argumentos podem ser dicts ou modelos que a requisição continua alterando.
+    O QueueHandler padrão também chama format() (data, nível, JSON) na thread
+    que loga; aqui isso fica para o listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass  # Descartar em vez de bloquear a requisição
+
+
+class JsonFormatter(logging.Formatter):
+    _RESERVED = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "sample"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in self._RESERVED and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+_listener = None
+
+
+def configure_logging() -> None:
+    """
+    Instala o handler assíncrono no logger raiz. Idempotente.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = os.environ.get("LOG_LEVEL", "INFO").upper()
+    max_len = int(os.environ.get("LOG_MAX_FIELD_LEN", "512"))
+    sample_rate = float(os.environ.get("LOG_SAMPLE_RATE", "0.1"))
+
+    stream_handler = logging.StreamHandler()
+    if os.environ.get("LOG_FORMAT", "text").lower() == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=10000)
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+    queue_handler.addFilter(RedactingFilter(max_len))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
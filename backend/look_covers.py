@@ -0,0 +1,153 @@
+"""
+Capas dos looks (miniaturas JPEG para a listagem)
+
+A capa é a imagem do try-on reduzida ou, quando o look não tem imagem, uma
+grade com até 4 peças. A renderização com Pillow roda num ProcessPoolExecutor
+(fora do event loop e do GIL) e é disparada em segundo plano quando o look é
+criado ou quando uma das suas peças é removida. As capas ficam na coleção
+`look_covers`, e o look guarda só o hash (`capa_hash`) para a URL versionada.
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from bson import Binary
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+COVER_SIZE = (240, 320)  # retrato 3:4, como as imagens do try-on
+COVER_QUALITY = 80
+COVER_WORKERS = int(os.environ.get('LOOK_COVER_WORKERS', '1'))
+GRID_MAX_ITEMS = 4
+
+_executor: Optional[ProcessPoolExecutor] = None
+_pending: Set[asyncio.Task] = set()
+_pending_looks: Set[str] = set()
+
+
+def _open(data: bytes, size: Tuple[int, int]) -> Image.Image:
+    img = Image.open(io.BytesIO(data))
+    img.draft("RGB", size)  # JPEG: decodifica já reduzido
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ("RGBA", "LA", "P"):
+        # Roupas com fundo removido: transparência vira fundo branco, não preto
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, "white")
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def _grid(garment_images: List[bytes]) -> Optional[Image.Image]:
+    thumbs = []
+    for data in garment_images[:GRID_MAX_ITEMS]:
+        try:
+            thumbs.append(_open(data, COVER_SIZE))
+        except Exception as e:
+            logger.debug("Peça ignorada na capa: %s", e)
+    if not thumbs:
+        return None
+
+    width, height = COVER_SIZE
+    cols = 1 if len(thumbs) == 1 else 2
+    rows = 1 if len(thumbs) <= 2 else 2
+    cell_width, cell_height = width // cols, height // rows
+    cover = Image.new("RGB", COVER_SIZE, "white")
+    for i, thumb in enumerate(thumbs):
+        thumb = ImageOps.contain(thumb, (cell_width - 4, cell_height - 4), Image.LANCZOS)
+        x = (i % cols) * cell_width + (cell_width - thumb.width) // 2
+        y = (i // cols) * cell_height + (cell_height - thumb.height) // 2
+        cover.paste(thumb, (x, y))
+    return cover
+
+
+def render_cover(look_image: Optional[bytes], garment_images: List[bytes]) -> Optional[bytes]:
+    """JPEG da capa; None se nenhuma imagem puder ser aberta. Roda no processo do pool."""
+    cover = None
+    if look_image:
+        try:
+            cover = ImageOps.fit(_open(look_image, COVER_SIZE), COVER_SIZE, Image.LANCZOS)
+        except Exception as e:
+            logger.warning("Imagem do look ilegível, usando a grade de peças: %s", e)
+    if cover is None:
+        cover = _grid(garment_images)
+    if cover is None:
+        return None
+    out = io.BytesIO()
+    cover.save(out, "JPEG", quality=COVER_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: o filho não herda o event loop nem as conexões do servidor
+        _executor = ProcessPoolExecutor(max_workers=COVER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+async def render_in_pool(look_image: Optional[bytes], garment_images: List[bytes]) -> Optional[bytes]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), render_cover, look_image, garment_images)
+
+
+async def save_cover(collection, user_id: str, look_id: str, data: bytes) -> str:
+    sha256 = hashlib.sha256(data).hexdigest()
+    await collection.update_one(
+        {"_id": look_id},
+        {"$set": {
+            "user_id": user_id,
+            "data": Binary(data),
+            "sha256": sha256,
+            "updated_at": datetime.utcnow(),
+        }},
+        upsert=True
+    )
+    return sha256
+
+
+async def load_cover(collection, user_id: str, look_id: str) -> Optional[dict]:
+    return await collection.find_one({"_id": look_id, "user_id": user_id}, {"data": 1, "sha256": 1})
+
+
+async def delete_cover(collection, look_id: str) -> None:
+    await collection.delete_one({"_id": look_id})
+
+
+def schedule(job: Callable[[], Awaitable[None]], look_id: str, if_idle: bool = False) -> None:
+    """
+    Executa `job` em segundo plano; falhas só são registradas no log. Com
+    `if_idle`, não agenda se a capa do look já estiver sendo gerada.
+    """
+    if if_idle and look_id in _pending_looks:
+        return
+
+    async def run():
+        try:
+            await job()
+        except Exception:
+            logger.exception("Falha ao gerar a capa do look %s", look_id)
+        finally:
+            _pending_looks.discard(look_id)
+
+    _pending_looks.add(look_id)
+    task = asyncio.create_task(run())
+    _pending.add(task)  # mantém a referência até a task terminar
+    task.add_done_callback(_pending.discard)
+
+
+def shutdown() -> None:
+    global _executor
+    for task in _pending:
+        task.cancel()
+    _pending_looks.clear()
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
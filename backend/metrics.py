@@ -0,0 +1,321 @@
+"""
+Métricas da API no formato de exposição do Prometheus (text format 0.0.4)
+
+Implementação mínima e sem dependências externas: contadores, gauges e
+histogramas com labels, um middleware HTTP por rota, um listener de comandos
+do MongoDB e um monitor de atraso do event loop.
+"""
+import asyncio
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+from tracing import SPAN_KIND_CLIENT, span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Chamadas externas (fal.ai, OpenAI) levam dezenas de segundos
+EXTERNAL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: labels esperados {self.labelnames}, recebidos {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # key -> [contagem por bucket (não cumulativa), soma, total]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        lines = []
+        for key, (bucket_counts, total_sum, count) in items:
+            cumulative = 0
+            for upper, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(upper)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Métrica duplicada: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+# HTTP
+http_requests_total = registry.counter(
+    "http_requests_total", "Total de requisições HTTP", ["method", "route", "status"]
+)
+http_request_duration_seconds = registry.histogram(
+    "http_request_duration_seconds", "Latência das requisições HTTP por rota", ["method", "route"]
+)
+http_requests_in_progress = registry.gauge(
+    "http_requests_in_progress", "Requisições HTTP em andamento", ["method"]
+)
+
+# Chamadas externas (fal.ai, OpenAI, Stripe, Google Play, SendGrid)
+external_call_duration_seconds = registry.histogram(
+    "external_call_duration_seconds",
+    "Latência das chamadas a provedores externos",
+    ["provider", "operation", "outcome"],
+    buckets=EXTERNAL_BUCKETS,
+)
+
+# MongoDB
+mongo_command_duration_seconds = registry.histogram(
+    "mongo_command_duration_seconds",
+    "Latência dos comandos MongoDB",
+    ["command", "collection", "outcome"],
+    buckets=MONGO_BUCKETS,
+)
+
+# Event loop
+event_loop_lag_seconds = registry.histogram(
+    "event_loop_lag_seconds", "Atraso observado no agendamento do event loop"
+)
+event_loop_blocked_seconds_total = registry.counter(
+    "event_loop_blocked_seconds_total", "Tempo acumulado com o event loop bloqueado acima do limite"
+)
+
+
+@contextmanager
+def track_external(provider: str, operation: str):
+    """
+    Mede a duração de uma chamada externa e abre um span CLIENT para ela;
+    o outcome é "error" se o bloco levantar exceção
+    """
+    start = time.perf_counter()
+    outcome = "success"
+    with span(f"{provider} {operation}", kind=SPAN_KIND_CLIENT, **{"peer.service": provider}) as current:
+        try:
+            yield current
+        except BaseException:
+            outcome = "error"
+            raise
+        finally:
+            external_call_duration_seconds.observe(
+                time.perf_counter() - start, provider=provider, operation=operation, outcome=outcome
+            )
+
+
+def _route_label(request) -> str:
+    # Usar o template da rota (ex.: /api/looks/{look_id}) para não explodir a cardinalidade
+    route = request.scope.get("route")
+    path = getattr(route, "path", None)
+    return path or "unmatched"
+
+
+async def metrics_middleware(request, call_next):
+    """
+    Middleware HTTP que registra contagem, latência e requisições em andamento
+    """
+    method = request.method
+    start = time.perf_counter()
+    http_requests_in_progress.inc(method=method)
+    status = "500"
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        http_requests_in_progress.dec(method=method)
+        route = _route_label(request)
+        http_request_duration_seconds.observe(time.perf_counter() - start, method=method, route=route)
+        http_requests_total.inc(method=method, route=route, status=status)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """
+    Listener do PyMongo que mede cada comando enviado ao servidor
+    """
+
+    def __init__(self):
+        self._collections: Dict[Tuple[int, str], str] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = "-"
+        self._collections[(event.request_id, str(event.connection_id))] = collection
+
+    def _finish(self, event, outcome: str):
+        collection = self._collections.pop((event.request_id, str(event.connection_id)), "-")
+        mongo_command_duration_seconds.observe(
+            event.duration_micros / 1_000_000,
+            command=event.command_name,
+            collection=collection,
+            outcome=outcome,
+        )
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+async def monitor_event_loop_lag(interval: float = 0.5, block_threshold: float = 0.1):
+    """
+    Mede o atraso do event loop dormindo `interval` segundos e comparando com o
+    tempo real decorrido. Atrasos acima de `block_threshold` indicam chamadas
+    síncronas dentro de handlers async.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        event_loop_lag_seconds.observe(lag)
+        if lag > block_threshold:
+            event_loop_blocked_seconds_total.inc(lag)
+            logger.warning("Event loop bloqueado por %.3fs", lag)
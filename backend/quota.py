@@ -0,0 +1,138 @@
+"""
+Cotas por plano com reserva atômica
+
+O fluxo é reserve → (chamadas externas) → commit ou refund. A reserva é um
+find_one_and_update condicional: o contador só é incrementado se ainda
+estiver abaixo do limite do plano, então requisições concorrentes do mesmo
+usuário não conseguem ultrapassar o limite nem disparar chamadas pagas que as
+regras de negócio proíbem.
+"""
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Mapping, Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class QuotaPolicy:
+    """
+    Limite de uso por plano, armazenado num contador do documento do usuário.
+
+    `limits` mapeia plano -> limite (None = ilimitado); a chave "default" vale
+    para planos não listados. Com `window`, o contador é zerado quando a janela
+    iniciada em `<counter_field>_inicio` expira (limite por período).
+    """
+    name: str
+    counter_field: str
+    limits: Mapping[str, Optional[int]] = field(default_factory=dict)
+    window: Optional[timedelta] = None
+
+    def limit_for(self, plan: str) -> Optional[int]:
+        if plan in self.limits:
+            return self.limits[plan]
+        return self.limits.get("default")
+
+    @property
+    def window_field(self) -> str:
+        return f"{self.counter_field}_inicio"
+
+
+# Looks gerados com try-on: 5 no plano gratuito, ilimitado nos pagos
+LOOKS_QUOTA = QuotaPolicy(
+    name="looks",
+    counter_field="looks_usados",
+    limits={"free": 5, "default": None},
+)
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, policy: QuotaPolicy, limit: int):
+        super().__init__(f"Quota '{policy.name}' excedida (limite {limit})")
+        self.policy = policy
+        self.limit = limit
+
+
+class Reservation:
+    """
+    Unidade de cota já descontada do contador. `refund` devolve a unidade se
+    a operação falhar; `commit` apenas a confirma. Como `async with`, faz
+    commit na saída normal e refund em qualquer exceção (inclusive cancelamento).
+    """
+
+    def __init__(self, users, user_id: str, policy: QuotaPolicy, used: int):
+        self._users = users
+        self.user_id = user_id
+        self.policy = policy
+        self.used = used
+        self._settled = False
+
+    async def commit(self) -> None:
+        self._settled = True
+
+    async def refund(self) -> None:
+        if self._settled:
+            return
+        self._settled = True
+        await self._users.update_one(
+            {"id": self.user_id, self.policy.counter_field: {"$gt": 0}},
+            {"$inc": {self.policy.counter_field: -1}}
+        )
+        logger.info("Quota '%s' devolvida para o usuário %s", self.policy.name, self.user_id)
+
+    async def __aenter__(self) -> "Reservation":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        if exc_type is None:
+            await self.commit()
+        else:
+            await self.refund()
+        return False
+
+
+async def reserve(users, user_id: str, plan: str, policy: QuotaPolicy) -> Reservation:
+    """
+    Reserva atomicamente uma unidade da cota do usuário.
+
+    Levanta QuotaExceeded se o limite do plano já foi atingido.
+    """
+    counter = policy.counter_field
+    limit = policy.limit_for(plan)
+
+    if policy.window is not None:
+        # Zerar o contador se a janela atual já expirou
+        now = datetime.utcnow()
+        await users.update_one(
+            {"id": user_id, "$or": [
+                {policy.window_field: {"$lt": now - policy.window}},
+                {policy.window_field: {"$exists": False}},
+            ]},
+            {"$set": {counter: 0, policy.window_field: now}}
+        )
+
+    query = {"id": user_id}
+    if limit is not None:
+        query["$or"] = [{counter: {"$lt": limit}}, {counter: {"$exists": False}}]
+
+    user = await users.find_one_and_update(
+        query,
+        {"$inc": {counter: 1}},
+        projection={counter: 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if user is None:
+        raise QuotaExceeded(policy, limit)
+
+    return Reservation(users, user_id, policy, user[counter])
+
+
+def remaining(user: dict, plan: str, policy: QuotaPolicy) -> Optional[int]:
+    """Unidades restantes para o usuário (None = ilimitado)"""
+    limit = policy.limit_for(plan)
+    if limit is None:
+        return None
+    return max(0, limit - user.get(policy.counter_field, 0))
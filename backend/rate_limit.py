@@ -0,0 +1,187 @@
+"""
+Rate limiting com token buckets por usuário e por rota para os endpoints de IA
+
+Cada rota configurada tem dois buckets: um por usuário (protege contra um
+script abusando da conta) e um global (protege as cotas da fal.ai e da
+OpenAI). O estado fica em memória por padrão; com RATE_LIMIT_BACKEND=mongo
+os buckets são compartilhados entre dynos via updates atômicos no MongoDB.
+"""
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Mapping, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+from pymongo import ReturnDocument
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+rate_limit_decisions_total = registry.counter(
+    "rate_limit_decisions_total", "Decisões do rate limiter", ["route", "scope", "outcome"]
+)
+
+
+@dataclass(frozen=True)
+class BucketSpec:
+    capacity: float  # rajada máxima
+    refill_per_second: float
+
+    @classmethod
+    def per_minute(cls, capacity: float, per_minute: float) -> "BucketSpec":
+        return cls(capacity=capacity, refill_per_second=per_minute / 60.0)
+
+
+@dataclass(frozen=True)
+class RouteLimit:
+    per_user: BucketSpec
+    global_: BucketSpec
+
+
+# Limites padrão das rotas que chamam provedores de IA
+DEFAULT_ROUTE_LIMITS: Mapping[Tuple[str, str], RouteLimit] = {
+    ("POST", "/api/gerar-look-visual"): RouteLimit(
+        per_user=BucketSpec.per_minute(capacity=3, per_minute=6),
+        global_=BucketSpec.per_minute(capacity=20, per_minute=60),
+    ),
+    ("POST", "/api/sugerir-look"): RouteLimit(
+        per_user=BucketSpec.per_minute(capacity=5, per_minute=20),
+        global_=BucketSpec.per_minute(capacity=50, per_minute=300),
+    ),
+}
+
+
+@dataclass
+class Decision:
+    allowed: bool
+    remaining: float
+    retry_after: float
+
+
+def _decide(tokens: float, spec: BucketSpec) -> Decision:
+    if tokens >= 1:
+        return Decision(True, tokens - 1, 0.0)
+    return Decision(False, tokens, (1 - tokens) / spec.refill_per_second)
+
+
+class InMemoryBucketBackend:
+    """Buckets no processo (um conjunto por worker)"""
+
+    def __init__(self, max_keys: int = 50000):
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, timestamp)
+        self._lock = threading.Lock()
+        self.max_keys = max_keys
+
+    async def take(self, key: str, spec: BucketSpec) -> Decision:
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (spec.capacity, now))
+            tokens = min(spec.capacity, tokens + (now - last) * spec.refill_per_second)
+            decision = _decide(tokens, spec)
+            self._buckets[key] = (decision.remaining, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return decision
+
+    async def refund(self, key: str, spec: BucketSpec) -> None:
+        with self._lock:
+            if key in self._buckets:
+                tokens, last = self._buckets[key]
+                self._buckets[key] = (min(spec.capacity, tokens + 1), last)
+
+    def _prune(self, now: float) -> None:
+        # Buckets ociosos há mais de 10 minutos já estariam cheios de novo
+        cutoff = now - 600
+        for key in [k for k, (_, ts) in self._buckets.items() if ts < cutoff]:
+            del self._buckets[key]
+
+
+class MongoBucketBackend:
+    """
+    Buckets compartilhados no MongoDB. O refill e o consumo acontecem num
+    único find_one_and_update com pipeline, então é seguro entre processos.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def take(self, key: str, spec: BucketSpec) -> Decision:
+        now = time.time()
+        refilled = {"$min": [
+            spec.capacity,
+            {"$add": [
+                {"$ifNull": ["$tokens", spec.capacity]},
+                {"$multiply": [{"$subtract": [now, {"$ifNull": ["$ts", now]}]}, spec.refill_per_second]},
+            ]},
+        ]}
+        doc = await self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "ts": now, "expires_at": datetime.utcnow() + timedelta(hours=1)}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]}}},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc["allowed"]:
+            return Decision(True, doc["tokens"], 0.0)
+        return Decision(False, doc["tokens"], (1 - doc["tokens"]) / spec.refill_per_second)
+
+    async def refund(self, key: str, spec: BucketSpec) -> None:
+        await self.collection.update_one(
+            {"_id": key},
+            [{"$set": {"tokens": {"$min": [spec.capacity, {"$add": ["$tokens", 1]}]}}}],
+        )
+
+
+class RateLimiter:
+    def __init__(self, backend, identify: Callable, limits: Mapping[Tuple[str, str], RouteLimit] = DEFAULT_ROUTE_LIMITS):
+        self.backend = backend
+        self.identify = identify
+        self.limits = limits
+        self.enabled = True
+
+    async def check(self, method: str, path: str, identity: str) -> Optional[Tuple[Decision, RouteLimit]]:
+        limit = self.limits.get((method, path))
+        if limit is None:
+            return None
+
+        # Bucket do usuário primeiro: um script barrado no próprio limite não consome o global
+        user_key = f"user:{identity}:{path}"
+        user_decision = await self.backend.take(user_key, limit.per_user)
+        rate_limit_decisions_total.inc(route=path, scope="user", outcome="allowed" if user_decision.allowed else "limited")
+        if not user_decision.allowed:
+            return user_decision, limit
+
+        global_decision = await self.backend.take(f"global:{path}", limit.global_)
+        rate_limit_decisions_total.inc(route=path, scope="global", outcome="allowed" if global_decision.allowed else "limited")
+        if not global_decision.allowed:
+            # A requisição não vai passar: devolve o token do usuário
+            await self.backend.refund(user_key, limit.per_user)
+            return global_decision, limit
+
+        return user_decision, limit
+
+    async def middleware(self, request, call_next):
+        if not self.enabled or (request.method, request.url.path) not in self.limits:
+            return await call_next(request)
+
+        decision, limit = await self.check(request.method, request.url.path, self.identify(request))
+        if not decision.allowed:
+            retry_after = max(1, math.ceil(decision.retry_after))
+            logger.warning("Rate limit atingido em %s (retry em %ss)", request.url.path, retry_after)
+            return JSONResponse(
+                status_code=429,
+                content={"detail": f"Muitas requisições. Tente novamente em {retry_after} segundos."},
+                headers={"Retry-After": str(retry_after)},
+            )
+
+        response = await call_next(request)
+        response.headers["X-RateLimit-Limit"] = str(int(limit.per_user.capacity))
+        response.headers["X-RateLimit-Remaining"] = str(int(decision.remaining))
+        return response
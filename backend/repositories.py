@@ -0,0 +1,398 @@
+"""
+Repositórios das coleções users, clothing_items e looks
+
+Cada consulta tem nome e projeção próprios: os handlers pedem só os campos
+de que precisam e imagens (foto do corpo, imagens das roupas e dos looks)
+nunca vêm junto por acidente. Os índices usados pelas listagens ficam
+declarados aqui e são criados no startup, e as mesmas definições são
+passadas como hint nas consultas paginadas.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from bson import Binary
+from pymongo import ReturnDocument, UpdateOne
+
+from garment_taxonomy import garment_fields
+from quota import LOOKS_QUOTA
+from user_counters import ALL_COUNTERS
+from wardrobe_search import search_fields
+
+# Índices das listagens paginadas (criados em ensure_indexes e usados como hint)
+BY_USER_NEWEST = [("user_id", 1), ("created_at", -1)]
+# Roupas sem embedding visual (backfill). Hashed: chave de 8 bytes em vez do vetor inteiro
+EMBEDDING_PENDING = [("embedding", "hashed")]
+
+
+@dataclass(frozen=True, slots=True)
+class BodyPhoto:
+    data_uri: Optional[str]
+    sha256: Optional[str]
+
+
+@dataclass(frozen=True, slots=True)
+class ClothingSummary:
+    """Campos descritivos de uma roupa, sem imagem"""
+    id: str
+    tipo: str
+    categoria: Optional[str]
+    cor: str
+    estilo: str
+    nome: str
+
+    PROJECTION = {"_id": 0, "id": 1, "tipo": 1, "categoria": 1, "cor": 1, "estilo": 1, "nome": 1}
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "ClothingSummary":
+        return cls(doc["id"], doc["tipo"], doc.get("categoria"), doc["cor"], doc["estilo"], doc["nome"])
+
+
+class UserRepository:
+    # Campos do usuário usados pelas rotas autenticadas: sem a foto do corpo (que
+    # pode ter vários MB), o hash da senha e o código de recuperação
+    PROFILE_PROJECTION = {
+        "_id": 0,
+        **dict.fromkeys([
+            "id", "email", "nome", "ocasiao_preferida", "created_at", "foto_corpo_hash", "roupas_versao",
+            "plano_ativo", "data_expiracao_plano",
+            LOOKS_QUOTA.counter_field, LOOKS_QUOTA.window_field,
+            *(spec.field for spec in ALL_COUNTERS),
+            "google_play_purchase_token", "google_play_order_id", "google_play_subscription_id",
+            "google_play_expiry_time", "google_play_auto_renewing", "google_play_payment_state",
+            "apple_transaction_id",
+            "stripe_customer_id", "stripe_subscription_id", "stripe_payment_intent_id",
+            "stripe_pending_plan", "stripe_pending_price_id",
+            "subscription_cancel_at_period_end", "subscription_canceled_at",
+        ], 1),
+    }
+    # Só para o login e a redefinição de senha
+    CREDENTIALS_PROJECTION = {**PROFILE_PROJECTION, "password_hash": 1}
+    RESET_PROJECTION = {"_id": 0, "id": 1, "email": 1, "reset_code": 1, "reset_code_expires": 1}
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index("id")
+        await self.collection.create_index("email")
+        await self.collection.create_index("google_play_purchase_token", sparse=True)
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": user_id}, self.PROFILE_PROJECTION)
+
+    async def get_by_email(self, email: str) -> Optional[dict]:
+        return await self.collection.find_one({"email": email}, self.PROFILE_PROJECTION)
+
+    async def get_credentials(self, email: str) -> Optional[dict]:
+        """Perfil com o hash da senha, para o login"""
+        return await self.collection.find_one({"email": email}, self.CREDENTIALS_PROJECTION)
+
+    async def get_reset_code(self, email: str) -> Optional[dict]:
+        """Código de recuperação de senha pendente do usuário"""
+        return await self.collection.find_one({"email": email}, self.RESET_PROJECTION)
+
+    async def get_by_purchase_token(self, purchase_token: str) -> Optional[dict]:
+        return await self.collection.find_one({"google_play_purchase_token": purchase_token}, self.PROFILE_PROJECTION)
+
+    async def email_exists(self, email: str) -> bool:
+        return await self.collection.find_one({"email": email}, {"_id": 1}) is not None
+
+    async def insert(self, doc: dict) -> None:
+        await self.collection.insert_one(doc)
+
+    async def update(self, user_id: str, update: dict):
+        """Aplica um documento de update ($set/$unset/...) ao usuário"""
+        return await self.collection.update_one({"id": user_id}, update)
+
+    async def bump_wardrobe_version(self, user_id: str) -> None:
+        """Invalida o que é cacheado por versão do guarda-roupa (contagens da busca)"""
+        await self.update(user_id, {"$inc": {"roupas_versao": 1}})
+
+    async def expire_plan(self, user_id: str) -> None:
+        await self.update(user_id, {"$set": {"plano_ativo": "free", "data_expiracao_plano": None}})
+
+    async def get_body_photo(self, user_id: str) -> BodyPhoto:
+        doc = await self.collection.find_one({"id": user_id}, {"_id": 0, "foto_corpo": 1, "foto_corpo_hash": 1})
+        doc = doc or {}
+        return BodyPhoto(doc.get("foto_corpo"), doc.get("foto_corpo_hash"))
+
+    async def set_body_photo(self, user_id: str, data_uri: str, sha256: str) -> None:
+        await self.update(user_id, {"$set": {"foto_corpo": data_uri, "foto_corpo_hash": sha256}})
+
+    async def set_body_photo_hash_if_missing(self, user_id: str, sha256: Optional[str]) -> None:
+        await self.collection.update_one(
+            {"id": user_id, "foto_corpo_hash": {"$exists": False}},
+            {"$set": {"foto_corpo_hash": sha256}}
+        )
+
+
+class ClothingRepository:
+    # Documento completo da roupa como a API devolve (sem os campos normalizados de busca
+    # nem os embeddings da imagem e do texto)
+    PUBLIC_PROJECTION = {"_id": 0, "busca": 0, "embedding": 0, "texto_embedding": 0}
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index("id")
+        await self.collection.create_index(BY_USER_NEWEST)
+        # Filtros de /roupas/search (wardrobe_search)
+        await self.collection.create_index([("user_id", 1), ("busca.tipo", 1), ("created_at", -1)])
+        await self.collection.create_index([("user_id", 1), ("categoria", 1), ("created_at", -1)])
+        await self.collection.create_index([("user_id", 1), ("busca.cor", 1), ("created_at", -1)])
+        await self.collection.create_index([("user_id", 1), ("busca.nome", 1)])
+        await self.collection.create_index([("user_id", 1), ("nome", "text")], default_language="portuguese")
+        await self.collection.create_index(EMBEDDING_PENDING)
+
+    async def backfill_search_fields(self, batch_size: int = 500) -> int:
+        """
+        Preenche `busca`, `tipo_canonico` e `categoria` nas roupas cadastradas
+        antes desses campos existirem (sem eles a roupa some dos filtros)
+        """
+        updated = 0
+        cursor = self.collection.find(
+            {"$or": [
+                {"busca": {"$exists": False}},
+                {"categoria": {"$exists": False}},
+                {"tipo_canonico": {"$exists": False}},
+            ]},
+            {"_id": 1, "nome": 1, "tipo": 1, "cor": 1, "estilo": 1}
+        )
+        batch = []
+        async for doc in cursor:
+            fields = {"busca": search_fields(doc), **garment_fields(doc.get("tipo"))}
+            batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+            if len(batch) >= batch_size:
+                await self.collection.bulk_write(batch, ordered=False)
+                updated += len(batch)
+                batch = []
+        if batch:
+            await self.collection.bulk_write(batch, ordered=False)
+            updated += len(batch)
+        return updated
+
+    async def count(self, user_id: str) -> int:
+        return await self.collection.count_documents({"user_id": user_id})
+
+    async def list_page(self, user_id: str, skip: int, limit: int) -> List[dict]:
+        return await self.collection.find(
+            {"user_id": user_id}, self.PUBLIC_PROJECTION
+        ).sort("created_at", -1).skip(skip).limit(limit).hint(BY_USER_NEWEST).to_list(limit)
+
+    async def search(self, query: dict, skip: int, limit: int) -> Tuple[int, List[dict]]:
+        """(total, página) das roupas que atendem ao filtro de wardrobe_search.build_filter"""
+        total = await self.collection.count_documents(query)
+        items = await self.collection.find(
+            query, self.PUBLIC_PROJECTION
+        ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+        return total, items
+
+    async def facet_counts(self, user_id: str) -> Dict[str, List[dict]]:
+        """Quantidade de roupas por tipo e por cor, numa única agregação"""
+        def group_by(field: str) -> list:
+            return [
+                {"$match": {field: {"$nin": [None, ""]}}},
+                {"$group": {"_id": f"${field}", "total": {"$sum": 1}}},
+                {"$sort": {"total": -1, "_id": 1}},
+                {"$project": {"_id": 0, "valor": "$_id", "total": 1}},
+            ]
+
+        result = await self.collection.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$facet": {"tipo": group_by("busca.tipo"), "cor": group_by("busca.cor")}},
+        ]).to_list(1)
+        return result[0] if result else {"tipo": [], "cor": []}
+
+    async def summaries(self, user_id: str, limit: int = 1000) -> List[ClothingSummary]:
+        docs = await self.collection.find(
+            {"user_id": user_id}, ClothingSummary.PROJECTION
+        ).to_list(limit)
+        return [ClothingSummary.from_doc(doc) for doc in docs]
+
+    async def color_profiles(self, user_id: str, limit: int = 1000) -> List[dict]:
+        """Campos usados pela pontuação de harmonia (color_harmony)"""
+        return await self.collection.find(
+            {"user_id": user_id},
+            {"_id": 0, "id": 1, "tipo": 1, "categoria": 1, "cor": 1, "estilo": 1, "cores_dominantes": 1}
+        ).to_list(limit)
+
+    async def embeddings(self, user_id: str, limit: int = 1000) -> List[dict]:
+        """Embeddings das roupas do usuário (garment_embeddings)"""
+        return await self.collection.find(
+            {"user_id": user_id, "embedding": {"$type": "binData"}}, {"_id": 0, "id": 1, "embedding": 1}
+        ).to_list(limit)
+
+    async def without_embedding(self, limit: int) -> List[dict]:
+        """Roupas cadastradas antes dos embeddings, com a referência da imagem"""
+        return await self.collection.find(
+            {"embedding": None},
+            {"_id": 0, "id": 1, "user_id": 1, "imagem_blob_id": 1, "imagem_original": 1}
+        ).hint(EMBEDDING_PENDING).to_list(limit)
+
+    async def set_embeddings(self, embeddings: Dict[str, Optional[bytes]]) -> None:
+        # Imagens que não puderam ser analisadas ficam com b"": saem do backfill e do índice
+        await self.collection.bulk_write([
+            UpdateOne({"id": item_id}, {"$set": {"embedding": Binary(embedding or b"")}})
+            for item_id, embedding in embeddings.items()
+        ], ordered=False)
+
+    async def text_embeddings(self, user_id: str, limit: int = 1000) -> Dict[str, dict]:
+        """id -> {"hash", "vetor"} dos embeddings de texto já calculados (garment_retrieval)"""
+        docs = await self.collection.find(
+            {"user_id": user_id, "texto_embedding": {"$exists": True}}, {"_id": 0, "id": 1, "texto_embedding": 1}
+        ).to_list(limit)
+        return {doc["id"]: doc["texto_embedding"] for doc in docs}
+
+    async def set_text_embeddings(self, updates: Dict[str, Tuple[str, bytes]]) -> None:
+        await self.collection.bulk_write([
+            UpdateOne({"id": item_id}, {"$set": {"texto_embedding": {"hash": digest, "vetor": Binary(vector)}}})
+            for item_id, (digest, vector) in updates.items()
+        ], ordered=False)
+
+    async def get_many(self, user_id: str, ids: Sequence[str]) -> List[dict]:
+        """Roupas do usuário com os ids pedidos, numa consulta, na ordem pedida"""
+        docs = await self.collection.find(
+            {"id": {"$in": list(ids)}, "user_id": user_id}, self.PUBLIC_PROJECTION
+        ).to_list(len(ids))
+        by_id: Dict[str, dict] = {doc["id"]: doc for doc in docs}
+        return [by_id[item_id] for item_id in ids if item_id in by_id]
+
+    async def missing_ids(self, user_id: str, ids: Sequence[str]) -> List[str]:
+        """Ids da lista que não existem ou não pertencem ao usuário"""
+        docs = await self.collection.find(
+            {"id": {"$in": list(ids)}, "user_id": user_id}, {"_id": 0, "id": 1}
+        ).to_list(len(ids))
+        found = {doc["id"] for doc in docs}
+        return [item_id for item_id in ids if item_id not in found]
+
+    async def image_refs(self, user_id: str, ids: Sequence[str]) -> List[dict]:
+        """Referências de imagem (blob ou data URI antigo) das roupas, na ordem pedida"""
+        docs = await self.collection.find(
+            {"id": {"$in": list(ids)}, "user_id": user_id},
+            {"_id": 0, "id": 1, "imagem_blob_id": 1, "imagem_original": 1}
+        ).to_list(len(ids))
+        by_id: Dict[str, dict] = {doc["id"]: doc for doc in docs}
+        return [by_id[item_id] for item_id in ids if item_id in by_id]
+
+    async def owner_of(self, item_id: str) -> Optional[str]:
+        doc = await self.collection.find_one({"id": item_id}, {"_id": 0, "user_id": 1})
+        return doc["user_id"] if doc else None
+
+    async def insert(self, doc: dict) -> None:
+        await self.collection.insert_one({**doc, "busca": search_fields(doc)})
+
+    async def delete(self, user_id: str, item_id: str) -> Optional[dict]:
+        """Remove a roupa e retorna a referência da imagem (ou None se não existia)"""
+        return await self.collection.find_one_and_delete(
+            {"id": item_id, "user_id": user_id},
+            projection={"_id": 0, "id": 1, "imagem_blob_id": 1}
+        )
+
+
+class LookRepository:
+    # Campos das roupas embutidos em cada look da listagem completa; a imagem
+    # vem à parte, por /roupas/{id}/imagem
+    CLOTHING_SUMMARY_PROJECTION = {"_id": 0, "id": 1, "nome": 1, "tipo": 1, "cor": 1}
+
+    # Listagens: sem a imagem completa do look (servida por /looks/{id}/imagem),
+    # só a indicação de que ela existe
+    LIST_STAGES = [
+        {"$addFields": {"tem_imagem": {
+            "$or": [{"$gt": ["$imagem_blob_id", ""]}, {"$gt": ["$imagem_look", ""]}]
+        }}},
+        {"$project": {"_id": 0, "imagem_look": 0}},
+    ]
+
+    def __init__(self, collection, clothing_collection: str = "clothing_items"):
+        self.collection = collection
+        self.clothing_collection = clothing_collection
+
+    async def ensure_indexes(self) -> None:
+        await self.collection.create_index("id")
+        await self.collection.create_index(BY_USER_NEWEST)
+        await self.collection.create_index([("user_id", 1), ("roupas_ids", 1)])
+
+    async def count(self, user_id: str) -> int:
+        return await self.collection.count_documents({"user_id": user_id})
+
+    async def get_cover_sources(self, user_id: str, look_id: str) -> Optional[dict]:
+        """Campos usados para renderizar a capa do look"""
+        return await self.collection.find_one(
+            {"id": look_id, "user_id": user_id},
+            {"_id": 0, "roupas_ids": 1, "imagem_blob_id": 1, "imagem_look": 1}
+        )
+
+    async def ids_with_clothing(self, user_id: str, clothing_id: str) -> List[str]:
+        docs = await self.collection.find(
+            {"user_id": user_id, "roupas_ids": clothing_id}, {"_id": 0, "id": 1}
+        ).to_list(None)
+        return [doc["id"] for doc in docs]
+
+    async def set_cover_hash(self, user_id: str, look_id: str, sha256: Optional[str]) -> bool:
+        result = await self.collection.update_one(
+            {"id": look_id, "user_id": user_id}, {"$set": {"capa_hash": sha256}}
+        )
+        return result.matched_count > 0
+
+    async def get_image_ref(self, user_id: str, look_id: str) -> Optional[dict]:
+        """Referência da imagem completa (blob ou data URI antigo)"""
+        return await self.collection.find_one(
+            {"id": look_id, "user_id": user_id}, {"_id": 0, "imagem_blob_id": 1, "imagem_look": 1}
+        )
+
+    async def list_page(self, user_id: str, skip: int, limit: int) -> List[dict]:
+        return await self.collection.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$sort": {"created_at": -1}},
+            {"$skip": skip},
+            {"$limit": limit},
+            *self.LIST_STAGES,
+        ], hint=BY_USER_NEWEST).to_list(limit)
+
+    async def list_page_with_clothing(self, user_id: str, skip: int, limit: int) -> List[dict]:
+        """
+        Página de looks com o resumo das roupas de cada um (campo `roupas`, na
+        ordem de `roupas_ids`), numa única agregação. O $lookup com
+        localField e pipeline juntos exige MongoDB 5.0+.
+        """
+        looks = await self.collection.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$sort": {"created_at": -1}},
+            {"$skip": skip},
+            {"$limit": limit},
+            {"$lookup": {
+                "from": self.clothing_collection,
+                "localField": "roupas_ids",
+                "foreignField": "id",
+                "pipeline": [
+                    {"$match": {"user_id": user_id}},
+                    {"$project": self.CLOTHING_SUMMARY_PROJECTION},
+                ],
+                "as": "roupas",
+            }},
+            *self.LIST_STAGES,
+        ], hint=BY_USER_NEWEST).to_list(limit)
+        for look in looks:
+            by_id = {roupa["id"]: roupa for roupa in look["roupas"]}
+            look["roupas"] = [by_id[roupa_id] for roupa_id in look["roupas_ids"] if roupa_id in by_id]
+        return looks
+
+    async def insert(self, doc: dict) -> None:
+        await self.collection.insert_one(doc)
+
+    async def toggle_favorite(self, user_id: str, look_id: str) -> Optional[bool]:
+        """Inverte o favorito atomicamente; retorna o novo valor ou None se o look não existe"""
+        look = await self.collection.find_one_and_update(
+            {"id": look_id, "user_id": user_id},
+            [{"$set": {"favorito": {"$ne": ["$favorito", True]}}}],
+            projection={"_id": 0, "favorito": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return look["favorito"] if look else None
+
+    async def delete(self, user_id: str, look_id: str) -> Optional[dict]:
+        return await self.collection.find_one_and_delete(
+            {"id": look_id, "user_id": user_id},
+            projection={"_id": 0, "favorito": 1, "imagem_blob_id": 1}
+        )
@@ -0,0 +1,264 @@
+"""
+Retry com backoff exponencial + jitter e circuit breaker por provedor
+
+Uso:
+    result = await resilient_call("openai.chat", lambda: openai_client.chat.completions.create(...))
+
+`fn` é uma função sem argumentos que retorna um awaitable; chamadas
+síncronas devem ser embrulhadas com asyncio.to_thread. Só erros transitórios
+(conexão, timeout, 408/429/5xx) são repetidos. Chamadas não idempotentes
+(idempotent=False) só são repetidas quando o pedido comprovadamente não foi
+processado: falha ao abrir a conexão ou 429. Timeout e 5xx depois do envio
+podem ter sido executados (e cobrados) pelo provedor.
+"""
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from concurrency import ProviderSaturated
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+TRANSIENT_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+# Nomes de exceções de transporte de requests, httpx, openai, stripe e da stdlib
+TRANSIENT_EXCEPTION_NAMES = frozenset({
+    "ConnectionError", "Timeout", "ConnectTimeout", "ReadTimeout", "TimeoutError",
+    "TransportError", "APIConnectionError", "APITimeoutError",
+})
+
+# Falhas antes de o pedido chegar ao provedor (requests/urllib3, httpx, openai)
+CONNECT_EXCEPTION_NAMES = frozenset({
+    "ConnectTimeout", "ConnectError", "NewConnectionError", "NameResolutionError", "ConnectionRefusedError",
+})
+
+resilience_retries_total = registry.counter(
+    "resilience_retries_total", "Tentativas repetidas por provedor", ["provider"]
+)
+circuit_state = registry.gauge(
+    "circuit_breaker_state", "Estado do circuit breaker (0=fechado, 1=meio-aberto, 2=aberto)", ["provider"]
+)
+circuit_rejections_total = registry.counter(
+    "circuit_breaker_rejections_total", "Chamadas rejeitadas com o circuito aberto", ["provider"]
+)
+
+
+class TransientProviderError(Exception):
+    """Resposta HTTP do provedor que vale a pena repetir (429/5xx)"""
+
+    def __init__(self, provider: str, status_code: int, retry_after: Optional[float] = None, response=None):
+        super().__init__(f"{provider} respondeu {status_code}")
+        self.provider = provider
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.response = response
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"Circuito de {provider} aberto")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    deadline: float = 30.0  # orçamento total, incluindo as esperas
+
+
+PROVIDER_POLICIES: Dict[str, RetryPolicy] = {
+    "fal.ai": RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=8.0, deadline=150.0),
+    # Um breaker por API da OpenAI: queda dos embeddings não derruba as sugestões
+    "openai.chat": RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=4.0, deadline=45.0),
+    "openai.embeddings": RetryPolicy(max_attempts=2, base_delay=0.25, max_delay=1.0, deadline=10.0),
+    "google_play": RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=4.0, deadline=20.0),
+    "stripe": RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=4.0, deadline=20.0),
+}
+
+
+def _status_of(exc: BaseException) -> Optional[int]:
+    for candidate in (
+        getattr(exc, "status_code", None),
+        getattr(exc, "http_status", None),
+        getattr(getattr(exc, "resp", None), "status", None),
+    ):
+        if candidate is not None:
+            try:
+                return int(candidate)
+            except (TypeError, ValueError):
+                continue
+    return None
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Erros de transporte ou status HTTP que indicam falha temporária do provedor"""
+    if isinstance(exc, (TransientProviderError, asyncio.TimeoutError)):
+        return True
+    status = _status_of(exc)
+    if status is not None:
+        return status in TRANSIENT_STATUS
+    return any(cls.__name__ in TRANSIENT_EXCEPTION_NAMES for cls in type(exc).__mro__)
+
+
+def _causes(exc: BaseException, depth: int = 5):
+    """A exceção e as que ela embrulha (__cause__/__context__, `reason` do urllib3, args[0] do requests)"""
+    seen = []
+    pending = [exc]
+    while pending and len(seen) < depth:
+        current = pending.pop(0)
+        if not isinstance(current, BaseException) or any(current is known for known in seen):
+            continue
+        seen.append(current)
+        pending.extend([current.__cause__, current.__context__, getattr(current, "reason", None)])
+        if current.args:
+            pending.append(current.args[0])
+    return seen
+
+
+def is_safe_to_resend(exc: BaseException) -> bool:
+    """O pedido não foi processado: conexão não estabelecida ou 429 (rejeitado antes de executar)"""
+    if _status_of(exc) == 429:
+        return True
+    return any(
+        cls.__name__ in CONNECT_EXCEPTION_NAMES for cause in _causes(exc) for cls in type(cause).__mro__
+    )
+
+
+class CircuitBreaker:
+    """
+    Abre depois de `failure_threshold` falhas transitórias seguidas; após
+    `reset_timeout` deixa passar uma única chamada de teste (meio-aberto).
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, provider: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        circuit_state.set(self.state, provider=provider)
+
+    def _set_state(self, state: int) -> None:
+        if state != self.state:
+            logger.warning("Circuit breaker de %s: %s -> %s", self.provider, self.state, state)
+        self.state = state
+        circuit_state.set(state, provider=self.provider)
+
+    def before_call(self) -> None:
+        if self.state == self.OPEN:
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.reset_timeout:
+                circuit_rejections_total.inc(provider=self.provider)
+                raise CircuitOpenError(self.provider, self.reset_timeout - elapsed)
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                circuit_rejections_total.inc(provider=self.provider)
+                raise CircuitOpenError(self.provider, self.reset_timeout)
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        self._probe_in_flight = False
+        self.failures = 0
+        self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+    def release_probe(self) -> None:
+        """A chamada nem chegou ao provedor (fila local cheia): nada se sabe sobre ele"""
+        self._probe_in_flight = False
+
+    def record_neutral(self) -> None:
+        """Erro do cliente (4xx): o provedor está de pé"""
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            self.failures = 0
+            self._set_state(self.CLOSED)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    breaker = _breakers.get(provider)
+    if breaker is None:
+        breaker = _breakers[provider] = CircuitBreaker(provider)
+    return breaker
+
+
+def backoff_delay(policy: RetryPolicy, attempt: int) -> float:
+    """Full jitter: uniforme entre 0 e o teto exponencial da tentativa"""
+    return random.uniform(0, min(policy.max_delay, policy.base_delay * (2 ** (attempt - 1))))
+
+
+async def resilient_call(
+    provider: str,
+    fn: Callable[[], Awaitable[T]],
+    idempotent: bool = True,
+    policy: Optional[RetryPolicy] = None,
+) -> T:
+    """
+    Executa `fn` com circuit breaker e retries com backoff; se não for
+    `idempotent`, só repete o que is_safe_to_resend garante não ter sido
+    processado. Re-levanta a última exceção quando as tentativas ou o prazo acabam.
+    """
+    policy = policy or PROVIDER_POLICIES.get(provider, RetryPolicy())
+    breaker = get_breaker(provider)
+    deadline = time.monotonic() + policy.deadline
+    attempt = 0
+
+    while True:
+        attempt += 1
+        breaker.before_call()
+        try:
+            result = await fn()
+        except ProviderSaturated:
+            # Rejeitado pelo governador local antes do envio: o circuito fica como está
+            breaker.release_probe()
+            raise
+        except Exception as e:
+            if not is_transient(e):
+                breaker.record_neutral()
+                raise
+            breaker.record_failure()
+
+            if not (idempotent or is_safe_to_resend(e)) or attempt >= policy.max_attempts:
+                raise
+            delay = backoff_delay(policy, attempt)
+            retry_after = getattr(e, "retry_after", None)
+            if retry_after:
+                delay = max(delay, float(retry_after))
+            if time.monotonic() + delay >= deadline:
+                raise
+
+            resilience_retries_total.inc(provider=provider)
+            logger.warning(
+                "%s falhou (tentativa %d/%d): %s; nova tentativa em %.1fs",
+                provider, attempt, policy.max_attempts, e, delay,
+            )
+            await asyncio.sleep(delay)
+        except BaseException:
+            # Cancelada (cliente desconectou, timeout): sem resultado, libera a sonda
+            breaker.release_probe()
+            raise
+        else:
+            breaker.record_success()
+            return result
@@ -1,23 +1,86 @@
-from fastapi import FastAPI, APIRouter, HTTPException, File, UploadFile, Form, Depends, Request
+from fastapi import FastAPI, APIRouter, HTTPException, File, UploadFile, Form, Depends, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 from bson import ObjectId
 import os
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import uuid
 from datetime import datetime, timedelta
 import bcrypt
 import jwt
 import base64
 import json
+import math
 import random
 import traceback
+import requests
+import httpx
 from email_service import email_service
+from metrics import (
+    CONTENT_TYPE_LATEST,
+    MongoCommandMetrics,
+    metrics_middleware,
+    monitor_event_loop_lag,
+    registry as metrics_registry,
+    track_external,
+)
+from log_config import configure_logging
+from garment_taxonomy import garment_fields, lookup as lookup_garment
+from color_harmony import WardrobeHarmony, dominant_colors, harmony_cache
+from garment_retrieval import (
+    EMBEDDING_DIMENSIONS as RETRIEVAL_EMBEDDING_DIMENSIONS,
+    EMBEDDING_MODEL as RETRIEVAL_EMBEDDING_MODEL,
+    TOP_K as SUGGESTION_TOP_K,
+    build_index as build_text_index,
+    embed_batched,
+    index_cache as text_index_cache,
+    query_cache,
+    query_text,
+    text_hash,
+)
+from garment_embeddings import (
+    DUPLICATE_SIMILARITY,
+    SimilarityIndex,
+    embed_image,
+    index_cache as similarity_index_cache,
+    unpack as unpack_embedding,
+)
+import look_covers
+from image_upload import MAX_IMAGE_BYTES, UploadedImage, decode_data_uri, read_upload
+from body_limit import BodySizeLimitMiddleware
+from blob_store import (
+    ensure_indexes as ensure_blob_indexes,
+    hydrate_images,
+    load_bytes as load_blob_bytes,
+    load_image as load_blob_image,
+    release as release_blob,
+    store as store_blob,
+)
+from concurrency import AdaptiveConcurrencyLimiter, ProviderSaturated
+from resilience import CircuitOpenError, TransientProviderError, resilient_call
+from rate_limit import InMemoryBucketBackend, MongoBucketBackend, RateLimiter
+from repositories import ClothingRepository, ClothingSummary, LookRepository, UserRepository
+from user_counters import (
+    FAVORITOS,
+    LOOKS,
+    ROUPAS,
+    initial_counters,
+    read as read_counters,
+    refresh as refresh_counter,
+)
+from quota import LOOKS_QUOTA, QuotaExceeded, remaining as remaining_quota, reserve as reserve_quota
+from tracing import MongoCommandTracing, inject_headers, span, tracer, tracing_middleware
+from tryon_checkpoints import content_hash, ensure_indexes as ensure_checkpoint_indexes, find_resume_point, save_checkpoint
+from tryon_planner import TryonStep, plan_tryon
+from wardrobe_search import build_filter as build_wardrobe_filter, facet_cache
+from tryon_results import ensure_indexes as ensure_result_indexes, load_result, save_result
+from job_locks import acquire as acquire_job_lock, ensure_indexes as ensure_job_lock_indexes, release as release_job_lock
 from openai import AsyncOpenAI
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
@@ -27,16 +90,32 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandMetrics(), MongoCommandTracing()])
 db = client[os.environ['DB_NAME']]
+users_repo = UserRepository(db.users)
+clothing_repo = ClothingRepository(db.clothing_items)
+looks_repo = LookRepository(db.looks)
 
 # OpenAI client initialization
-openai_client = AsyncOpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
+# (retries ficam a cargo do módulo resilience, não do SDK)
+openai_client = AsyncOpenAI(api_key=os.environ.get('OPENAI_API_KEY'), max_retries=0)
 
 # JWT Secret (in production, use a secure secret)
 JWT_SECRET = os.environ.get('JWT_SECRET', 'meu-look-ia-secret-key-2025-default-CHANGE-IN-PRODUCTION')
 security = HTTPBearer()
 
+# Fal.ai concurrency governor (shared by all try-on requests in this process)
+fal_governor = AdaptiveConcurrencyLimiter(
+    "fal.ai",
+    initial_limit=int(os.environ.get('FAL_INITIAL_CONCURRENCY', '4')),
+    max_limit=int(os.environ.get('FAL_MAX_CONCURRENCY', '8')),
+    max_queue=int(os.environ.get('FAL_MAX_QUEUE', '32')),
+    queue_timeout=float(os.environ.get('FAL_QUEUE_TIMEOUT', '20')),
+)
+
+# Cliente HTTP assíncrono compartilhado (download das imagens finais do try-on)
+http_client = httpx.AsyncClient(timeout=30, follow_redirects=True)
+
 # Google Play configuration (optional, for production)
 GOOGLE_PLAY_SERVICE_ACCOUNT_FILE = os.environ.get('GOOGLE_PLAY_SERVICE_ACCOUNT_JSON', None)
 GOOGLE_PACKAGE_NAME = os.environ.get('GOOGLE_PACKAGE_NAME', 'com.meulookia.app')
@@ -85,17 +164,25 @@ class UserLogin(BaseModel):
 class UserProfile(BaseModel):
     email: str
     nome: str
-    foto_corpo: Optional[str] = None
+    # A foto em si é servida por /api/foto-corpo (com ETag); aqui só a referência
+    foto_corpo_url: Optional[str] = None
+    foto_corpo_hash: Optional[str] = None
     ocasiao_preferida: str
     created_at: datetime
 
 class ClothingItem(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
-    tipo: str  # camiseta, calca, sapato, acessorio
+    tipo: str  # camiseta, calca, sapato, acessorio (como o usuário escreveu)
+    tipo_canonico: Optional[str] = None  # chave em garment_taxonomy
+    categoria: Optional[str] = None  # tops, bottoms, one-pieces, outerwear, shoes, accessories (garment_taxonomy)
     cor: str
     estilo: str
-    imagem_original: str  # base64
+    imagem_original: Optional[str] = None  # base64 (itens antigos; os novos usam imagem_blob_id)
+    imagem_blob_id: Optional[str] = None  # imagem deduplicada em image_blobs
+    imagem_hash: Optional[str] = None  # SHA-256 dos bytes da imagem
+    cores_dominantes: Optional[List[dict]] = None  # [{"lab": [L, a, b], "peso": fração}] (color_harmony)
+    embedding: Optional[bytes] = None  # vetor float16 da foto (garment_embeddings)
     nome: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -114,7 +201,9 @@ class Look(BaseModel):
     ocasiao: str
     clima: Optional[str] = None
     favorito: bool = False
-    imagem_look: Optional[str] = None  # base64 da simulação
+    imagem_look: Optional[str] = None  # base64 da simulação (looks antigos)
+    imagem_blob_id: Optional[str] = None  # imagem da simulação no blob store
+    capa_hash: Optional[str] = None  # miniatura gerada em segundo plano (look_covers)
     sugestao_ia: Optional[str] = None  # Texto da sugestão gerado pela IA
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -123,7 +212,8 @@ class LookCreate(BaseModel):
     roupas_ids: List[str]
     ocasiao: str
     clima: Optional[str] = None
-    imagem_look: Optional[str] = None
+    tryon_result_id: Optional[str] = None  # id retornado por /gerar-look-visual
+    imagem_look: Optional[str] = None  # formato antigo: o app reenviava a imagem
     sugestao_ia: Optional[str] = None
 
 class SugestaoLook(BaseModel):
@@ -178,19 +268,49 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     try:
         payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=["HS256"])
         user_id = payload.get("user_id")
-        user = await db.users.find_one({"id": user_id})
+        with span("auth.get_current_user"):
+            user = await users_repo.get(user_id)
         if user is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
         return user
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
+async def ensure_foto_corpo_hash(user: dict) -> Optional[str]:
+    """
+    Hash da foto do corpo; usuários com foto anterior ao campo recebem o hash
+    calculado uma única vez aqui
+    """
+    if "foto_corpo_hash" in user:
+        return user["foto_corpo_hash"]
+    
+    foto_corpo = (await users_repo.get_body_photo(user["id"])).data_uri
+    foto_corpo_hash = None
+    if foto_corpo:
+        try:
+            foto_corpo_hash = decode_data_uri(foto_corpo, max_bytes=len(foto_corpo)).sha256
+        except HTTPException:
+            foto_corpo_hash = content_hash(foto_corpo)
+    await users_repo.set_body_photo_hash_if_missing(user["id"], foto_corpo_hash)
+    user["foto_corpo_hash"] = foto_corpo_hash
+    return foto_corpo_hash
+
+async def build_user_profile(user: dict) -> UserProfile:
+    foto_corpo_hash = await ensure_foto_corpo_hash(user)
+    return UserProfile(
+        email=user["email"],
+        nome=user["nome"],
+        foto_corpo_url=f"/api/foto-corpo?v={foto_corpo_hash}" if foto_corpo_hash else None,
+        foto_corpo_hash=foto_corpo_hash,
+        ocasiao_preferida=user["ocasiao_preferida"],
+        created_at=user["created_at"]
+    )
+
 # Auth routes
 @api_router.post("/auth/register")
 async def register(user_data: UserCreate):
     # Check if user exists
-    existing_user = await db.users.find_one({"email": user_data.email})
-    if existing_user:
+    if await users_repo.email_exists(user_data.email):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create user
@@ -199,7 +319,7 @@ async def register(user_data: UserCreate):
     del user_dict["password"]
     
     user = User(**user_dict)
-    await db.users.insert_one(user.dict())
+    await users_repo.insert({**user.dict(), "foto_corpo_hash": None, **initial_counters()})
     
     # Create JWT token
     token = create_jwt_token(user.id)
@@ -209,7 +329,6 @@ async def register(user_data: UserCreate):
         "user": UserProfile(
             email=user.email,
             nome=user.nome,
-            foto_corpo=user.foto_corpo,
             ocasiao_preferida=user.ocasiao_preferida,
             created_at=user.created_at
         )
@@ -217,7 +336,7 @@ async def register(user_data: UserCreate):
 
 @api_router.post("/auth/login")
 async def login(login_data: UserLogin):
-    user = await db.users.find_one({"email": login_data.email})
+    user = await users_repo.get_credentials(login_data.email)
     if not user or not verify_password(login_data.password, user["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
@@ -225,25 +344,37 @@ async def login(login_data: UserLogin):
     
     return {
         "token": token,
-        "user": UserProfile(
-            email=user["email"],
-            nome=user["nome"],
-            foto_corpo=user.get("foto_corpo"),
-            ocasiao_preferida=user["ocasiao_preferida"],
-            created_at=user["created_at"]
-        )
+        "user": await build_user_profile(user)
     }
 
 @api_router.get("/auth/me", response_model=UserProfile)
 async def get_me(current_user=Depends(security)):
     user = await get_current_user(current_user)
-    return UserProfile(
-        email=user["email"],
-        nome=user["nome"],
-        foto_corpo=user.get("foto_corpo"),
-        ocasiao_preferida=user["ocasiao_preferida"],
-        created_at=user["created_at"]
-    )
+    return await build_user_profile(user)
+
+@api_router.get("/foto-corpo")
+async def get_foto_corpo(request: Request, current_user=Depends(security)):
+    """
+    Foto do corpo em binário. O ETag é o hash do conteúdo, então o app pode
+    guardar a imagem em cache e revalidar com If-None-Match (304).
+    """
+    user = await get_current_user(current_user)
+    foto_corpo_hash = await ensure_foto_corpo_hash(user)
+    if not foto_corpo_hash:
+        raise HTTPException(status_code=404, detail="Nenhuma foto do corpo cadastrada")
+    
+    etag = f'"{foto_corpo_hash}"'
+    cache_headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=cache_headers)
+    
+    foto_corpo = (await users_repo.get_body_photo(user["id"])).data_uri
+    if not foto_corpo:
+        raise HTTPException(status_code=404, detail="Nenhuma foto do corpo cadastrada")
+    
+    header, _, payload = foto_corpo.partition(",")
+    media_type = header[len("data:"):].split(";")[0] or "image/jpeg"
+    return Response(content=base64.b64decode(payload), media_type=media_type, headers=cache_headers)
 
 # Password Reset Routes
 class PasswordResetRequest(BaseModel):
@@ -261,7 +392,7 @@ async def forgot_password(request: PasswordResetRequest):
     """
     try:
         # Verificar se usuário existe
-        user = await db.users.find_one({"email": request.email})
+        user = await users_repo.get_by_email(request.email)
         if not user:
             # Por segurança, não revelar se o email existe ou não
             return {
@@ -275,8 +406,8 @@ async def forgot_password(request: PasswordResetRequest):
         # Salvar código no banco com expiração de 30 minutos
         expiration = datetime.utcnow() + timedelta(minutes=30)
         
-        await db.users.update_one(
-            {"id": user["id"]},
+        await users_repo.update(
+            user["id"],
             {
                 "$set": {
                     "reset_code": code,
@@ -289,8 +420,8 @@ async def forgot_password(request: PasswordResetRequest):
         email_sent = email_service.send_password_reset_code(request.email, code)
         
         if not email_sent:
-            logging.error(f"Failed to send password reset email to {request.email}")
-            logging.warning(f"[DEV MODE] Password reset code for {request.email}: {code}")
+            logging.error("Failed to send password reset email to %s", request.email)
+            logging.warning("[DEV MODE] Password reset code for %s: %s", request.email, code)
             
             # Em desenvolvimento, retornar o código na resposta quando email falhar
             # IMPORTANTE: Remover em produção!
@@ -301,7 +432,7 @@ async def forgot_password(request: PasswordResetRequest):
                 "note": "Configure o SendGrid corretamente antes de usar em produção"
             }
         
-        logging.info(f"Password reset code sent to {request.email}")
+        logging.info("Password reset code sent to %s", request.email)
         
         return {
             "success": True,
@@ -311,7 +442,7 @@ async def forgot_password(request: PasswordResetRequest):
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"Error in forgot_password: {str(e)}")
+        logging.error("Error in forgot_password: %s", e)
         raise HTTPException(status_code=500, detail="Erro ao processar solicitação")
 
 @api_router.post("/auth/reset-password")
@@ -321,7 +452,7 @@ async def reset_password(request: PasswordResetVerify):
     """
     try:
         # Buscar usuário
-        user = await db.users.find_one({"email": request.email})
+        user = await users_repo.get_reset_code(request.email)
         
         if not user:
             raise HTTPException(status_code=404, detail="Usuário não encontrado")
@@ -332,8 +463,8 @@ async def reset_password(request: PasswordResetVerify):
         
         # Verificar expiração
         if datetime.utcnow() > user.get("reset_code_expires", datetime.utcnow()):
-            await db.users.update_one(
-                {"id": user["id"]},
+            await users_repo.update(
+                user["id"],
                 {"$unset": {"reset_code": "", "reset_code_expires": ""}}
             )
             raise HTTPException(status_code=400, detail="Código expirado. Solicite um novo código")
@@ -345,15 +476,15 @@ async def reset_password(request: PasswordResetVerify):
         # Atualizar senha
         password_hash = bcrypt.hashpw(request.new_password.encode('utf-8'), bcrypt.gensalt())
         
-        await db.users.update_one(
-            {"id": user["id"]},
+        await users_repo.update(
+            user["id"],
             {
                 "$set": {"password_hash": password_hash.decode('utf-8')},
                 "$unset": {"reset_code": "", "reset_code_expires": ""}
             }
         )
         
-        logging.info(f"Password reset successful for {request.email}")
+        logging.info("Password reset successful for %s", request.email)
         
         return {
             "success": True,
@@ -363,37 +494,259 @@ async def reset_password(request: PasswordResetVerify):
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"Error in reset_password: {str(e)}")
+        logging.error("Error in reset_password: %s", e)
         raise HTTPException(status_code=500, detail="Erro ao redefinir senha")
 
 # Profile routes
 @api_router.post("/upload-foto-corpo")
 async def upload_foto_corpo(
-    imagem: str = Form(...),
+    imagem: Optional[str] = Form(None),  # formato antigo: data URI base64
+    arquivo: Optional[UploadFile] = File(None),
     current_user=Depends(security)
 ):
     user = await get_current_user(current_user)
     
+    if arquivo is not None:
+        foto = await read_upload(arquivo)
+        foto_corpo = foto.to_data_uri()
+    elif imagem:
+        foto = decode_data_uri(imagem)
+        foto_corpo = imagem
+    else:
+        raise HTTPException(status_code=400, detail="Envie a foto do corpo.")
+    
     # Update user's body photo
-    await db.users.update_one(
-        {"id": user["id"]},
-        {"$set": {"foto_corpo": imagem}}
-    )
+    await users_repo.set_body_photo(user["id"], foto_corpo, foto.sha256)
+    
+    return {
+        "message": "Foto do corpo atualizada com sucesso",
+        "foto_corpo_url": f"/api/foto-corpo?v={foto.sha256}",
+        "foto_corpo_hash": foto.sha256
+    }
+
+async def fal_tryon_request(fal_api_url: str, payload: dict, headers: dict, step: int, category: str):
+    """
+    Uma chamada ao try-on da Fal.ai, fora do event loop e dentro do limite de
+    concorrência do provedor. Respostas 429/5xx viram TransientProviderError.
+    """
+    async with fal_governor.slot() as permit:
+        with track_external("fal.ai", "tryon") as fal_span:
+            fal_span.set_attribute("tryon.step", step)
+            fal_span.set_attribute("tryon.category", category)
+            api_response = await asyncio.to_thread(
+                requests.post, fal_api_url, json=payload, headers=inject_headers(dict(headers)), timeout=60
+            )
+        if api_response.status_code == 429 or api_response.status_code >= 500:
+            permit.ok = False
+            retry_after = api_response.headers.get("retry-after")
+            raise TransientProviderError(
+                "fal.ai", api_response.status_code,
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+                response=api_response
+            )
+    return api_response
+
+async def fal_download_image(url: str):
+    """Baixa uma imagem gerada pela Fal.ai; 5xx vira TransientProviderError"""
+    with track_external("fal.ai", "download"):
+        image_response = await http_client.get(url)
+    if image_response.status_code >= 500:
+        raise TransientProviderError("fal.ai", image_response.status_code, response=image_response)
+    return image_response
+
+async def run_tryon_chain(user_id: str, model_image: str, steps: List[TryonStep], body_hash: Optional[str] = None):
+    """
+    Aplica as etapas do plano sequencialmente sobre a foto do usuário usando a Fal.ai.
+    Retorna a imagem final (data URI), a URL dela na Fal.ai e o resumo das
+    peças processadas.
+    
+    Entre as etapas a URL gerada pela Fal.ai é repassada diretamente como
+    model_image; só a imagem final é baixada. Cada etapa concluída vira um
+    checkpoint; se um pedido anterior com as mesmas peças falhou no meio, a
+    cadeia retoma da última peça aplicada.
+    """
+    current_image = model_image  # Start with user's body photo
+    clothing_items = [step.clothing for step in steps]
+    
+    body_hash = body_hash or content_hash(model_image)
+    # Same image -> same key, so duplicate garments reuse each other's checkpoints
+    garment_ids = [clothing.get("imagem_blob_id") or clothing["id"] for clothing in clothing_items]
+    with span("tryon.find_checkpoint"):
+        resumed_steps, checkpoint_image = await find_resume_point(db.tryon_checkpoints, user_id, body_hash, garment_ids)
+    if resumed_steps:
+        logging.info("[TRYON] Resuming from checkpoint: %s/%s items already applied", resumed_steps, len(clothing_items))
+        current_image = checkpoint_image
+    
+    fal_api_url = "https://fal.run/fal-ai/fashn/tryon/v1.5"
+    headers = {
+        "Authorization": f"Key {os.environ.get('FAL_API_KEY')}",
+        "Content-Type": "application/json"
+    }
+    
+    processed_items = []
+    
+    for idx, step in enumerate(steps, 1):
+        clothing = step.clothing
+        if idx <= resumed_steps:
+            processed_items.append({
+                "id": clothing["id"],
+                "nome": clothing["nome"],
+                "tipo": clothing["tipo"],
+                "cor": clothing["cor"]
+            })
+            continue
+        
+        logging.info("[TRYON %s/%s] Processing: %s (%s, %s)", idx, len(clothing_items), clothing['nome'], clothing['tipo'], clothing['cor'])
+        
+        # Model image is the base64 body photo or the URL returned by the previous step
+        if not current_image.startswith(("data:image/", "https://")):
+            logging.error("Invalid model image format at step %s", idx)
+            raise HTTPException(status_code=400, detail=f"Erro no formato da imagem na etapa {idx}")
+        
+        if not (clothing.get("imagem_original") or "").startswith("data:image/"):
+            logging.error("Invalid clothing image format: %s", clothing['nome'])
+            raise HTTPException(status_code=400, detail=f"Erro no formato da imagem da roupa: {clothing['nome']}")
+        
+        # Prepare API payload
+        payload = {
+            "model_image": current_image,  # Current image (user photo or previous result)
+            "garment_image": clothing["imagem_original"],
+            "description": step.description,
+            "category": step.category  # Categoria da API (tops/bottoms/one-pieces/auto)
+        }
+        
+        logging.info("[TRYON %s/%s] Calling Fal.ai API...", idx, len(clothing_items))
+        
+        try:
+            # Make API call within the provider concurrency limit. Each generation is billed,
+            # so it is only resent when fal.ai never got it (connect error or 429)
+            api_response = await resilient_call(
+                "fal.ai", lambda: fal_tryon_request(fal_api_url, payload, headers, idx, step.category),
+                idempotent=False
+            )
+            
+            if api_response.status_code == 200:
+                fal_result = api_response.json()
+                logging.info("[TRYON %s/%s] Success! Response keys: %s", idx, len(clothing_items), list(fal_result.keys()))
+                
+                # Extract generated image URL
+                generated_image = None
+                
+                if "images" in fal_result and len(fal_result["images"]) > 0:
+                    generated_image = fal_result["images"][0]["url"]
+                elif "data" in fal_result and "url" in fal_result["data"]:
+                    generated_image = fal_result["data"]["url"]
+                elif "image" in fal_result:
+                    if isinstance(fal_result["image"], dict):
+                        generated_image = fal_result["image"].get("url")
+                    elif isinstance(fal_result["image"], str):
+                        generated_image = fal_result["image"]
+                elif "url" in fal_result:
+                    generated_image = fal_result["url"]
+                
+                if not generated_image:
+                    logging.error("[TRYON %s/%s] Could not extract image from response", idx, len(clothing_items))
+                    raise HTTPException(status_code=500, detail=f"Erro ao processar peça {idx}: {clothing['nome']}")
+                
+                # Chain the provider-hosted result straight into the next step
+                current_image = generated_image
+                
+                processed_items.append({
+                    "id": clothing["id"],
+                    "nome": clothing["nome"],
+                    "tipo": clothing["tipo"],
+                    "cor": clothing["cor"]
+                })
+                
+                await save_checkpoint(db.tryon_checkpoints, user_id, body_hash, garment_ids[:idx], current_image)
+                
+                logging.info("[TRYON %s/%s] ✅ Complete!", idx, len(clothing_items))
+            
+            else:
+                logging.error("[TRYON %s/%s] API error: %s - %.200s", idx, len(clothing_items), api_response.status_code, api_response.text)
+                raise HTTPException(
+                    status_code=500, 
+                    detail=f"Erro na API Fal.ai ao processar peça {idx}: {clothing['nome']}"
+                )
+        
+        except TransientProviderError as e:
+            logging.error("[TRYON %s/%s] API error after retries: %s", idx, len(clothing_items), e.status_code)
+            raise HTTPException(
+                status_code=500, 
+                detail=f"Erro na API Fal.ai ao processar peça {idx}: {clothing['nome']}"
+            )
+        except CircuitOpenError as e:
+            logging.warning("[TRYON %s/%s] Fal.ai circuit open", idx, len(clothing_items))
+            raise HTTPException(
+                status_code=503,
+                detail="Serviço de geração de looks temporariamente indisponível. Tente novamente em instantes.",
+                headers={"Retry-After": str(math.ceil(e.retry_after))}
+            )
+        except ProviderSaturated as e:
+            logging.warning("[TRYON %s/%s] Fal.ai saturated: %s", idx, len(clothing_items), e.reason)
+            raise HTTPException(
+                status_code=503,
+                detail=f"Muitas gerações em andamento. Tente novamente em cerca de {math.ceil(e.estimated_wait)} segundos.",
+                headers={"Retry-After": str(math.ceil(e.estimated_wait))}
+            )
+        except requests.exceptions.Timeout:
+            logging.error("[TRYON %s/%s] Timeout", idx, len(clothing_items))
+            raise HTTPException(status_code=504, detail=f"Timeout ao processar peça {idx}: {clothing['nome']}")
+        except requests.exceptions.RequestException as e:
+            logging.error("[TRYON %s/%s] Request error: %s", idx, len(clothing_items), e)
+            raise HTTPException(status_code=500, detail=f"Erro de conexão ao processar peça {idx}")
+    
+    if current_image.startswith("data:image/"):
+        # Resultado já veio inline (ou nenhuma etapa precisou rodar)
+        return current_image, None, processed_items
+    
+    # Only the final image is downloaded
+    result_url = current_image
+    try:
+        image_response = await resilient_call("fal.ai", lambda: fal_download_image(result_url))
+    except TransientProviderError as e:
+        logging.error("[TRYON] Final image download failed after retries: %s", e.status_code)
+        raise HTTPException(status_code=500, detail="Erro ao baixar a imagem do look gerado")
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Serviço de geração de looks temporariamente indisponível. Tente novamente em instantes.",
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+    except httpx.TimeoutException:
+        logging.error("[TRYON] Timeout downloading final image")
+        raise HTTPException(status_code=504, detail="Timeout ao baixar a imagem do look gerado")
+    except httpx.HTTPError as e:
+        logging.error("[TRYON] Error downloading final image: %s", e)
+        raise HTTPException(status_code=500, detail="Erro ao baixar a imagem do look gerado")
+    
+    if image_response.status_code != 200:
+        logging.error("[TRYON] Failed to download final image: %s", image_response.status_code)
+        raise HTTPException(status_code=500, detail="Erro ao baixar a imagem do look gerado")
+    
+    with span("tryon.encode_base64", bytes=len(image_response.content)):
+        content_type = image_response.headers.get("content-type", "image/png").split(";")[0]
+        if not content_type.startswith("image/"):
+            content_type = "image/png"
+        image_base64 = base64.b64encode(image_response.content).decode('utf-8')
+        final_image = f"data:{content_type};base64,{image_base64}"
+    logging.info("[TRYON] Downloaded final image (%s bytes)", len(image_response.content))
     
-    return {"message": "Foto do corpo atualizada com sucesso"}
+    return final_image, result_url, processed_items
+
 
 # Virtual Try-on route
 @api_router.post("/gerar-look-visual")
 async def gerar_look_visual(
     roupa_ids: List[str] = Form(...),
+    incluir_imagem: bool = Form(True),  # False: sem a imagem inline, só tryon_result_url
     current_user=Depends(security)
 ):
     try:
         user = await get_current_user(current_user)
-        logging.info(f"Generating visual look for user: {user['id']}")
+        logging.info("Generating visual look for user: %s", user['id'])
         
         # Check subscription/plan limits
-        looks_usados = user.get("looks_usados", 0)
         plano_ativo = user.get("plano_ativo", "free")
         data_expiracao = user.get("data_expiracao_plano")
         
@@ -405,32 +758,26 @@ async def gerar_look_visual(
                 tem_plano_ativo = True
             else:
                 # Plan expired, reset to free
-                await db.users.update_one(
-                    {"id": user["id"]},
-                    {"$set": {"plano_ativo": "free", "data_expiracao_plano": None}}
-                )
+                await users_repo.expire_plan(user["id"])
                 plano_ativo = "free"
         
-        # Check if free user exceeded limit
-        if plano_ativo == "free" and looks_usados >= 5:
+        # Fast path: reject without touching the wardrobe if the quota is already used up
+        # (the authoritative check is the atomic reservation below)
+        if remaining_quota(user, plano_ativo, LOOKS_QUOTA) == 0:
             raise HTTPException(
                 status_code=403, 
-                detail="Você atingiu o limite de 5 looks gratuitos. Assine um plano para continuar usando!"
+                detail=f"Você atingiu o limite de {LOOKS_QUOTA.limit_for(plano_ativo)} looks gratuitos. Assine um plano para continuar usando!"
             )
         
         # Get user's body photo
-        if not user.get("foto_corpo"):
+        foto = await users_repo.get_body_photo(user["id"])
+        if not foto.data_uri:
             raise HTTPException(status_code=400, detail="Você precisa fazer upload da sua foto do corpo primeiro no perfil.")
         
         # Get selected clothing items
-        clothing_items = []
-        for roupa_id in roupa_ids:
-            roupa = await db.clothing_items.find_one({
-                "id": roupa_id,
-                "user_id": user["id"]
-            })
-            if roupa:
-                clothing_items.append(roupa)
+        with span("tryon.fetch_garments", garments_requested=len(roupa_ids)):
+            clothing_items = await clothing_repo.get_many(user["id"], roupa_ids)
+            await hydrate_images(db.image_blobs, clothing_items)
         
         if not clothing_items:
             raise HTTPException(status_code=400, detail="Nenhuma roupa válida selecionada.")
@@ -442,197 +789,111 @@ async def gerar_look_visual(
                 detail="Limite de 3 peças de roupa por look. Selecione no máximo 3 itens."
             )
         
-        logging.info(f"Processing {len(clothing_items)} clothing items for sequential try-on")
+        # Order garments by layer and drop the ones fal.ai can't render
+        plan = plan_tryon(clothing_items)
+        if not plan.steps:
+            raise HTTPException(
+                status_code=400,
+                detail="Selecione ao menos uma roupa que possa ser provada. Calçados e acessórios não são aplicados no look visual."
+            )
+        if plan.skipped:
+            logging.info("Try-on plan skipped %s items: %s", len(plan.skipped), [item['motivo'] for item in plan.skipped])
         
-        # Sequential try-on: apply each garment one by one
-        current_image = user["foto_corpo"]  # Start with user's body photo
+        logging.info("Processing %s clothing items for sequential try-on", len(plan.steps))
         
-        import requests
-        fal_api_url = "https://fal.run/fal-ai/fashn/tryon/v1.5"
-        headers = {
-            "Authorization": f"Key {os.environ.get('FAL_API_KEY')}",
-            "Content-Type": "application/json"
-        }
+        # Reserve one unit of the plan quota before any paid external call
+        try:
+            reservation = await reserve_quota(db.users, user["id"], plano_ativo, LOOKS_QUOTA)
+        except QuotaExceeded as e:
+            raise HTTPException(
+                status_code=403, 
+                detail=f"Você atingiu o limite de {e.limit} looks gratuitos. Assine um plano para continuar usando!"
+            )
         
-        processed_items = []
+        # Sequential try-on: apply each garment one by one
+        # (se nenhum look for entregue, a unidade reservada é devolvida ao sair do bloco)
+        async with reservation:
+            current_image, result_url, processed_items = await run_tryon_chain(user["id"], foto.data_uri, plan.steps, foto.sha256)
         
-        for idx, clothing in enumerate(clothing_items, 1):
-            logging.info(f"[TRYON {idx}/{len(clothing_items)}] Processing: {clothing['nome']} ({clothing['tipo']}, {clothing['cor']})")
-            
-            # Verify images are base64 format
-            if not current_image.startswith("data:image/"):
-                logging.error(f"Invalid model image format at step {idx}")
-                raise HTTPException(status_code=400, detail=f"Erro no formato da imagem na etapa {idx}")
-            
-            if not clothing.get("imagem_original", "").startswith("data:image/"):
-                logging.error(f"Invalid clothing image format: {clothing['nome']}")
-                raise HTTPException(status_code=400, detail=f"Erro no formato da imagem da roupa: {clothing['nome']}")
-            
-            # Mapear tipos em português para descrições em inglês (para description)
-            garment_type_description = {
-                "camiseta": "t-shirt",
-                "camisa": "shirt",
-                "blusa": "blouse",
-                "calca": "pants",
-                "jeans": "jeans",
-                "short": "shorts",
-                "saia": "skirt",
-                "vestido": "dress",
-                "jaqueta": "jacket",
-                "casaco": "coat",
-                "moletom": "hoodie",
-                "tenis": "sneakers",
-                "sapato": "shoes",
-                "sandalia": "sandals",
-                "bota": "boots",
-                "bone": "cap",
-                "chapeu": "hat",
-                "oculos": "sunglasses",
-                "relogio": "watch",
-                "bolsa": "bag",
-                "colar": "necklace",
-                "pulseira": "bracelet"
-            }
-            
-            # Mapear para categorias da API Fal.ai (tops, bottoms, one-pieces, auto)
-            garment_category_map = {
-                "camiseta": "tops",
-                "camisa": "tops",
-                "blusa": "tops",
-                "jaqueta": "tops",
-                "casaco": "tops",
-                "moletom": "tops",
-                "calca": "bottoms",
-                "jeans": "bottoms",
-                "short": "bottoms",
-                "saia": "bottoms",
-                "vestido": "one-pieces",
-                "tenis": "bottoms",
-                "sapato": "bottoms",
-                "sandalia": "bottoms",
-                "bota": "bottoms",
-                "bone": "auto",
-                "chapeu": "auto",
-                "oculos": "auto",
-                "relogio": "auto",
-                "bolsa": "auto",
-                "colar": "auto",
-                "pulseira": "auto"
-            }
-            
-            # Obter tipo em inglês para descrição
-            garment_type_en = garment_type_description.get(clothing['tipo'].lower(), clothing['tipo'])
-            # Obter categoria da API
-            garment_category = garment_category_map.get(clothing['tipo'].lower(), "auto")
-            
-            # Criar descrição detalhada para melhor reconhecimento
-            description = f"{clothing['cor']} {garment_type_en}"
-            if clothing.get('nome'):
-                description = f"{description} - {clothing['nome']}"
-            
-            # Prepare API payload
-            payload = {
-                "model_image": current_image,  # Current image (user photo or previous result)
-                "garment_image": clothing["imagem_original"],
-                "description": description,
-                "category": garment_category  # Usar categoria da API (tops/bottoms/one-pieces/auto)
-            }
-            
-            logging.info(f"[TRYON {idx}/{len(clothing_items)}] Calling Fal.ai API...")
-            
-            try:
-                # Make API call
-                api_response = requests.post(fal_api_url, json=payload, headers=headers, timeout=60)
-                
-                if api_response.status_code == 200:
-                    fal_result = api_response.json()
-                    logging.info(f"[TRYON {idx}/{len(clothing_items)}] Success! Response keys: {list(fal_result.keys())}")
-                    
-                    # Extract generated image URL
-                    generated_image = None
-                    
-                    if "images" in fal_result and len(fal_result["images"]) > 0:
-                        generated_image = fal_result["images"][0]["url"]
-                    elif "data" in fal_result and "url" in fal_result["data"]:
-                        generated_image = fal_result["data"]["url"]
-                    elif "image" in fal_result:
-                        if isinstance(fal_result["image"], dict):
-                            generated_image = fal_result["image"].get("url")
-                        elif isinstance(fal_result["image"], str):
-                            generated_image = fal_result["image"]
-                    elif "url" in fal_result:
-                        generated_image = fal_result["url"]
-                    
-                    if not generated_image:
-                        logging.error(f"[TRYON {idx}/{len(clothing_items)}] Could not extract image from response")
-                        raise HTTPException(status_code=500, detail=f"Erro ao processar peça {idx}: {clothing['nome']}")
-                    
-                    # Download the image and convert to base64 for next iteration
-                    import base64
-                    image_response = requests.get(generated_image, timeout=30)
-                    if image_response.status_code == 200:
-                        # Convert to base64 data URI
-                        image_base64 = base64.b64encode(image_response.content).decode('utf-8')
-                        current_image = f"data:image/png;base64,{image_base64}"
-                        logging.info(f"[TRYON {idx}/{len(clothing_items)}] Downloaded and converted image to base64 ({len(current_image)} chars)")
-                    else:
-                        logging.error(f"[TRYON {idx}/{len(clothing_items)}] Failed to download image")
-                        raise HTTPException(status_code=500, detail=f"Erro ao baixar imagem da peça {idx}")
-                    
-                    processed_items.append({
-                        "id": clothing["id"],
-                        "nome": clothing["nome"],
-                        "tipo": clothing["tipo"],
-                        "cor": clothing["cor"]
-                    })
-                    
-                    logging.info(f"[TRYON {idx}/{len(clothing_items)}] ✅ Complete!")
-                    
-                else:
-                    logging.error(f"[TRYON {idx}/{len(clothing_items)}] API error: {api_response.status_code} - {api_response.text}")
-                    raise HTTPException(
-                        status_code=500, 
-                        detail=f"Erro na API Fal.ai ao processar peça {idx}: {clothing['nome']}"
-                    )
-                    
-            except requests.exceptions.Timeout:
-                logging.error(f"[TRYON {idx}/{len(clothing_items)}] Timeout")
-                raise HTTPException(status_code=504, detail=f"Timeout ao processar peça {idx}: {clothing['nome']}")
-            except requests.exceptions.RequestException as e:
-                logging.error(f"[TRYON {idx}/{len(clothing_items)}] Request error: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"Erro de conexão ao processar peça {idx}")
+        # Guardar o resultado para o app salvar o look só com o id
+        result_id = await save_result(db.tryon_results, user["id"], current_image, roupa_ids)
         
         # All items processed successfully!
-        logging.info(f"✅ All {len(clothing_items)} items processed successfully!")
+        logging.info("✅ All %s items processed successfully!", len(processed_items))
         
         # current_image now contains the result with all garments applied
         result = {
-            "message": f"Look gerado com sucesso com {len(clothing_items)} {'peça' if len(clothing_items) == 1 else 'peças'}!",
+            "message": f"Look gerado com sucesso com {len(processed_items)} {'peça' if len(processed_items) == 1 else 'peças'}!",
             "clothing_items": processed_items,
-            "tryon_image": current_image,  # Final result with all garments
+            "skipped_items": plan.skipped,  # Selected but not rendered (shoes, accessories, covered pieces)
+            # Inline by default (existing clients); incluir_imagem=false leaves only tryon_result_url
+            "tryon_image": current_image if incluir_imagem or result_id is None else None,
+            "tryon_image_url": result_url,  # Fal.ai-hosted copy of the result (temporary)
+            "tryon_result_id": result_id,  # Send to POST /looks instead of the image
+            "tryon_result_url": f"/api/tryon/resultados/{result_id}/imagem" if result_id else None,
             "status": "success",
-            "note": f"Try-on virtual com {len(clothing_items)} peças criado com IA!",
+            "note": f"Try-on virtual com {len(processed_items)} peças criado com IA!",
             "api_used": "fal.ai-fashn-sequential"
         }
         
-        # Increment user's looks counter (only once, not per garment)
-        await db.users.update_one(
-            {"id": user["id"]},
-            {"$inc": {"looks_usados": 1}}
-        )
-        
-        logging.info(f"Incremented looks counter for user {user['id']}: {looks_usados + 1}/{5 if plano_ativo == 'free' else 'unlimited'}")
-        logging.info(f"Virtual try-on completed for {len(clothing_items)} items")
+        logging.info("Looks counter for user %s: %s/%s", user['id'], reservation.used, LOOKS_QUOTA.limit_for(plano_ativo) or 'unlimited')
+        logging.info("Virtual try-on completed for %s items", len(processed_items))
         
         return result
         
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"Error in virtual try-on: {str(e)}")
+        logging.error("Error in virtual try-on: %s", e)
         raise HTTPException(status_code=500, detail=f"Erro ao gerar look: {str(e)}")
 
 # Clothing routes
+async def similarity_index(user: dict) -> SimilarityIndex:
+    """Índice de embeddings do usuário, reconstruído só quando o guarda-roupa muda"""
+    version = user.get("roupas_versao", 0)
+    index = similarity_index_cache.get((user["id"], version))
+    if index is None:
+        index = SimilarityIndex(await clothing_repo.embeddings(user["id"]))
+        similarity_index_cache.put((user["id"], version), index)
+    return index
+
+async def save_clothing_item(user: dict, dados: dict, imagem: UploadedImage) -> Tuple[ClothingItem, Optional[dict]]:
+    """Cadastra a roupa; devolve também a peça já cadastrada quase idêntica, se houver"""
+    clothing_dict = dict(dados)
+    clothing_dict["user_id"] = user["id"]
+    clothing_dict["imagem_hash"] = imagem.sha256
+    # Identical photos share one stored blob (reference counted)
+    clothing_dict["imagem_blob_id"] = await store_blob(db.image_blobs, user["id"], imagem)
+    try:
+        clothing_dict["cores_dominantes"] = await asyncio.to_thread(dominant_colors, imagem.data)
+        # b"" marca imagem que não pôde ser analisada (fora do backfill e do índice)
+        clothing_dict["embedding"] = await asyncio.to_thread(embed_image, imagem.data) or b""
+        
+        duplicata = None
+        if clothing_dict["embedding"]:
+            index = await similarity_index(user)
+            match = index.top_k(unpack_embedding(clothing_dict["embedding"]), 1)
+            if match and match[0][1] >= DUPLICATE_SIMILARITY:
+                duplicata = {"id": match[0][0], "similaridade": match[0][1]}
+        clothing_dict.update(garment_fields(clothing_dict["tipo"]))
+        
+        clothing = ClothingItem(**clothing_dict)
+        await clothing_repo.insert(clothing.dict())
+    except BaseException:
+        # The blob reference was taken before the insert: give it back
+        await release_blob(db.image_blobs, clothing_dict["imagem_blob_id"])
+        raise
+    
+    await refresh_counter(db, user["id"], ROUPAS)
+    await users_repo.bump_wardrobe_version(user["id"])
+    
+    logging.info(
+        "Upload roupa - User: %s, item: %s, image size: %d",
+        user["id"], clothing.id, imagem.size,
+        extra={"sample": True},
+    )
+    return clothing, duplicata
+
 @api_router.post("/upload-roupa")
 async def upload_roupa(
     roupa_data: ClothingItemCreate,
@@ -640,22 +901,40 @@ async def upload_roupa(
 ):
     try:
         user = await get_current_user(current_user)
-        logging.info(f"Upload roupa - User: {user['id']}")
-        
-        # Create clothing item
-        clothing_dict = roupa_data.dict()
-        clothing_dict["user_id"] = user["id"]
         
-        logging.info(f"Upload roupa - Image size: {len(roupa_data.imagem_original) if roupa_data.imagem_original else 0}")
+        # Formato antigo: imagem em data URI base64 no JSON
+        imagem = decode_data_uri(roupa_data.imagem_original)
+        clothing, duplicata = await save_clothing_item(user, roupa_data.dict(exclude={"imagem_original"}), imagem)
         
-        clothing = ClothingItem(**clothing_dict)
-        result = await db.clothing_items.insert_one(clothing.dict())
+        return {"message": "Roupa cadastrada com sucesso", "id": clothing.id, "possivel_duplicata": duplicata}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error("Error in upload_roupa: %s", e)
+        raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
+
+@api_router.post("/upload-roupa-arquivo")
+async def upload_roupa_arquivo(
+    tipo: str = Form(...),
+    cor: str = Form(...),
+    estilo: str = Form(...),
+    nome: str = Form(...),
+    arquivo: UploadFile = File(...),
+    current_user=Depends(security)
+):
+    """Mesmo cadastro de /upload-roupa, com a imagem em multipart em vez de base64"""
+    try:
+        user = await get_current_user(current_user)
         
-        logging.info(f"Upload roupa - Inserted with ID: {result.inserted_id}")
+        imagem = await read_upload(arquivo)
+        dados = {"tipo": tipo, "cor": cor, "estilo": estilo, "nome": nome}
+        clothing, duplicata = await save_clothing_item(user, dados, imagem)
         
-        return {"message": "Roupa cadastrada com sucesso", "id": clothing.id}
+        return {"message": "Roupa cadastrada com sucesso", "id": clothing.id, "possivel_duplicata": duplicata}
+    except HTTPException:
+        raise
     except Exception as e:
-        logging.error(f"Error in upload_roupa: {str(e)}")
+        logging.error("Error in upload_roupa_arquivo: %s", e)
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
 @api_router.get("/roupas")
@@ -667,13 +946,11 @@ async def get_roupas(
     user = await get_current_user(current_user)
     
     # Get total count for pagination info
-    total = await db.clothing_items.count_documents({"user_id": user["id"]})
+    total = await clothing_repo.count(user["id"])
     
     # Get paginated results
-    roupas = await db.clothing_items.find(
-        {"user_id": user["id"]}, 
-        {"_id": 0}
-    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    roupas = await clothing_repo.list_page(user["id"], skip, limit)
+    await hydrate_images(db.image_blobs, roupas)
     
     return {
         "items": roupas,
@@ -683,21 +960,180 @@ async def get_roupas(
         "has_more": (skip + limit) < total
     }
 
+@api_router.get("/roupas/search")
+async def search_roupas(
+    tipo: Optional[str] = None,
+    categoria: Optional[str] = None,
+    cor: Optional[str] = None,
+    estilo: Optional[str] = None,
+    prefixo: Optional[str] = None,  # início do nome
+    q: Optional[str] = None,  # palavras do nome (índice de texto)
+    skip: int = 0,
+    limit: int = 20,
+    current_user=Depends(security)
+):
+    """
+    Roupas filtradas no servidor (consultas indexadas) e contagens por tipo e
+    cor de todo o guarda-roupa para montar os filtros
+    """
+    user = await get_current_user(current_user)
+    
+    query = build_wardrobe_filter(user["id"], tipo, categoria, cor, estilo, prefixo, q)
+    total, roupas = await clothing_repo.search(query, skip, limit)
+    await hydrate_images(db.image_blobs, roupas)
+    
+    version = user.get("roupas_versao", 0)
+    facets = facet_cache.get((user["id"], version))
+    if facets is None:
+        facets = await clothing_repo.facet_counts(user["id"])
+        facet_cache.put((user["id"], version), facets)
+    
+    return {
+        "items": roupas,
+        "total": total,
+        "skip": skip,
+        "limit": limit,
+        "has_more": (skip + limit) < total,
+        "facets": facets
+    }
+
+@api_router.get("/roupas/combinacoes")
+async def get_combinacoes(limite: int = 10, current_user=Depends(security)):
+    """
+    Melhores combinações do guarda-roupa pela harmonia de cores e estilos,
+    pontuando todas as combinações possíveis de uma vez
+    """
+    user = await get_current_user(current_user)
+    
+    harmony = await wardrobe_harmony(user)
+    with span("wardrobe.score_outfits", garments=len(harmony.ids)):
+        combinacoes = await asyncio.to_thread(harmony.best_outfits, max(1, min(limite, 50)))
+    
+    return {"combinacoes": combinacoes}
+
+@api_router.get("/roupas/{roupa_id}/imagem")
+async def get_roupa_imagem(roupa_id: str, request: Request, current_user=Depends(security)):
+    """Imagem da roupa, para telas que recebem só o resumo das peças"""
+    user = await get_current_user(current_user)
+    
+    refs = await clothing_repo.image_refs(user["id"], [roupa_id])
+    image = await stored_image(refs[0].get("imagem_blob_id"), refs[0].get("imagem_original")) if refs else None
+    if image is None:
+        raise HTTPException(status_code=404, detail="Imagem da roupa não encontrada")
+    
+    return image_response(request, image.data, image.content_type, image.sha256)
+
+@api_router.get("/roupas/{roupa_id}/similares")
+async def get_roupas_similares(roupa_id: str, limite: int = 6, current_user=Depends(security)):
+    """Roupas do usuário visualmente mais parecidas com a peça (cosseno entre embeddings)"""
+    user = await get_current_user(current_user)
+    
+    index = await similarity_index(user)
+    vector = index.vector(roupa_id)
+    if vector is None:
+        if await clothing_repo.owner_of(roupa_id) != user["id"]:
+            raise HTTPException(status_code=404, detail="Roupa não encontrada")
+        return {"items": []}  # peça sem embedding (imagem ilegível ou backfill pendente)
+    
+    with span("wardrobe.similar_items", garments=len(index)):
+        matches = index.top_k(vector, max(1, min(limite, 50)), exclude=roupa_id)
+    
+    roupas = await clothing_repo.get_many(user["id"], [item_id for item_id, _ in matches])
+    await hydrate_images(db.image_blobs, roupas)
+    similaridade = dict(matches)
+    for roupa in roupas:
+        roupa["similaridade"] = similaridade[roupa["id"]]
+    
+    return {"items": roupas}
+
 @api_router.delete("/roupas/{roupa_id}")
 async def delete_roupa(roupa_id: str, current_user=Depends(security)):
     user = await get_current_user(current_user)
     
-    result = await db.clothing_items.delete_one({
-        "id": roupa_id,
-        "user_id": user["id"]
-    })
+    roupa = await clothing_repo.delete(user["id"], roupa_id)
     
-    if result.deleted_count == 0:
+    if roupa is None:
         raise HTTPException(status_code=404, detail="Roupa não encontrada")
     
+    await refresh_counter(db, user["id"], ROUPAS)
+    await users_repo.bump_wardrobe_version(user["id"])
+    
+    # The image is only deleted when no other item references it
+    if roupa.get("imagem_blob_id"):
+        await release_blob(db.image_blobs, roupa["imagem_blob_id"])
+    
+    # Capas dos looks que mostravam a peça removida
+    for look_id in await looks_repo.ids_with_clothing(user["id"], roupa_id):
+        schedule_cover_refresh(user["id"], look_id)
+    
     return {"message": "Roupa removida com sucesso"}
 
 # Look generation routes
+async def wardrobe_harmony(user: dict) -> WardrobeHarmony:
+    """Matriz de harmonia do guarda-roupa, refeita só quando ele muda (roupas_versao)"""
+    version = user.get("roupas_versao", 0)
+    harmony = harmony_cache.get((user["id"], version))
+    if harmony is None:
+        roupas = await clothing_repo.color_profiles(user["id"])
+        harmony = await asyncio.to_thread(WardrobeHarmony.from_clothing, roupas)
+        harmony_cache.put((user["id"], version), harmony)
+    return harmony
+
+async def harmony_score(user: dict, roupas_ids: List[str]) -> Optional[float]:
+    """Pontuação da combinação; a sugestão não depende dela, então falhas só vão para o log"""
+    try:
+        return (await wardrobe_harmony(user)).score([roupas_ids])[0]
+    except Exception as e:
+        logging.warning("Harmonia da sugestão indisponível: %s", e)
+        return None
+
+async def best_outfit_ids(user: dict) -> List[str]:
+    try:
+        best = await asyncio.to_thread((await wardrobe_harmony(user)).best_outfits, 1)
+    except Exception as e:
+        logging.warning("Melhor combinação indisponível: %s", e)
+        return []
+    return best[0]["roupas_ids"] if best else []
+
+async def embed_texts(texts: List[str]) -> List[List[float]]:
+    async def request_embeddings():
+        with track_external("openai", "embeddings"):
+            return await openai_client.embeddings.create(
+                model=RETRIEVAL_EMBEDDING_MODEL,
+                input=texts,
+                dimensions=RETRIEVAL_EMBEDDING_DIMENSIONS,
+                timeout=8
+            )
+    
+    # Embeddings have no side effects, so they are safe to retry
+    response = await resilient_call("openai.embeddings", request_embeddings)
+    return [item.embedding for item in response.data]
+
+async def relevant_clothing(user: dict, roupas: List[ClothingSummary], consulta: str) -> List[ClothingSummary]:
+    """As SUGGESTION_TOP_K peças mais relevantes para o pedido (garment_retrieval), por relevância"""
+    if len(roupas) <= SUGGESTION_TOP_K:
+        return roupas
+    
+    version = user.get("roupas_versao", 0)
+    index = text_index_cache.get((user["id"], version))
+    query = query_cache.get(text_hash(consulta))
+    if index is None:
+        # Embeddings faltantes (ou de descrições alteradas) e o do pedido numa chamada só
+        stored = await clothing_repo.text_embeddings(user["id"])
+        index, updates, extra = await build_text_index(roupas, stored, embed_texts, [consulta] if query is None else [])
+        if updates:
+            await clothing_repo.set_text_embeddings(updates)
+        text_index_cache.put((user["id"], version), index)
+        if query is None:
+            query = extra[0]
+            query_cache.put(text_hash(consulta), query)
+    elif query is None:
+        query = (await embed_batched(embed_texts, [consulta]))[0]
+        query_cache.put(text_hash(consulta), query)
+    
+    by_id = {roupa.id: roupa for roupa in roupas}
+    return [by_id[item_id] for item_id in index.select(query) if item_id in by_id]
+
 @api_router.post("/sugerir-look")
 async def sugerir_look(
     ocasiao: str = Form(...),
@@ -708,20 +1144,30 @@ async def sugerir_look(
     user = await get_current_user(current_user)
     
     # Get user's clothing items
-    roupas = await db.clothing_items.find({"user_id": user["id"]}).to_list(1000)
+    roupas = await clothing_repo.summaries(user["id"])
     
     if not roupas:
         raise HTTPException(status_code=400, detail="Você precisa cadastrar roupas primeiro")
     
+    # Only the most relevant items go into the prompt, so its size stays flat for big wardrobes
+    candidatas = roupas
+    try:
+        with span("sugerir_look.retrieve", garments=len(roupas)):
+            candidatas = await relevant_clothing(user, roupas, query_text(ocasiao, temperatura, detalhes_contexto))
+    except Exception as e:
+        logging.warning("Pré-seleção das roupas indisponível, enviando o guarda-roupa inteiro: %s", e)
+    
     # Prepare context for AI
     roupas_context = []
-    for roupa in roupas:
+    for roupa in candidatas:
+        garment = lookup_garment(roupa.tipo)
         roupas_context.append({
-            "id": roupa["id"],
-            "tipo": roupa["tipo"],
-            "cor": roupa["cor"],
-            "estilo": roupa["estilo"],
-            "nome": roupa["nome"]
+            "id": roupa.id,
+            "tipo": garment.key if garment else roupa.tipo,
+            "categoria": garment.category_label if garment else "outro",
+            "cor": roupa.cor,
+            "estilo": roupa.estilo,
+            "nome": roupa.nome
         })
     
     # Create list of valid IDs for the prompt
@@ -759,21 +1205,27 @@ async def sugerir_look(
     
     try:
         # Call OpenAI API directly
-        completion = await openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Você é um personal stylist virtual especializado em combinações de roupas."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.7,
-            max_tokens=1000
-        )
+        async def request_completion():
+            with track_external("openai", "chat.completions"):
+                return await openai_client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[
+                        {
+                            "role": "system",
+                            "content": "Você é um personal stylist virtual especializado em combinações de roupas."
+                        },
+                        {
+                            "role": "user",
+                            "content": prompt
+                        }
+                    ],
+                    temperature=0.7,
+                    max_tokens=1000,
+                    timeout=30
+                )
+        
+        # Completions have no side effects, so they are safe to retry
+        completion = await resilient_call("openai.chat", request_completion)
         
         response = completion.choices[0].message.content
         
@@ -788,16 +1240,21 @@ async def sugerir_look(
             clean_response = clean_response.strip()
             
             ai_response = json.loads(clean_response)
+            roupas_ids = ai_response.get("roupas_ids", [])
             return {
                 "sugestao_texto": ai_response.get("sugestao_texto", ""),
-                "roupas_ids": ai_response.get("roupas_ids", []),
+                "roupas_ids": roupas_ids,
                 "dicas": ai_response.get("dicas", ""),
                 "ocasiao": ocasiao,
-                "temperatura": temperatura
+                "temperatura": temperatura,
+                "harmonia": await harmony_score(user, roupas_ids)
             }
         except json.JSONDecodeError:
             # If JSON parsing fails, create a formatted response from the raw text
-            logging.warning(f"Failed to parse JSON response: {response[:200]}...")
+            logging.warning("Failed to parse JSON response: %.200s...", response)
+            
+            # Fallback: the best-scoring combination of the wardrobe (or the first 3 items)
+            fallback_ids = await best_outfit_ids(user) or [roupa.id for roupa in roupas[:3]]
             
             # Clean up the raw response to make it more readable
             clean_response = response.strip()
@@ -815,23 +1272,132 @@ async def sugerir_look(
             else:
                 # Create a basic suggestion based on available clothes
                 if roupas:
-                    selected_clothes = roupas[:3]  # Take first 3 items
-                    clothes_names = [r["nome"] for r in selected_clothes]
+                    nomes = {roupa.id: roupa.nome for roupa in roupas}
+                    clothes_names = [nomes[roupa_id] for roupa_id in fallback_ids]
                     formatted_text = f"Para a ocasião '{ocasiao}', recomendo combinar: {', '.join(clothes_names)}. Essas peças criam um look harmonioso e adequado para a situação."
                 
             return {
                 "sugestao_texto": formatted_text,
-                "roupas_ids": [roupa["id"] for roupa in roupas[:3]],  # Fallback
+                "roupas_ids": fallback_ids,
                 "dicas": "Lembre-se de ajustar os acessórios conforme a ocasião e considere o conforto além do estilo.",
                 "ocasiao": ocasiao,
                 "temperatura": temperatura
             }
             
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Sugestões temporariamente indisponíveis. Tente novamente em instantes.",
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
     except Exception as e:
-        logging.error(f"Error in AI suggestion: {str(e)}")
+        logging.error("Error in AI suggestion: %s", e)
         raise HTTPException(status_code=500, detail="Erro ao gerar sugestão de look")
 
 # Look management routes
+def data_uri_bytes(value: Optional[str]) -> Optional[bytes]:
+    if not value or not value.startswith("data:image/"):
+        return None
+    try:
+        return base64.b64decode(value.partition(",")[2])
+    except ValueError:
+        return None
+
+async def refresh_look_cover(user_id: str, look_id: str):
+    """Renderiza e salva a capa do look a partir da imagem do try-on ou das peças"""
+    look = await looks_repo.get_cover_sources(user_id, look_id)
+    if look is None:
+        return
+    garments = await clothing_repo.image_refs(user_id, look["roupas_ids"][:look_covers.GRID_MAX_ITEMS])
+    blobs = await load_blob_bytes(
+        db.image_blobs, [look.get("imagem_blob_id")] + [garment.get("imagem_blob_id") for garment in garments]
+    )
+    
+    look_image = blobs.get(look.get("imagem_blob_id")) or data_uri_bytes(look.get("imagem_look"))
+    garment_images = [
+        blobs.get(garment.get("imagem_blob_id")) or data_uri_bytes(garment.get("imagem_original"))
+        for garment in garments
+    ]
+    
+    with span("looks.render_cover", garments=len(garments), has_look_image=look_image is not None):
+        data = await look_covers.render_in_pool(look_image, [image for image in garment_images if image])
+    if data is None:
+        await looks_repo.set_cover_hash(user_id, look_id, None)
+        await look_covers.delete_cover(db.look_covers, look_id)
+        return
+    
+    capa_hash = await look_covers.save_cover(db.look_covers, user_id, look_id, data)
+    if not await looks_repo.set_cover_hash(user_id, look_id, capa_hash):
+        # O look foi removido durante a renderização
+        await look_covers.delete_cover(db.look_covers, look_id)
+
+def schedule_cover_refresh(user_id: str, look_id: str, if_idle: bool = False):
+    look_covers.schedule(lambda: refresh_look_cover(user_id, look_id), look_id, if_idle=if_idle)
+
+def add_look_urls(user_id: str, looks: List[dict]):
+    """URLs da capa e da imagem completa; looks antigos, ainda sem capa, ganham uma em segundo plano"""
+    for look in looks:
+        if "capa_hash" not in look:
+            schedule_cover_refresh(user_id, look["id"], if_idle=True)
+        capa_hash = look.get("capa_hash")
+        look["capa_url"] = f"/api/looks/{look['id']}/capa?v={capa_hash}" if capa_hash else None
+        look["imagem_url"] = f"/api/looks/{look['id']}/imagem" if look.pop("tem_imagem", False) else None
+
+async def stored_image(blob_id: Optional[str], data_uri: Optional[str]) -> Optional[UploadedImage]:
+    """Imagem do blob store ou, em documentos antigos, do data URI salvo no próprio documento"""
+    if blob_id:
+        image = await load_blob_image(db.image_blobs, blob_id)
+        if image is not None:
+            return image
+    if data_uri:
+        try:
+            return decode_data_uri(data_uri, max_bytes=len(data_uri))
+        except HTTPException:
+            return None
+    return None
+
+def image_response(request: Request, data: bytes, media_type: str, sha256: str) -> Response:
+    """Imagem imutável: o ETag é o hash do conteúdo (cache longo + 304)"""
+    etag = f'"{sha256}"'
+    cache_headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=cache_headers)
+    return Response(content=data, media_type=media_type, headers=cache_headers)
+
+@api_router.get("/looks/{look_id}/capa")
+async def get_look_capa(look_id: str, request: Request, current_user=Depends(security)):
+    """Miniatura JPEG do look; o ETag é o hash do conteúdo (cache imutável + 304)"""
+    user = await get_current_user(current_user)
+    
+    capa = await look_covers.load_cover(db.look_covers, user["id"], look_id)
+    if capa is None:
+        raise HTTPException(status_code=404, detail="Capa do look não encontrada")
+    
+    return image_response(request, bytes(capa["data"]), "image/jpeg", capa["sha256"])
+
+@api_router.get("/tryon/resultados/{result_id}/imagem")
+async def get_tryon_result_imagem(result_id: str, request: Request, current_user=Depends(security)):
+    """Imagem final de um try-on recente (válida por TRYON_RESULT_TTL)"""
+    user = await get_current_user(current_user)
+    
+    image = await load_result(db.tryon_results, user["id"], result_id)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Resultado do look visual não encontrado ou expirado. Gere o look novamente.")
+    
+    return image_response(request, image.data, image.content_type, image.sha256)
+
+@api_router.get("/looks/{look_id}/imagem")
+async def get_look_imagem(look_id: str, request: Request, current_user=Depends(security)):
+    """Imagem completa do look (try-on), que as listagens não trazem"""
+    user = await get_current_user(current_user)
+    
+    look = await looks_repo.get_image_ref(user["id"], look_id)
+    image = await stored_image(look.get("imagem_blob_id"), look.get("imagem_look")) if look else None
+    if image is None:
+        raise HTTPException(status_code=404, detail="Imagem do look não encontrada")
+    
+    return image_response(request, image.data, image.content_type, image.sha256)
+
 @api_router.post("/looks")
 async def create_look(
     look_data: LookCreate,
@@ -839,35 +1405,52 @@ async def create_look(
 ):
     user = await get_current_user(current_user)
     
-    logging.info(f"Creating look for user {user['id']}")
-    logging.info(f"Look data: {look_data.dict()}")
-    logging.info(f"Roupas IDs to validate: {look_data.roupas_ids}")
+    logging.info(
+        "Creating look for user %s: %s",
+        user["id"], look_data,
+        extra={"sample": True},
+    )
     
     # Validate that all clothing items exist and belong to user
-    for roupa_id in look_data.roupas_ids:
-        logging.info(f"Validating roupa_id: {roupa_id}")
-        roupa = await db.clothing_items.find_one({
-            "id": roupa_id,
-            "user_id": user["id"]
-        })
-        logging.info(f"Found roupa: {roupa is not None}")
-        if not roupa:
-            # Check if the item exists for any user
-            any_roupa = await db.clothing_items.find_one({"id": roupa_id})
-            if any_roupa:
-                logging.error(f"Roupa {roupa_id} exists but belongs to user {any_roupa.get('user_id')}, not {user['id']}")
-            else:
-                logging.error(f"Roupa {roupa_id} does not exist in database")
-            raise HTTPException(status_code=400, detail=f"Roupa {roupa_id} não encontrada")
+    missing = await clothing_repo.missing_ids(user["id"], look_data.roupas_ids)
+    if missing:
+        roupa_id = missing[0]
+        # Check if the item exists for any user
+        owner = await clothing_repo.owner_of(roupa_id)
+        if owner:
+            logging.error("Roupa %s exists but belongs to user %s, not %s", roupa_id, owner, user["id"])
+        else:
+            logging.error("Roupa %s does not exist in database", roupa_id)
+        raise HTTPException(status_code=400, detail=f"Roupa {roupa_id} não encontrada")
     
     # Create look
     look_dict = look_data.dict()
     look_dict["user_id"] = user["id"]
     
+    result_id = look_dict.pop("tryon_result_id")
+    imagem = None
+    if result_id:
+        imagem = await load_result(db.tryon_results, user["id"], result_id)
+        if imagem is None:
+            raise HTTPException(status_code=404, detail="Resultado do look visual não encontrado ou expirado. Gere o look novamente.")
+    elif (look_dict.get("imagem_look") or "").startswith("data:"):
+        # Formato antigo: o app reenvia a imagem em base64; vai para o blob store também
+        imagem = decode_data_uri(look_dict["imagem_look"])
+    if imagem is not None:
+        look_dict["imagem_blob_id"] = await store_blob(db.image_blobs, user["id"], imagem)
+        look_dict["imagem_look"] = None
+    
     look = Look(**look_dict)
-    await db.looks.insert_one(look.dict())
+    try:
+        await looks_repo.insert(look.dict())
+    except BaseException:
+        if look.imagem_blob_id:
+            await release_blob(db.image_blobs, look.imagem_blob_id)
+        raise
+    await refresh_counter(db, user["id"], LOOKS)
+    schedule_cover_refresh(user["id"], look.id)
     
-    logging.info(f"Look created successfully: {look.id}")
+    logging.info("Look created successfully: %s", look.id, extra={"sample": True})
     return {"message": "Look salvo com sucesso", "id": look.id}
 
 @api_router.get("/looks")
@@ -879,13 +1462,36 @@ async def get_looks(
     user = await get_current_user(current_user)
     
     # Get total count for pagination info
-    total = await db.looks.count_documents({"user_id": user["id"]})
+    total = await looks_repo.count(user["id"])
     
     # Get paginated results
-    looks = await db.looks.find(
-        {"user_id": user["id"]},
-        {"_id": 0}
-    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    looks = await looks_repo.list_page(user["id"], skip, limit)
+    add_look_urls(user["id"], looks)
+    
+    return {
+        "items": looks,
+        "total": total,
+        "skip": skip,
+        "limit": limit,
+        "has_more": (skip + limit) < total
+    }
+
+@api_router.get("/looks/completos")
+async def get_looks_completos(
+    skip: int = 0,
+    limit: int = 20,
+    current_user=Depends(security)
+):
+    """Looks paginados já com o resumo de cada roupa (campo `roupas`) e a URL da imagem dela"""
+    user = await get_current_user(current_user)
+    
+    total = await looks_repo.count(user["id"])
+    looks = await looks_repo.list_page_with_clothing(user["id"], skip, limit)
+    
+    for look in looks:
+        for roupa in look["roupas"]:
+            roupa["imagem_url"] = f"/api/roupas/{roupa['id']}/imagem"
+    add_look_urls(user["id"], looks)
     
     return {
         "items": looks,
@@ -900,47 +1506,44 @@ async def get_favoritos_count(current_user=Depends(security)):
     """Retorna a contagem de looks favoritados"""
     user = await get_current_user(current_user)
     
-    # Count looks where favorito = true
-    favoritos_count = await db.looks.count_documents({
-        "user_id": user["id"],
-        "favorito": True
-    })
-    
-    return {"count": favoritos_count}
+    # Contador mantido por toggle_favorite_look / delete_look
+    counters = await read_counters(db, user, [FAVORITOS])
+    return {"count": counters[FAVORITOS.field]}
 
 @api_router.post("/looks/{look_id}/favoritar")
 async def toggle_favorite_look(look_id: str, current_user=Depends(security)):
     user = await get_current_user(current_user)
     
-    look = await db.looks.find_one({
-        "id": look_id,
-        "user_id": user["id"]
-    })
+    # Toggle atômico no servidor (pipeline update): um round trip e sem corrida em toques duplos
+    new_favorite_status = await looks_repo.toggle_favorite(user["id"], look_id)
     
-    if not look:
+    if new_favorite_status is None:
         raise HTTPException(status_code=404, detail="Look não encontrado")
     
-    new_favorite_status = not look.get("favorito", False)
-    
-    await db.looks.update_one(
-        {"id": look_id, "user_id": user["id"]},
-        {"$set": {"favorito": new_favorite_status}}
-    )
+    # Recontado em vez de $inc: uma falha entre as duas escritas não deixa o contador errado de vez
+    await refresh_counter(db, user["id"], FAVORITOS)
     
-    return {"message": f"Look {'adicionado aos' if new_favorite_status else 'removido dos'} favoritos"}
+    return {
+        "message": f"Look {'adicionado aos' if new_favorite_status else 'removido dos'} favoritos",
+        "favorito": new_favorite_status
+    }
 
 @api_router.delete("/looks/{look_id}")
 async def delete_look(look_id: str, current_user=Depends(security)):
     user = await get_current_user(current_user)
     
-    result = await db.looks.delete_one({
-        "id": look_id,
-        "user_id": user["id"]
-    })
+    look = await looks_repo.delete(user["id"], look_id)
     
-    if result.deleted_count == 0:
+    if not look:
         raise HTTPException(status_code=404, detail="Look não encontrado")
     
+    await refresh_counter(db, user["id"], LOOKS)
+    if look.get("favorito"):
+        await refresh_counter(db, user["id"], FAVORITOS)
+    if look.get("imagem_blob_id"):
+        await release_blob(db.image_blobs, look["imagem_blob_id"])
+    await look_covers.delete_cover(db.look_covers, look_id)
+    
     return {"message": "Look removido com sucesso"}
 
 # Subscription/Payment models
@@ -951,6 +1554,11 @@ class SubscriptionResponse(BaseModel):
     client_secret: str
     subscription_id: str
 
+async def execute_google_play_request(request):
+    """Executa uma requisição (somente leitura) da Android Publisher API fora do event loop"""
+    with track_external("google_play", "subscriptions.get"):
+        return await asyncio.to_thread(request.execute)
+
 # Subscription routes
 # Google Play / In-App Purchase routes
 @api_router.post("/verify-purchase")
@@ -963,7 +1571,7 @@ async def verify_purchase(
     """
     try:
         user = await get_current_user(current_user)
-        logging.info(f"🛒 Verifying purchase for user {user['id']}, platform: {purchase.platform}, product: {purchase.productId}")
+        logging.info("🛒 Verifying purchase for user %s, platform: %s, product: %s", user['id'], purchase.platform, purchase.productId)
         
         # Validar produto
         valid_products = ["mensal", "semestral", "anual"]
@@ -987,13 +1595,12 @@ async def verify_purchase(
                     service = build('androidpublisher', 'v3', credentials=credentials)
                     
                     # Verificar compra de assinatura
-                    result = service.purchases().subscriptions().get(
+                    gp_request = service.purchases().subscriptions().get(
                         packageName=GOOGLE_PACKAGE_NAME,
                         subscriptionId=purchase.productId,
                         token=purchase.purchaseToken
-                    ).execute()
-                    
-                    logging.info(f"✅ Google Play API response: {result}")
+                    )
+                    result = await resilient_call("google_play", lambda: execute_google_play_request(gp_request))
                     
                     # Verificar se a compra é válida
                     payment_state = result.get('paymentState', 0)
@@ -1010,10 +1617,13 @@ async def verify_purchase(
                         'price_amount_micros': result.get('priceAmountMicros'),
                     }
                     
-                    logging.info(f"✅ Google Play purchase verified successfully")
+                    logging.info(
+                        "✅ Google Play purchase verified: order %s, paymentState %s, expiry %s",
+                        subscription_data['order_id'], payment_state, subscription_data['expiry_time_millis'],
+                    )
                     
                 except Exception as e:
-                    logging.error(f"❌ Error verifying Google Play purchase: {str(e)}")
+                    logging.error("❌ Error verifying Google Play purchase: %s", e)
                     # Em desenvolvimento, continuar mesmo com erro de verificação
                     logging.warning("⚠️ Continuing without Google Play verification (development mode)")
             else:
@@ -1071,13 +1681,13 @@ async def verify_purchase(
         elif purchase.platform == "ios":
             update_data["apple_transaction_id"] = purchase.transactionId
         
-        await db.users.update_one(
-            {"id": user["id"]},
+        await users_repo.update(
+            user["id"],
             {"$set": update_data}
         )
         
-        logging.info(f"✅ Subscription activated: {purchase.productId} for user {user['id']}, expires: {expiration_date.strftime('%d/%m/%Y %H:%M')}")
-        logging.info(f"📊 Auto-renewing: {update_data.get('google_play_auto_renewing', 'N/A')}")
+        logging.info("✅ Subscription activated: %s for user %s, expires: %s", purchase.productId, user['id'], expiration_date.strftime('%d/%m/%Y %H:%M'))
+        logging.info("📊 Auto-renewing: %s", update_data.get('google_play_auto_renewing', 'N/A'))
         
         return {
             "success": True,
@@ -1090,7 +1700,7 @@ async def verify_purchase(
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"❌ Error in verify_purchase: {str(e)}")
+        logging.error("❌ Error in verify_purchase: %s", e)
         raise HTTPException(status_code=500, detail=f"Erro ao verificar compra: {str(e)}")
 
 
@@ -1105,7 +1715,10 @@ async def google_play_webhook(request: Request):
     try:
         # Receber o corpo da requisição
         body = await request.json()
-        logging.info(f"[GOOGLE_PLAY_WEBHOOK] Received notification: {json.dumps(body, indent=2)}")
+        logging.info(
+            "[GOOGLE_PLAY_WEBHOOK] Received notification: message_id=%s, subscription=%s",
+            body.get("message", {}).get("messageId"), body.get("subscription"),
+        )
         
         # Extrair a mensagem do Pub/Sub
         if 'message' not in body:
@@ -1123,7 +1736,10 @@ async def google_play_webhook(request: Request):
         decoded_data = base64.b64decode(message_data['data']).decode('utf-8')
         notification = json.loads(decoded_data)
         
-        logging.info(f"[GOOGLE_PLAY_WEBHOOK] Decoded notification: {json.dumps(notification, indent=2)}")
+        logging.info(
+            "[GOOGLE_PLAY_WEBHOOK] Decoded notification: version=%s, package=%s, event_time=%s",
+            notification.get("version"), notification.get("packageName"), notification.get("eventTimeMillis"),
+        )
         
         # Verificar se é notificação de subscription
         if 'subscriptionNotification' not in notification:
@@ -1137,7 +1753,7 @@ async def google_play_webhook(request: Request):
         subscription_id = sub_notification.get('subscriptionId')  # mensal, semestral, anual
         purchase_token = sub_notification.get('purchaseToken')
         
-        logging.info(f"[GOOGLE_PLAY_WEBHOOK] Type: {notification_type}, Subscription: {subscription_id}, Token: {purchase_token[:20]}...")
+        logging.info("[GOOGLE_PLAY_WEBHOOK] Type: %s, Subscription: %s, Token: %s...", notification_type, subscription_id, purchase_token[:20])
         
         # Tipos de notificação:
         # 1 = SUBSCRIPTION_RECOVERED - Recuperada após problema de pagamento
@@ -1155,13 +1771,13 @@ async def google_play_webhook(request: Request):
         # 13 = SUBSCRIPTION_EXPIRED - Expirada
         
         # Buscar usuário pelo purchase_token
-        user = await db.users.find_one({"google_play_purchase_token": purchase_token})
+        user = await users_repo.get_by_purchase_token(purchase_token)
         
         if not user:
-            logging.error(f"[GOOGLE_PLAY_WEBHOOK] User not found for token: {purchase_token[:20]}...")
+            logging.error("[GOOGLE_PLAY_WEBHOOK] User not found for token: %s...", purchase_token[:20])
             return {"status": "error", "message": "User not found"}
         
-        logging.info(f"[GOOGLE_PLAY_WEBHOOK] Found user: {user['email']} ({user['id']})")
+        logging.info("[GOOGLE_PLAY_WEBHOOK] Found user: %s (%s)", user['email'], user['id'])
         
         # Buscar informações atualizadas da subscription no Google Play
         subscription_info = None
@@ -1174,23 +1790,24 @@ async def google_play_webhook(request: Request):
                 
                 service = build('androidpublisher', 'v3', credentials=credentials)
                 
-                result = service.purchases().subscriptions().get(
+                gp_request = service.purchases().subscriptions().get(
                     packageName=GOOGLE_PACKAGE_NAME,
                     subscriptionId=subscription_id,
                     token=purchase_token
-                ).execute()
+                )
+                result = await resilient_call("google_play", lambda: execute_google_play_request(gp_request))
                 
                 subscription_info = result
-                logging.info(f"[GOOGLE_PLAY_WEBHOOK] Fetched subscription info from Google Play API")
+                logging.info("[GOOGLE_PLAY_WEBHOOK] Fetched subscription info from Google Play API")
                 
             except Exception as e:
-                logging.error(f"[GOOGLE_PLAY_WEBHOOK] Error fetching subscription info: {str(e)}")
+                logging.error("[GOOGLE_PLAY_WEBHOOK] Error fetching subscription info: %s", e)
         
         # Processar cada tipo de notificação
         update_data = {}
         
         if notification_type in [1, 2]:  # RECOVERED ou RENEWED
-            logging.info(f"[GOOGLE_PLAY_WEBHOOK] ✅ Subscription renewed/recovered")
+            logging.info("[GOOGLE_PLAY_WEBHOOK] ✅ Subscription renewed/recovered")
             
             # Renovar a assinatura
             if subscription_info:
@@ -1205,21 +1822,21 @@ async def google_play_webhook(request: Request):
                     "google_play_payment_state": subscription_info.get('paymentState', 1),
                 }
                 
-                logging.info(f"[GOOGLE_PLAY_WEBHOOK] New expiration: {expiration_date.strftime('%d/%m/%Y %H:%M')}")
+                logging.info("[GOOGLE_PLAY_WEBHOOK] New expiration: %s", expiration_date.strftime('%d/%m/%Y %H:%M'))
             
         elif notification_type == 3:  # CANCELED
-            logging.info(f"[GOOGLE_PLAY_WEBHOOK] ⚠️ Subscription canceled by user")
+            logging.info("[GOOGLE_PLAY_WEBHOOK] ⚠️ Subscription canceled by user")
             update_data = {
                 "google_play_auto_renewing": False,
             }
             # Não desativar imediatamente - usuário tem acesso até expirar
             
         elif notification_type in [5, 6]:  # ON_HOLD ou GRACE_PERIOD
-            logging.info(f"[GOOGLE_PLAY_WEBHOOK] ⚠️ Subscription in grace period/on hold")
+            logging.info("[GOOGLE_PLAY_WEBHOOK] ⚠️ Subscription in grace period/on hold")
             # Manter ativo durante período de carência
             
         elif notification_type == 12:  # REVOKED
-            logging.info(f"[GOOGLE_PLAY_WEBHOOK] ❌ Subscription revoked (refund/chargeback)")
+            logging.info("[GOOGLE_PLAY_WEBHOOK] ❌ Subscription revoked (refund/chargeback)")
             update_data = {
                 "plano_ativo": "free",
                 "google_play_auto_renewing": False,
@@ -1227,7 +1844,7 @@ async def google_play_webhook(request: Request):
             }
             
         elif notification_type == 13:  # EXPIRED
-            logging.info(f"[GOOGLE_PLAY_WEBHOOK] ⏰ Subscription expired")
+            logging.info("[GOOGLE_PLAY_WEBHOOK] ⏰ Subscription expired")
             update_data = {
                 "plano_ativo": "free",
                 "google_play_auto_renewing": False,
@@ -1235,22 +1852,27 @@ async def google_play_webhook(request: Request):
         
         # Atualizar banco de dados se houver mudanças
         if update_data:
-            await db.users.update_one(
-                {"id": user["id"]},
+            await users_repo.update(
+                user["id"],
                 {"$set": update_data}
             )
-            logging.info(f"[GOOGLE_PLAY_WEBHOOK] ✅ User updated: {json.dumps(update_data, default=str, indent=2)}")
+            logging.info("[GOOGLE_PLAY_WEBHOOK] ✅ User updated: %s", update_data)
         
         return {"status": "ok", "processed": True}
         
     except Exception as e:
-        logging.error(f"[GOOGLE_PLAY_WEBHOOK] ❌ Error processing webhook: {str(e)}")
-        logging.error(f"[GOOGLE_PLAY_WEBHOOK] Full traceback: {traceback.format_exc()}")
+        logging.error("[GOOGLE_PLAY_WEBHOOK] ❌ Error processing webhook: %s", e)
+        logging.error("[GOOGLE_PLAY_WEBHOOK] Full traceback: %s", traceback.format_exc())
         # Retornar 200 mesmo com erro para não reenviar
         return {"status": "error", "message": str(e)}
 
 
 
+async def stripe_call(operation: str, fn, *args, **kwargs):
+    """Executa uma chamada síncrona do SDK do Stripe fora do event loop"""
+    with track_external("stripe", operation):
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
 @api_router.post("/criar-assinatura")
 async def criar_assinatura(
     request: CreateSubscriptionRequest,
@@ -1275,27 +1897,31 @@ async def criar_assinatura(
         # Create or retrieve Stripe customer
         stripe_customer_id = user.get("stripe_customer_id")
         if not stripe_customer_id:
-            customer = stripe.Customer.create(
+            customer_key = str(uuid.uuid4())  # mesma chave em todas as tentativas
+            customer = await resilient_call("stripe", lambda: stripe_call(
+                "customer.create", stripe.Customer.create,
                 email=user["email"],
                 name=user["nome"],
-                metadata={"user_id": user["id"], "plano": request.plano}
-            )
+                metadata={"user_id": user["id"], "plano": request.plano},
+                idempotency_key=customer_key
+            ))
             stripe_customer_id = customer.id
             
             # Save customer ID
-            await db.users.update_one(
-                {"id": user["id"]},
+            await users_repo.update(
+                user["id"],
                 {"$set": {"stripe_customer_id": stripe_customer_id}}
             )
         
         # Create or retrieve product and price
         try:
             # Try to find existing price
-            prices = stripe.Price.list(
+            prices = await resilient_call("stripe", lambda: stripe_call(
+                "price.list", stripe.Price.list,
                 active=True,
                 currency='brl',
                 limit=100
-            )
+            ))
             
             price_id = None
             for price in prices.data:
@@ -1306,36 +1932,44 @@ async def criar_assinatura(
             
             if not price_id:
                 # Create new price
-                price = stripe.Price.create(
+                price_key = str(uuid.uuid4())  # mesma chave em todas as tentativas
+                price = await resilient_call("stripe", lambda: stripe_call(
+                    "price.create", stripe.Price.create,
                     unit_amount=plano_info["price"],
                     currency="brl",
                     recurring={
                         "interval": plano_info["interval"],
                         "interval_count": plano_info.get("interval_count", 1)
                     },
-                    product_data={"name": plano_info["name"]}
-                )
+                    product_data={"name": plano_info["name"]},
+                    idempotency_key=price_key
+                ))
                 price_id = price.id
-                logging.info(f"Created new price: {price_id}")
+                logging.info("Created new price: %s", price_id)
         except Exception as e:
-            logging.error(f"Error finding/creating price: {str(e)}")
+            logging.error("Error finding/creating price: %s", e)
             # Create new price as fallback
-            price = stripe.Price.create(
+            price_key = str(uuid.uuid4())  # mesma chave em todas as tentativas
+            price = await resilient_call("stripe", lambda: stripe_call(
+                "price.create", stripe.Price.create,
                 unit_amount=plano_info["price"],
                 currency="brl",
                 recurring={
                     "interval": plano_info["interval"],
                     "interval_count": plano_info.get("interval_count", 1)
                 },
-                product_data={"name": plano_info["name"]}
-            )
+                product_data={"name": plano_info["name"]},
+                idempotency_key=price_key
+            ))
             price_id = price.id
         
         # Create a Subscription with the first payment
         # This enables automatic recurring billing
-        logging.info(f"Creating subscription for customer {stripe_customer_id} with price {price_id}")
+        logging.info("Creating subscription for customer %s with price %s", stripe_customer_id, price_id)
         
-        subscription = stripe.Subscription.create(
+        subscription_key = str(uuid.uuid4())  # mesma chave em todas as tentativas
+        subscription = await resilient_call("stripe", lambda: stripe_call(
+            "subscription.create", stripe.Subscription.create,
             customer=stripe_customer_id,
             items=[{'price': price_id}],
             payment_behavior='default_incomplete',
@@ -1346,22 +1980,24 @@ async def criar_assinatura(
             metadata={
                 "user_id": user["id"],
                 "plano": request.plano,
-            }
-        )
+            },
+            idempotency_key=subscription_key
+        ))
         
-        logging.info(f"Subscription created: {subscription.id}, status: {subscription.status}")
+        logging.info("Subscription created: %s, status: %s", subscription.id, subscription.status)
         
         # Retrieve the subscription with expanded invoice and payment_intent
         # This is more reliable than relying on the create response
-        subscription_expanded = stripe.Subscription.retrieve(
+        subscription_expanded = await resilient_call("stripe", lambda: stripe_call(
+            "subscription.retrieve", stripe.Subscription.retrieve,
             subscription.id,
             expand=['latest_invoice.payment_intent']
-        )
+        ))
         
         # Get the PaymentIntent from the subscription's first invoice
         latest_invoice = subscription_expanded.latest_invoice
         
-        logging.info(f"Latest invoice: {latest_invoice.id if hasattr(latest_invoice, 'id') else latest_invoice}")
+        logging.info("Latest invoice: %s", getattr(latest_invoice, 'id', latest_invoice))
         
         # Extract payment_intent
         payment_intent = None
@@ -1370,24 +2006,29 @@ async def criar_assinatura(
         elif isinstance(latest_invoice, dict):
             payment_intent = latest_invoice.get('payment_intent')
         
-        logging.info(f"Payment intent: {payment_intent}")
+        logging.info("Payment intent: %s", getattr(payment_intent, 'id', payment_intent))
         
         # If no payment_intent exists, fetch the invoice and check
         if not payment_intent:
             invoice_id = latest_invoice.id if hasattr(latest_invoice, 'id') else latest_invoice
-            logging.info(f"No payment_intent found, fetching invoice separately: {invoice_id}")
+            logging.info("No payment_intent found, fetching invoice separately: %s", invoice_id)
             
-            invoice = stripe.Invoice.retrieve(invoice_id)
+            invoice = await resilient_call("stripe", lambda: stripe_call(
+                "invoice.retrieve", stripe.Invoice.retrieve, invoice_id
+            ))
             invoice_payment_intent = getattr(invoice, 'payment_intent', None)
-            logging.info(f"Invoice status: {invoice.status}, payment_intent: {invoice_payment_intent}")
+            logging.info("Invoice status: %s, payment_intent: %s", invoice.status, invoice_payment_intent)
             
             # If invoice has no payment_intent, handle based on status
             if not invoice_payment_intent:
                 if invoice.status == 'draft':
                     logging.info("Invoice is draft, finalizing to create payment_intent...")
-                    invoice = stripe.Invoice.finalize_invoice(invoice_id)
+                    invoice_key = str(uuid.uuid4())  # mesma chave em todas as tentativas
+                    invoice = await resilient_call("stripe", lambda: stripe_call(
+                        "invoice.finalize", stripe.Invoice.finalize_invoice, invoice_id, idempotency_key=invoice_key
+                    ))
                     invoice_payment_intent = getattr(invoice, 'payment_intent', None)
-                    logging.info(f"Invoice finalized, payment_intent: {invoice_payment_intent}")
+                    logging.info("Invoice finalized, payment_intent: %s", invoice_payment_intent)
                 
                 elif invoice.status == 'open':
                     # Invoice is open but has no payment_intent
@@ -1396,7 +2037,9 @@ async def criar_assinatura(
                     logging.info("Invoice is open but has no payment_intent, creating manually...")
                     
                     # Create PaymentIntent for the invoice
-                    manual_payment_intent = stripe.PaymentIntent.create(
+                    manual_payment_intent_key = str(uuid.uuid4())  # mesma chave em todas as tentativas
+                    manual_payment_intent = await resilient_call("stripe", lambda: stripe_call(
+                        "payment_intent.create", stripe.PaymentIntent.create,
                         amount=invoice.amount_due,
                         currency=invoice.currency,
                         customer=invoice.customer,
@@ -1405,16 +2048,20 @@ async def criar_assinatura(
                             'subscription_id': subscription.id,
                         },
                         automatic_payment_methods={'enabled': True},
-                    )
+                        idempotency_key=manual_payment_intent_key
+                    ))
                     
-                    logging.info(f"Manual PaymentIntent created: {manual_payment_intent.id}")
+                    logging.info("Manual PaymentIntent created: %s", manual_payment_intent.id)
                     invoice_payment_intent = manual_payment_intent.id
             
             payment_intent = invoice_payment_intent
         
         # Handle payment_intent as string or object
         if isinstance(payment_intent, str):
-            payment_intent = stripe.PaymentIntent.retrieve(payment_intent)
+            pending_intent_id = payment_intent
+            payment_intent = await resilient_call("stripe", lambda: stripe_call(
+                "payment_intent.retrieve", stripe.PaymentIntent.retrieve, pending_intent_id
+            ))
         
         if not payment_intent:
             raise ValueError(f"Could not retrieve payment_intent from subscription. Invoice status: {invoice.status if 'invoice' in locals() else 'unknown'}")
@@ -1424,8 +2071,8 @@ async def criar_assinatura(
         client_secret = payment_intent.client_secret if hasattr(payment_intent, 'client_secret') else payment_intent.get('client_secret')
         
         # Save subscription info
-        await db.users.update_one(
-            {"id": user["id"]},
+        await users_repo.update(
+            user["id"],
             {"$set": {
                 "stripe_subscription_id": subscription.id,
                 "stripe_payment_intent_id": payment_intent_id,
@@ -1434,7 +2081,7 @@ async def criar_assinatura(
             }}
         )
         
-        logging.info(f"Subscription created for user {user['id']}: {subscription.id}, PaymentIntent: {payment_intent_id}")
+        logging.info("Subscription created for user %s: %s, PaymentIntent: %s", user['id'], subscription.id, payment_intent_id)
         
         return {
             "payment_intent_id": payment_intent_id,
@@ -1447,7 +2094,7 @@ async def criar_assinatura(
         }
         
     except Exception as e:
-        logging.error(f"Error creating subscription: {str(e)}")
+        logging.error("Error creating subscription: %s", e)
         raise HTTPException(status_code=500, detail=f"Erro ao criar assinatura: {str(e)}")
 
 @api_router.post("/cancelar-assinatura")
@@ -1458,7 +2105,7 @@ async def cancelar_assinatura(current_user=Depends(security)):
     try:
         user = await get_current_user(current_user)
         
-        logging.info(f"[CANCEL] Starting subscription cancellation for user {user['id']}")
+        logging.info("[CANCEL] Starting subscription cancellation for user %s", user['id'])
         
         # Verificar se usuário tem assinatura ativa
         if not user.get('stripe_subscription_id'):
@@ -1469,15 +2116,14 @@ async def cancelar_assinatura(current_user=Depends(security)):
         # Cancelar subscription no Stripe
         # cancel_at_period_end=True mantém o acesso até o fim do período pago
         try:
-            subscription = stripe.Subscription.modify(
-                subscription_id,
-                cancel_at_period_end=True
-            )
-            logging.info(f"[CANCEL] Subscription {subscription_id} marked for cancellation at period end")
+            subscription = await resilient_call("stripe", lambda: stripe_call(
+                "subscription.modify", stripe.Subscription.modify, subscription_id, cancel_at_period_end=True
+            ))
+            logging.info("[CANCEL] Subscription %s marked for cancellation at period end", subscription_id)
             
             # Atualizar banco de dados para refletir cancelamento pendente
-            await db.users.update_one(
-                {"id": user["id"]},
+            await users_repo.update(
+                user["id"],
                 {
                     "$set": {
                         "subscription_cancel_at_period_end": True,
@@ -1490,7 +2136,7 @@ async def cancelar_assinatura(current_user=Depends(security)):
             cancel_at = getattr(subscription, 'cancel_at', None)
             current_period_end = getattr(subscription, 'current_period_end', None)
             
-            logging.info(f"[CANCEL] User {user['email']} subscription will cancel at {cancel_at}")
+            logging.info("[CANCEL] User %s subscription will cancel at %s", user['email'], cancel_at)
             
             return {
                 "success": True,
@@ -1503,7 +2149,7 @@ async def cancelar_assinatura(current_user=Depends(security)):
         except Exception as stripe_error:
             # Capturar qualquer erro do Stripe
             if 'Stripe' in str(type(stripe_error)):
-                logging.error(f"[CANCEL] Stripe error: {str(stripe_error)}")
+                logging.error("[CANCEL] Stripe error: %s", stripe_error)
                 raise HTTPException(status_code=400, detail=f"Erro ao cancelar no Stripe: {str(stripe_error)}")
             else:
                 raise
@@ -1511,7 +2157,7 @@ async def cancelar_assinatura(current_user=Depends(security)):
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"[CANCEL] Error cancelling subscription: {str(e)}")
+        logging.error("[CANCEL] Error cancelling subscription: %s", e)
         raise HTTPException(status_code=500, detail=f"Erro ao cancelar assinatura: {str(e)}")
 
 @api_router.post("/reativar-assinatura")
@@ -1522,7 +2168,7 @@ async def reativar_assinatura(current_user=Depends(security)):
     try:
         user = await get_current_user(current_user)
         
-        logging.info(f"[REACTIVATE] Starting subscription reactivation for user {user['id']}")
+        logging.info("[REACTIVATE] Starting subscription reactivation for user %s", user['id'])
         
         # Verificar se usuário tem assinatura
         if not user.get('stripe_subscription_id'):
@@ -1532,15 +2178,14 @@ async def reativar_assinatura(current_user=Depends(security)):
         
         # Reativar subscription no Stripe
         try:
-            subscription = stripe.Subscription.modify(
-                subscription_id,
-                cancel_at_period_end=False
-            )
-            logging.info(f"[REACTIVATE] Subscription {subscription_id} reactivated")
+            subscription = await resilient_call("stripe", lambda: stripe_call(
+                "subscription.modify", stripe.Subscription.modify, subscription_id, cancel_at_period_end=False
+            ))
+            logging.info("[REACTIVATE] Subscription %s reactivated", subscription_id)
             
             # Atualizar banco de dados
-            await db.users.update_one(
-                {"id": user["id"]},
+            await users_repo.update(
+                user["id"],
                 {
                     "$set": {
                         "subscription_cancel_at_period_end": False
@@ -1551,7 +2196,7 @@ async def reativar_assinatura(current_user=Depends(security)):
                 }
             )
             
-            logging.info(f"[REACTIVATE] User {user['email']} subscription reactivated")
+            logging.info("[REACTIVATE] User %s subscription reactivated", user['email'])
             
             return {
                 "success": True,
@@ -1562,7 +2207,7 @@ async def reativar_assinatura(current_user=Depends(security)):
         except Exception as stripe_error:
             # Capturar qualquer erro do Stripe
             if 'Stripe' in str(type(stripe_error)):
-                logging.error(f"[REACTIVATE] Stripe error: {str(stripe_error)}")
+                logging.error("[REACTIVATE] Stripe error: %s", stripe_error)
                 raise HTTPException(status_code=400, detail=f"Erro ao reativar no Stripe: {str(stripe_error)}")
             else:
                 raise
@@ -1570,7 +2215,7 @@ async def reativar_assinatura(current_user=Depends(security)):
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"[REACTIVATE] Error reactivating subscription: {str(e)}")
+        logging.error("[REACTIVATE] Error reactivating subscription: %s", e)
         raise HTTPException(status_code=500, detail=f"Erro ao reativar assinatura: {str(e)}")
 
 @api_router.post("/confirmar-pagamento")
@@ -1580,15 +2225,17 @@ async def confirmar_pagamento(
 ):
     try:
         user = await get_current_user(current_user)
-        logging.info(f"[CONFIRM] Starting payment confirmation for user {user['id']}, payment_intent: {payment_intent_id}")
+        logging.info("[CONFIRM] Starting payment confirmation for user %s, payment_intent: %s", user['id'], payment_intent_id)
         
         # Retrieve payment intent from Stripe
         try:
-            payment_intent = stripe.PaymentIntent.retrieve(payment_intent_id)
-            logging.info(f"[CONFIRM] Payment intent retrieved - Status: {payment_intent.status}, Amount: {payment_intent.amount}")
-            logging.info(f"[CONFIRM] Payment method: {payment_intent.payment_method}")
+            payment_intent = await resilient_call("stripe", lambda: stripe_call(
+                "payment_intent.retrieve", stripe.PaymentIntent.retrieve, payment_intent_id
+            ))
+            logging.info("[CONFIRM] Payment intent retrieved - Status: %s, Amount: %s", payment_intent.status, payment_intent.amount)
+            logging.info("[CONFIRM] Payment method: %s", payment_intent.payment_method)
         except Exception as stripe_error:
-            logging.error(f"[CONFIRM] ❌ Error retrieving payment intent from Stripe: {str(stripe_error)}")
+            logging.error("[CONFIRM] ❌ Error retrieving payment intent from Stripe: %s", stripe_error)
             raise HTTPException(status_code=400, detail=f"Não foi possível verificar o pagamento no Stripe: {str(stripe_error)}")
         
         if payment_intent.status == "succeeded":
@@ -1596,19 +2243,19 @@ async def confirmar_pagamento(
             plano_tipo = user.get("stripe_pending_plan")
             price_id = user.get("stripe_pending_price_id")
             
-            logging.info(f"[CONFIRM] User plan info - Plan type: {plano_tipo}, Price ID: {price_id}")
+            logging.info("[CONFIRM] User plan info - Plan type: %s, Price ID: %s", plano_tipo, price_id)
             
             if not plano_tipo:
-                logging.error(f"[CONFIRM] ❌ Missing plan type for user {user['id']}")
+                logging.error("[CONFIRM] ❌ Missing plan type for user %s", user['id'])
                 raise HTTPException(status_code=400, detail="Informações do plano não encontradas. Por favor, tente assinar novamente.")
             
             # Get plan details from database
             plan = await db.plans.find_one({"id": plano_tipo})
             if not plan:
-                logging.error(f"[CONFIRM] ❌ Plan {plano_tipo} not found in database")
+                logging.error("[CONFIRM] ❌ Plan %s not found in database", plano_tipo)
                 raise HTTPException(status_code=400, detail="Plano não encontrado no sistema")
             
-            logging.info(f"[CONFIRM] Plan found: {plan['name']} - R$ {plan['price']/100:.2f}")
+            logging.info("[CONFIRM] Plan found: %s - R$ %.2f", plan['name'], plan['price']/100)
             
             # Calculate expiration date based on plan interval
             if plan["interval"] == "month":
@@ -1620,11 +2267,11 @@ async def confirmar_pagamento(
             
             expiration_date = datetime.utcnow() + timedelta(days=days_to_add)
             
-            logging.info(f"[CONFIRM] Calculated expiration date: {expiration_date}")
+            logging.info("[CONFIRM] Calculated expiration date: %s", expiration_date)
             
             # Update user subscription info (simplified - no Stripe subscription creation)
-            update_result = await db.users.update_one(
-                {"id": user["id"]},
+            update_result = await users_repo.update(
+                user["id"],
                 {"$set": {
                     "plano_ativo": plano_tipo,
                     "stripe_payment_intent_id": payment_intent_id,
@@ -1637,11 +2284,11 @@ async def confirmar_pagamento(
             )
             
             if update_result.modified_count == 0:
-                logging.warning(f"[CONFIRM] ⚠️  No document updated for user {user['id']} - maybe already activated?")
+                logging.warning("[CONFIRM] ⚠️  No document updated for user %s - maybe already activated?", user['id'])
             else:
                 logging.info("[CONFIRM] ✅ User document updated successfully")
             
-            logging.info(f"[CONFIRM] ✅✅✅ Payment confirmed and plan activated for user {user['id']}: {plano_tipo}, expires: {expiration_date.strftime('%d/%m/%Y')}")
+            logging.info("[CONFIRM] ✅✅✅ Payment confirmed and plan activated for user %s: %s, expires: %s", user['id'], plano_tipo, expiration_date.strftime('%d/%m/%Y'))
             
             return {
                 "message": "Pagamento confirmado! Assinatura ativada com sucesso!",
@@ -1651,7 +2298,7 @@ async def confirmar_pagamento(
                 "status": "active"
             }
         else:
-            logging.warning(f"[CONFIRM] ⚠️  Payment intent {payment_intent_id} status is '{payment_intent.status}', expected 'succeeded'")
+            logging.warning("[CONFIRM] ⚠️  Payment intent %s status is '%s', expected 'succeeded'", payment_intent_id, payment_intent.status)
             return {
                 "message": f"Pagamento ainda em processamento (status: {payment_intent.status})",
                 "status": payment_intent.status
@@ -1660,13 +2307,11 @@ async def confirmar_pagamento(
     except HTTPException as he:
         raise he
     except Exception as e:
-        logging.error(f"[CONFIRM] ❌❌❌ Unexpected error: {str(e)}", exc_info=True)
+        logging.error("[CONFIRM] ❌❌❌ Unexpected error: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=f"Erro ao confirmar pagamento: {str(e)}")
 
-@api_router.get("/status-assinatura")
-async def status_assinatura(current_user=Depends(security)):
-    user = await get_current_user(current_user)
-    
+async def build_plan_status(user: dict) -> dict:
+    """Status do plano do usuário (expira planos vencidos)"""
     plano_ativo = user.get("plano_ativo", "free")
     looks_usados = user.get("looks_usados", 0)
     data_expiracao = user.get("data_expiracao_plano")
@@ -1677,10 +2322,7 @@ async def status_assinatura(current_user=Depends(security)):
         if data_expiracao < datetime.utcnow():
             plan_expired = True
             # Reset to free plan
-            await db.users.update_one(
-                {"id": user["id"]},
-                {"$set": {"plano_ativo": "free", "data_expiracao_plano": None}}
-            )
+            await users_repo.expire_plan(user["id"])
             plano_ativo = "free"
     
     # Get plan details if active
@@ -1699,11 +2341,30 @@ async def status_assinatura(current_user=Depends(security)):
         "plan_details": plan_details,
         "is_premium": plano_ativo != "free",
         "looks_usados": looks_usados,
-        "looks_restantes": max(0, 5 - looks_usados) if plano_ativo == "free" else "ilimitado",
+        "looks_restantes": remaining_quota(user, plano_ativo, LOOKS_QUOTA) if LOOKS_QUOTA.limit_for(plano_ativo) is not None else "ilimitado",
         "data_expiracao": data_expiracao.isoformat() if data_expiracao else None,
         "plan_expired": plan_expired
     }
 
+@api_router.get("/status-assinatura")
+async def status_assinatura(current_user=Depends(security)):
+    user = await get_current_user(current_user)
+    return await build_plan_status(user)
+
+@api_router.get("/dashboard")
+async def get_dashboard(current_user=Depends(security)):
+    """Contadores da home e status do plano numa única requisição"""
+    user = await get_current_user(current_user)
+    
+    counters = await read_counters(db, user)
+    
+    return {
+        "roupas": counters[ROUPAS.field],
+        "looks": counters[LOOKS.field],
+        "favoritos": counters[FAVORITOS.field],
+        "assinatura": await build_plan_status(user)
+    }
+
 @api_router.get("/planos")
 async def get_planos():
     """Retorna todos os planos ativos"""
@@ -1822,7 +2483,7 @@ async def criar_sugestao(
                 html_content=email_body
             )
         except Exception as email_error:
-            logging.error(f"Erro ao enviar email de sugestão: {email_error}")
+            logging.error("Erro ao enviar email de sugestão: %s", email_error)
             # Não falhar se o email não for enviado
         
         return {
@@ -1832,12 +2493,61 @@ async def criar_sugestao(
         }
     
     except Exception as e:
-        logging.error(f"Erro ao criar sugestão: {e}")
+        logging.error("Erro ao criar sugestão: %s", e)
         raise HTTPException(status_code=500, detail="Erro ao enviar sugestão")
 
+# Métricas no formato Prometheus
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint(request: Request):
+    """Exposição das métricas para scraping pelo Prometheus"""
+    metrics_token = os.environ.get('METRICS_TOKEN')
+    if metrics_token and request.headers.get("authorization") != f"Bearer {metrics_token}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return Response(content=metrics_registry.render(), media_type=CONTENT_TYPE_LATEST)
+
+# Rate limiting dos endpoints de IA
+def rate_limit_identity(request: Request) -> str:
+    """Identifica o usuário pelo JWT (sem consultar o banco) ou, sem token, pelo IP"""
+    auth_header = request.headers.get("authorization", "")
+    if auth_header.lower().startswith("bearer "):
+        try:
+            payload = jwt.decode(auth_header[7:], JWT_SECRET, algorithms=["HS256"])
+            if payload.get("user_id"):
+                return payload["user_id"]
+        except jwt.PyJWTError:
+            pass
+    forwarded_for = request.headers.get("x-forwarded-for")
+    if forwarded_for:
+        return forwarded_for.split(",")[0].strip()
+    return request.client.host if request.client else "anonymous"
+
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+rate_limiter = RateLimiter(
+    MongoBucketBackend(db.rate_limits) if RATE_LIMIT_BACKEND == 'mongo' else InMemoryBucketBackend(),
+    identify=rate_limit_identity,
+)
+rate_limiter.enabled = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() != 'false'
+
 # Include the router in the main app
 app.include_router(api_router)
 
+app.middleware("http")(rate_limiter.middleware)
+app.middleware("http")(metrics_middleware)
+app.middleware("http")(tracing_middleware)
+
+# Body size limits: image routes get room for one base64 image, everything else is small
+IMAGE_BODY_LIMIT = MAX_IMAGE_BYTES * 4 // 3 + 64 * 1024
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits={
+        ("POST", "/api/upload-roupa"): IMAGE_BODY_LIMIT,
+        ("POST", "/api/upload-roupa-arquivo"): MAX_IMAGE_BYTES + 64 * 1024,
+        ("POST", "/api/upload-foto-corpo"): IMAGE_BODY_LIMIT,
+        ("POST", "/api/looks"): IMAGE_BODY_LIMIT,
+    },
+    default_limit=int(os.environ.get('BODY_LIMIT_DEFAULT_BYTES', str(1024 * 1024))),
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -1847,12 +2557,67 @@ app.add_middleware(
 )
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
+async def backfill_wardrobe_search_fields():
+    try:
+        updated = await clothing_repo.backfill_search_fields()
+        if updated:
+            logging.info("Campos de busca preenchidos em %s roupas", updated)
+    except Exception as e:
+        logging.error("Falha ao preencher campos de busca das roupas: %s", e)
+
+async def backfill_garment_embeddings(batch_size: int = 100):
+    """Calcula o embedding das roupas cadastradas antes dos embeddings (em um único worker)"""
+    try:
+        updated_users = set()
+        while True:
+            # Pega ou renova o lock a cada lote; outro worker já no backfill faz este sair
+            if not await acquire_job_lock(db.job_locks, "embedding_backfill"):
+                break
+            roupas = await clothing_repo.without_embedding(batch_size)
+            if not roupas:
+                break
+            blobs = await load_blob_bytes(db.image_blobs, [roupa.get("imagem_blob_id") for roupa in roupas])
+            embeddings = {}
+            for roupa in roupas:
+                data = blobs.get(roupa.get("imagem_blob_id")) or data_uri_bytes(roupa.get("imagem_original"))
+                embeddings[roupa["id"]] = await asyncio.to_thread(embed_image, data) if data else None
+                updated_users.add(roupa["user_id"])
+            await clothing_repo.set_embeddings(embeddings)
+        # Nova versão do guarda-roupa: os índices em memória (de todos os processos) são refeitos
+        for user_id in updated_users:
+            await users_repo.bump_wardrobe_version(user_id)
+        if updated_users:
+            logging.info("Embeddings calculados para roupas de %s usuários", len(updated_users))
+    except Exception as e:
+        logging.error("Falha ao calcular embeddings das roupas: %s", e)
+    finally:
+        await release_job_lock(db.job_locks, "embedding_backfill")
+
+@app.on_event("startup")
+async def start_event_loop_monitor():
+    tracer.configure()
+    if RATE_LIMIT_BACKEND == 'mongo':
+        await db.rate_limits.create_index("expires_at", expireAfterSeconds=0)
+    await ensure_checkpoint_indexes(db.tryon_checkpoints)
+    await ensure_blob_indexes(db.image_blobs)
+    await ensure_result_indexes(db.tryon_results)
+    await ensure_job_lock_indexes(db.job_locks)
+    await users_repo.ensure_indexes()
+    await clothing_repo.ensure_indexes()
+    await looks_repo.ensure_indexes()
+    app.state.loop_monitor = asyncio.create_task(monitor_event_loop_lag())
+    app.state.search_backfill = asyncio.create_task(backfill_wardrobe_search_fields())
+    app.state.embedding_backfill = asyncio.create_task(backfill_garment_embeddings())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    app.state.loop_monitor.cancel()
+    app.state.search_backfill.cancel()
+    app.state.embedding_backfill.cancel()
+    look_covers.shutdown()
+    tracer.shutdown()
+    await http_client.aclose()
     client.close()
\ No newline at end of file
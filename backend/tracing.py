@@ -0,0 +1,371 @@
+"""
+Tracing distribuído compatível com OpenTelemetry (W3C traceparent + OTLP/JSON)
+
+Spans são propagados por ContextVar (o Motor copia o contexto para as threads
+do executor, então os comandos do MongoDB viram filhos do span da requisição)
+e exportados em lote por uma thread em background para um arquivo JSONL ou
+para um coletor OTLP/HTTP local.
+
+Configuração por variáveis de ambiente:
+    TRACING_EXPORTER             none (padrão) | file | otlp
+    TRACING_FILE                 caminho do JSONL (padrão: traces.jsonl)
+    OTEL_EXPORTER_OTLP_ENDPOINT  padrão: http://localhost:4318
+    OTEL_SERVICE_NAME            padrão: meu-look-ia-api
+    TRACING_SAMPLE_RATE          fração de traces exportados (padrão: 1.0)
+"""
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class Span:
+    __slots__ = (
+        "name", "trace_id", "span_id", "parent_id", "kind", "sampled",
+        "start_ns", "end_ns", "attributes", "status", "status_message",
+    )
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: int, sampled: bool):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.sampled = sampled
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.status = STATUS_UNSET
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, exc: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(exc).__name__}: {exc}"[:500]
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        if self.sampled:
+            tracer.processor.on_end(self)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class _NoopSpan:
+    """Span descartado quando o tracing está desligado"""
+    trace_id = None
+    span_id = None
+    sampled = False
+    traceparent = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_error(self, exc):
+        pass
+
+    def end(self, end_ns=None):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class FileSpanExporter:
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Span], resource: Dict[str, Any]) -> None:
+        with open(self.path, "a", encoding="utf-8") as fh:
+            for span in spans:
+                record = span.to_otlp()
+                record["resource"] = resource
+                fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class OTLPHttpExporter:
+    def __init__(self, endpoint: str):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+
+    def export(self, spans: List[Span], resource: Dict[str, Any]) -> None:
+        import requests
+
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute(k, v) for k, v in resource.items()]},
+                "scopeSpans": [{
+                    "scope": {"name": "meu-look-ia"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+        requests.post(self.url, json=payload, timeout=5)
+
+
+class BatchSpanProcessor:
+    """
+    Acumula spans finalizados numa fila e exporta em lote numa thread
+    separada, fora do caminho da requisição
+    """
+
+    def __init__(self, exporter, resource: Dict[str, Any], max_batch: int = 256, interval: float = 2.0, max_queue: int = 10000):
+        self.exporter = exporter
+        self.resource = resource
+        self.max_batch = max_batch
+        self.interval = interval
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def on_end(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            pass  # Descartar em vez de bloquear a requisição
+
+    def _drain(self) -> List[Span]:
+        batch = []
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.flush()
+        self.flush()
+
+    def flush(self) -> None:
+        batch = self._drain()
+        while batch:
+            try:
+                self.exporter.export(batch, self.resource)
+            except Exception as e:
+                logger.warning("Falha ao exportar %d spans: %s", len(batch), e)
+            batch = self._drain()
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+
+class _NoopProcessor:
+    def on_end(self, span):
+        pass
+
+    def flush(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.sample_rate = 1.0
+        self.processor = _NoopProcessor()
+
+    def configure(self) -> None:
+        exporter_name = os.environ.get("TRACING_EXPORTER", "none").lower()
+        resource = {"service.name": os.environ.get("OTEL_SERVICE_NAME", "meu-look-ia-api")}
+        if exporter_name == "file":
+            exporter = FileSpanExporter(os.environ.get("TRACING_FILE", "traces.jsonl"))
+        elif exporter_name == "otlp":
+            exporter = OTLPHttpExporter(os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318"))
+        else:
+            self.enabled = False
+            return
+        self.sample_rate = float(os.environ.get("TRACING_SAMPLE_RATE", "1.0"))
+        self.processor = BatchSpanProcessor(exporter, resource)
+        self.enabled = True
+        logger.info("Tracing habilitado (exporter=%s, sample_rate=%s)", exporter_name, self.sample_rate)
+
+    def shutdown(self) -> None:
+        self.processor.shutdown()
+
+    def start_span(self, name: str, kind: int = SPAN_KIND_INTERNAL, parent: Optional[Span] = None, traceparent: Optional[str] = None):
+        if not self.enabled:
+            return NOOP_SPAN
+        parent = parent or _current_span.get()
+        if parent is not None:
+            return Span(name, parent.trace_id, parent.span_id, kind, parent.sampled)
+        remote = _parse_traceparent(traceparent) if traceparent else None
+        if remote:
+            trace_id, parent_id, sampled = remote
+            return Span(name, trace_id, parent_id, kind, sampled)
+        sampled = random.random() < self.sample_rate
+        return Span(name, "%032x" % random.getrandbits(128), None, kind, sampled)
+
+
+tracer = Tracer()
+
+
+def _parse_traceparent(header: str):
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+def current_span():
+    return _current_span.get() or NOOP_SPAN
+
+
+@contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes):
+    """
+    Abre um span filho do span atual. Funciona em código síncrono e async
+    (o ContextVar é isolado por task).
+    """
+    if not tracer.enabled:
+        yield NOOP_SPAN
+        return
+    current = tracer.start_span(name, kind)
+    for key, value in attributes.items():
+        current.set_attribute(key, value)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def inject_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    """Adiciona o header traceparent do span atual a uma requisição de saída"""
+    current = _current_span.get()
+    if current is not None:
+        headers["traceparent"] = current.traceparent
+    return headers
+
+
+async def tracing_middleware(request, call_next):
+    """
+    Middleware HTTP que abre o span raiz da requisição, continuando o trace
+    recebido no header traceparent
+    """
+    if not tracer.enabled:
+        return await call_next(request)
+    root = tracer.start_span(
+        f"HTTP {request.method}", kind=SPAN_KIND_SERVER, traceparent=request.headers.get("traceparent")
+    )
+    root.set_attribute("http.method", request.method)
+    root.set_attribute("http.target", request.url.path)
+    token = _current_span.set(root)
+    try:
+        response = await call_next(request)
+        root.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            root.status = STATUS_ERROR
+        response.headers["X-Trace-Id"] = root.trace_id
+        return response
+    except BaseException as e:
+        root.set_error(e)
+        raise
+    finally:
+        route = getattr(request.scope.get("route"), "path", None)
+        if route:
+            root.name = f"HTTP {request.method} {route}"
+            root.set_attribute("http.route", route)
+        _current_span.reset(token)
+        root.end()
+
+
+class MongoCommandTracing(monitoring.CommandListener):
+    """
+    Listener do PyMongo que cria um span CLIENT por comando enviado ao MongoDB
+    """
+
+    def __init__(self):
+        self._spans: Dict[tuple, Span] = {}
+
+    def started(self, event):
+        if not tracer.enabled or _current_span.get() is None:
+            return
+        collection = event.command.get(event.command_name)
+        mongo_span = tracer.start_span(f"mongo.{event.command_name}", kind=SPAN_KIND_CLIENT)
+        mongo_span.set_attribute("db.system", "mongodb")
+        mongo_span.set_attribute("db.name", event.database_name)
+        mongo_span.set_attribute("db.operation", event.command_name)
+        if isinstance(collection, str):
+            mongo_span.set_attribute("db.mongodb.collection", collection)
+        self._spans[(event.request_id, str(event.connection_id))] = mongo_span
+
+    def _finish(self, event, error: Optional[str] = None):
+        mongo_span = self._spans.pop((event.request_id, str(event.connection_id)), None)
+        if mongo_span is None:
+            return
+        if error:
+            mongo_span.status = STATUS_ERROR
+            mongo_span.status_message = error
+        mongo_span.end(mongo_span.start_ns + event.duration_micros * 1000)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, str(event.failure)[:500])
@@ -0,0 +1,65 @@
+"""
+Checkpoints das etapas intermediárias do try-on sequencial
+
+Cada etapa bem-sucedida é salva com a chave (usuário, hash da foto do corpo,
+prefixo de peças aplicadas). Se a peça 3 de 3 falhar, um novo pedido com as
+mesmas peças retoma a partir da imagem com as peças 1 e 2 já aplicadas,
+pagando só uma chamada à fal.ai em vez de três.
+"""
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_TTL = timedelta(seconds=int(os.environ.get('TRYON_CHECKPOINT_TTL', '3600')))
+
+
+def content_hash(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def checkpoint_key(user_id: str, body_hash: str, garment_ids: List[str]) -> str:
+    """Chave do checkpoint depois de aplicar `garment_ids`, nesta ordem"""
+    raw = "\x1f".join([user_id, body_hash, *garment_ids])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def ensure_indexes(collection) -> None:
+    await collection.create_index("expires_at", expireAfterSeconds=0)
+
+
+async def find_resume_point(collection, user_id: str, body_hash: str, garment_ids: List[str]) -> Tuple[int, Optional[str]]:
+    """
+    Retorna (etapas já concluídas, imagem resultante) para o maior prefixo de
+    `garment_ids` com checkpoint, ou (0, None) se não houver nenhum
+    """
+    keys = [checkpoint_key(user_id, body_hash, garment_ids[:n]) for n in range(1, len(garment_ids) + 1)]
+    checkpoints = await collection.find(
+        {"_id": {"$in": keys}, "expires_at": {"$gt": datetime.utcnow()}},
+        {"_id": 0, "step": 1, "image": 1}
+    ).sort("step", -1).limit(1).to_list(1)
+    if not checkpoints:
+        return 0, None
+    return checkpoints[0]["step"], checkpoints[0]["image"]
+
+
+async def save_checkpoint(collection, user_id: str, body_hash: str, garment_ids: List[str], image: str) -> None:
+    """Salva a imagem obtida depois de aplicar `garment_ids`; falhas não interrompem o try-on"""
+    now = datetime.utcnow()
+    try:
+        await collection.update_one(
+            {"_id": checkpoint_key(user_id, body_hash, garment_ids)},
+            {"$set": {
+                "user_id": user_id,
+                "step": len(garment_ids),
+                "image": image,
+                "created_at": now,
+                "expires_at": now + CHECKPOINT_TTL,
+            }},
+            upsert=True
+        )
+    except Exception as e:
+        logger.warning("Falha ao salvar checkpoint do try-on (etapa %d): %s", len(garment_ids), e)
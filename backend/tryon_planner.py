@@ -0,0 +1,84 @@
+"""
+Planejamento do try-on com várias peças
+
+Transforma as peças escolhidas pelo usuário numa sequência de etapas para a
+Fal.ai: ordena por camada (peça única, parte de baixo, parte de cima,
+sobreposição), descarta peças que o modelo não renderiza (calçados e
+acessórios) e peças encobertas por outra do mesmo espaço. A ordem não depende
+da ordem em que o app enviou os ids, então o mesmo conjunto de peças sempre
+gera os mesmos prefixos e reaproveita os checkpoints.
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from garment_taxonomy import BOTTOM, ONE_PIECE, TOP, lookup
+
+SKIP_UNRENDERABLE = "Calçados e acessórios não são aplicados no try-on"
+SKIP_COVERED = "Coberta por outra peça do mesmo tipo no look"
+SKIP_UNDER_ONE_PIECE = "Coberta pela peça única escolhida (vestido ou macacão)"
+
+
+@dataclass(frozen=True)
+class TryonStep:
+    clothing: dict
+    category: str  # tops, bottoms, one-pieces ou auto
+    layer: int
+    description: str
+
+
+@dataclass
+class TryonPlan:
+    steps: List[TryonStep] = field(default_factory=list)
+    skipped: List[dict] = field(default_factory=list)  # {"id", "nome", "motivo"}
+
+    def skip(self, clothing: dict, reason: str) -> None:
+        self.skipped.append({"id": clothing["id"], "nome": clothing["nome"], "motivo": reason})
+
+
+def _describe(clothing: dict, garment_en: str) -> str:
+    description = f"{clothing['cor']} {garment_en}"
+    if clothing.get("nome"):
+        description = f"{description} - {clothing['nome']}"
+    return description
+
+
+def _step_for(clothing: dict) -> Optional[TryonStep]:
+    garment = lookup(clothing["tipo"])
+    if garment is None:
+        # Tipo desconhecido: deixar a Fal.ai decidir a região
+        return TryonStep(clothing, "auto", TOP, _describe(clothing, clothing["tipo"]))
+    if not garment.renderable:
+        return None
+    return TryonStep(clothing, garment.fal_category, garment.layer, _describe(clothing, garment.description_en))
+
+
+def plan_tryon(clothing_items: List[dict]) -> TryonPlan:
+    """
+    Monta o plano de etapas. Em cada espaço (peça única, baixo, cima,
+    sobreposição) só a última peça escolhida é aplicada, e uma peça única
+    substitui as partes de baixo e de cima.
+    """
+    plan = TryonPlan()
+    by_slot = {}
+    extra = []  # tipos desconhecidos não disputam espaço
+
+    for clothing in clothing_items:
+        step = _step_for(clothing)
+        if step is None:
+            plan.skip(clothing, SKIP_UNRENDERABLE)
+        elif step.category == "auto":
+            extra.append(step)
+        else:
+            previous = by_slot.get(step.layer)
+            if previous is not None:
+                plan.skip(previous.clothing, SKIP_COVERED)
+            by_slot[step.layer] = step
+
+    if ONE_PIECE in by_slot:
+        for layer in (BOTTOM, TOP):
+            covered = by_slot.pop(layer, None)
+            if covered is not None:
+                plan.skip(covered.clothing, SKIP_UNDER_ONE_PIECE)
+
+    plan.steps = sorted([*by_slot.values(), *extra], key=lambda step: (step.layer, step.clothing["id"]))
+    return plan
@@ -0,0 +1,63 @@
+"""
+Resultados do try-on guardados no servidor
+
+A imagem final de cada geração fica salva sob um id (tryon_result_id) por
+TRYON_RESULT_TTL segundos. Para salvar o look o app envia só esse id em vez
+de devolver a imagem de vários MB que acabou de receber.
+"""
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from bson import Binary
+from fastapi import HTTPException
+
+from image_upload import UploadedImage, decode_data_uri
+
+logger = logging.getLogger(__name__)
+
+RESULT_TTL = timedelta(seconds=int(os.environ.get('TRYON_RESULT_TTL', str(24 * 3600))))
+
+
+async def ensure_indexes(collection) -> None:
+    await collection.create_index("expires_at", expireAfterSeconds=0)
+
+
+async def save_result(collection, user_id: str, image_data_uri: str, roupa_ids: List[str]) -> Optional[str]:
+    """Guarda a imagem final e retorna o id do resultado; falhas não interrompem o try-on"""
+    try:
+        image = decode_data_uri(image_data_uri, max_bytes=len(image_data_uri))
+    except HTTPException as e:
+        logger.warning("Resultado do try-on não guardado: %s", e.detail)
+        return None
+
+    result_id = str(uuid.uuid4())
+    now = datetime.utcnow()
+    try:
+        await collection.insert_one({
+            "_id": result_id,
+            "user_id": user_id,
+            "roupas_ids": roupa_ids,
+            "data": Binary(image.data),
+            "content_type": image.content_type,
+            "sha256": image.sha256,
+            "created_at": now,
+            "expires_at": now + RESULT_TTL,
+        })
+    except Exception as e:
+        logger.warning("Falha ao guardar o resultado do try-on: %s", e)
+        return None
+    return result_id
+
+
+async def load_result(collection, user_id: str, result_id: str) -> Optional[UploadedImage]:
+    """Imagem de um resultado ainda válido do usuário, ou None"""
+    doc = await collection.find_one(
+        {"_id": result_id, "user_id": user_id, "expires_at": {"$gt": datetime.utcnow()}},
+        {"data": 1, "content_type": 1, "sha256": 1}
+    )
+    if doc is None:
+        return None
+    return UploadedImage(bytes(doc["data"]), doc["content_type"], doc["sha256"])
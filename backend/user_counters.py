@@ -0,0 +1,64 @@
+"""
+Contadores por usuário mantidos no próprio documento do usuário
+
+Evitam count_documents a cada abertura do app: roupas, looks e favoritos
+são recontados (consulta indexada por user_id) depois de cada inserção,
+remoção ou favoritação, e a leitura só lê o campo. São eventualmente
+consistentes: se a recontagem falhar, for cancelada ou duas recontagens
+concorrentes gravarem fora de ordem, o valor se corrige na próxima alteração,
+em vez de acumular o erro como um $inc separado da escrita acumularia.
+Usuários criados antes de um contador existir recebem o valor por uma
+contagem completa na primeira leitura (backfill).
+"""
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Mapping
+
+
+@dataclass(frozen=True)
+class CounterSpec:
+    field: str  # campo no documento do usuário
+    collection: str
+    query: Mapping = field(default_factory=dict)  # filtro além de user_id
+
+
+ROUPAS = CounterSpec("roupas_count", "clothing_items")
+LOOKS = CounterSpec("looks_count", "looks")
+FAVORITOS = CounterSpec("favoritos_count", "looks", {"favorito": True})
+
+ALL_COUNTERS = (ROUPAS, LOOKS, FAVORITOS)
+
+
+def initial_counters() -> Dict[str, int]:
+    """Valores para um usuário recém-criado"""
+    return {spec.field: 0 for spec in ALL_COUNTERS}
+
+
+async def backfill(db, user_id: str, spec: CounterSpec) -> int:
+    """
+    Inicializa o contador a partir de uma contagem completa (apenas se ele
+    ainda não existir no documento do usuário)
+    """
+    count = await db[spec.collection].count_documents({"user_id": user_id, **spec.query})
+    await db.users.update_one(
+        {"id": user_id, spec.field: {"$exists": False}},
+        {"$set": {spec.field: count}}
+    )
+    return count
+
+
+async def refresh(db, user_id: str, spec: CounterSpec) -> int:
+    """Recalcula o contador depois de uma alteração na coleção contada"""
+    count = await db[spec.collection].count_documents({"user_id": user_id, **spec.query})
+    await db.users.update_one({"id": user_id}, {"$set": {spec.field: count}})
+    return count
+
+
+async def read(db, user: dict, specs: Iterable[CounterSpec] = ALL_COUNTERS) -> Dict[str, int]:
+    """Valores atuais dos contadores, a partir do documento do usuário já carregado"""
+    values = {}
+    for spec in specs:
+        if spec.field in user:
+            values[spec.field] = max(0, user[spec.field])
+        else:
+            values[spec.field] = await backfill(db, user["id"], spec)
+    return values
@@ -0,0 +1,54 @@
+"""
+Cache LRU em memória para dados derivados do guarda-roupa
+
+Índices, matrizes e contagens calculados a partir das roupas de um usuário
+são guardados com a chave (user_id, versão do guarda-roupa): quando a versão
+muda a chave antiga deixa de ser pedida e sai pelo LRU, sem invalidação
+explícita. O tamanho é limitado pelo número de entradas e, opcionalmente,
+pelo peso total (bytes) calculado por `weigh`.
+"""
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+
+V = TypeVar("V")
+
+
+class VersionedLRU(Generic[V]):
+    def __init__(self, max_entries: int, max_weight: Optional[int] = None, weigh: Optional[Callable[[V], int]] = None):
+        self.max_entries = max_entries
+        self.max_weight = max_weight
+        self.weigh = weigh or (lambda value: 0)
+        self.weight = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[V]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Hashable, value: V) -> None:
+        weight = self.weigh(value)
+        self.discard(key)
+        if self.max_weight is not None and weight > self.max_weight:
+            return  # maior que o cache inteiro: não expulsa tudo por uma entrada
+        self._entries[key] = (value, weight)
+        self.weight += weight
+        while len(self._entries) > self.max_entries or (
+            self.max_weight is not None and self.weight > self.max_weight
+        ):
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.weight -= evicted
+
+    def discard(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[1]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.weight = 0
@@ -0,0 +1,61 @@
+"""
+Busca e filtros do guarda-roupa
+
+Cada roupa guarda em `busca` as versões normalizadas (sem acento e sem
+diferença de maiúsculas) de nome, tipo, cor e estilo, que é o que os filtros
+e os índices compostos usam. Busca por prefixo usa regex ancorada em
+`busca.nome` (índice); busca por palavras usa o índice de texto em `nome`.
+As contagens por tipo e cor ($facet) ficam em cache por versão do
+guarda-roupa (`roupas_versao` no usuário, incrementada a cada inclusão ou
+remoção), então só são recalculadas quando o guarda-roupa muda.
+"""
+import re
+from typing import Dict, List, Optional
+
+from garment_taxonomy import lookup as lookup_garment, normalize
+from versioned_cache import VersionedLRU
+
+FACET_CACHE_SIZE = 1024
+
+# (user_id, roupas_versao) -> contagens por tipo e cor
+facet_cache: "VersionedLRU[Dict[str, List[dict]]]" = VersionedLRU(FACET_CACHE_SIZE)
+
+
+def canonical_tipo(tipo: str) -> str:
+    garment = lookup_garment(tipo)
+    return garment.key if garment else normalize(tipo)
+
+
+def search_fields(doc: dict) -> dict:
+    """Campo `busca` de uma roupa"""
+    return {
+        "nome": normalize(doc.get("nome") or ""),
+        "tipo": canonical_tipo(doc.get("tipo") or ""),
+        "cor": normalize(doc.get("cor") or ""),
+        "estilo": normalize(doc.get("estilo") or ""),
+    }
+
+
+def build_filter(
+    user_id: str,
+    tipo: Optional[str] = None,
+    categoria: Optional[str] = None,
+    cor: Optional[str] = None,
+    estilo: Optional[str] = None,
+    prefixo: Optional[str] = None,
+    texto: Optional[str] = None,
+) -> dict:
+    query: dict = {"user_id": user_id}
+    if tipo:
+        query["busca.tipo"] = canonical_tipo(tipo)
+    if categoria:
+        query["categoria"] = categoria
+    if cor:
+        query["busca.cor"] = normalize(cor)
+    if estilo:
+        query["busca.estilo"] = normalize(estilo)
+    if prefixo and normalize(prefixo):
+        query["busca.nome"] = {"$regex": "^" + re.escape(normalize(prefixo))}
+    if texto and texto.strip():
+        query["$text"] = {"$search": texto.strip()}
+    return query
@@ -25,7 +25,7 @@ import { BACKEND_URL } from '../config/api';
 interface User {
   email: string;
   nome: string;
-  foto_corpo: string | null;
+  foto_corpo_url: string | null;
   ocasiao_preferida: string;
 }
 
@@ -74,7 +74,6 @@ export default function Index() {
       const token = await AsyncStorage.getItem('auth_token');
       if (token) {
         await fetchUserProfile(token);
-        await fetchSubscriptionStatus(token);
         await fetchStats(token);
       }
     } catch (error) {
@@ -95,8 +94,6 @@ export default function Index() {
       if (response.ok) {
         const userData = await response.json();
         setUser(userData);
-        // Fetch subscription status after getting user
-        await fetchSubscriptionStatus(token);
       } else {
         // Token inválido, limpar storage
         await AsyncStorage.removeItem('auth_token');
@@ -129,60 +126,23 @@ export default function Index() {
 
   const fetchStats = async (token: string) => {
     try {
-      console.log('📊 Fetching stats...');
-      
-      // Fetch roupas count
-      const roupasResponse = await fetch(`${BACKEND_URL}/api/roupas?skip=0&limit=1`, {
-        headers: {
-          'Authorization': `Bearer ${token}`,
-        },
-      });
-      console.log('📦 Roupas response:', roupasResponse.status, roupasResponse.ok);
-
-      // Fetch looks count
-      const looksResponse = await fetch(`${BACKEND_URL}/api/looks?skip=0&limit=1`, {
-        headers: {
-          'Authorization': `Bearer ${token}`,
-        },
-      });
-      console.log('👔 Looks response:', looksResponse.status, looksResponse.ok);
-
-      // Fetch favoritos count
-      const favoritosResponse = await fetch(`${BACKEND_URL}/api/looks/stats/favoritos`, {
+      // Contadores e status do plano numa única requisição
+      const response = await fetch(`${BACKEND_URL}/api/dashboard`, {
         headers: {
           'Authorization': `Bearer ${token}`,
         },
       });
-      console.log('⭐ Favoritos response:', favoritosResponse.status, favoritosResponse.ok);
 
-      if (roupasResponse.ok && looksResponse.ok && favoritosResponse.ok) {
-        const roupasData = await roupasResponse.json();
-        const looksData = await looksResponse.json();
-        const favoritosData = await favoritosResponse.json();
-        
-        console.log('📊 Stats data:', {
-          roupas: roupasData,
-          looks: looksData,
-          favoritos: favoritosData
-        });
-        
+      if (response.ok) {
+        const dashboard = await response.json();
         setStats({
-          roupas: roupasData.total || 0,
-          looks: looksData.total || 0,
-          favoritos: favoritosData.count || 0,
-        });
-        
-        console.log('✅ Stats updated:', {
-          roupas: roupasData.total || 0,
-          looks: looksData.total || 0,
-          favoritos: favoritosData.count || 0
+          roupas: dashboard.roupas || 0,
+          looks: dashboard.looks || 0,
+          favoritos: dashboard.favoritos || 0,
         });
+        setSubscriptionStatus(dashboard.assinatura);
       } else {
-        console.log('❌ Some requests failed:', {
-          roupas: roupasResponse.ok,
-          looks: looksResponse.ok,
-          favoritos: favoritosResponse.ok
-        });
+        console.log('❌ Dashboard request failed:', response.status);
       }
     } catch (error) {
       console.error('❌ Error fetching stats:', error);
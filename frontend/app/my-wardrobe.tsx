@@ -54,6 +54,7 @@ export default function MyWardrobe() {
   const [page, setPage] = useState(0);
   const [hasMore, setHasMore] = useState(true);
   const [totalItems, setTotalItems] = useState(0);
+  const [tipoCounts, setTipoCounts] = useState<Record<string, number>>({});
   const [fullScreenImage, setFullScreenImage] = useState<string | null>(null);
   const modal = useModal();
   
@@ -76,8 +77,8 @@ export default function MyWardrobe() {
   ];
 
   useEffect(() => {
-    fetchClothingItems();
-  }, []);
+    fetchClothingItems(true);
+  }, [selectedFilter]);
 
   const fetchClothingItems = async (resetPage: boolean = false) => {
     try {
@@ -90,8 +91,10 @@ export default function MyWardrobe() {
       const currentPage = resetPage ? 0 : page;
       const skip = currentPage * ITEMS_PER_PAGE;
 
+      // Filtro por tipo feito no servidor (consulta indexada)
+      const tipoParam = selectedFilter === 'todos' ? '' : `&tipo=${encodeURIComponent(selectedFilter)}`;
       const response = await fetch(
-        `${BACKEND_URL}/api/roupas?skip=${skip}&limit=${ITEMS_PER_PAGE}`, 
+        `${BACKEND_URL}/api/roupas/search?skip=${skip}&limit=${ITEMS_PER_PAGE}${tipoParam}`, 
         {
           headers: {
             'Authorization': `Bearer ${token}`,
@@ -105,7 +108,7 @@ export default function MyWardrobe() {
         
         if (resetPage) {
           setClothingItems(data.items);
-          setPage(0);
+          setPage(1);
         } else {
           // Avoid duplicates by filtering out items that already exist
           setClothingItems(prev => {
@@ -117,6 +120,13 @@ export default function MyWardrobe() {
         
         setHasMore(data.has_more);
         setTotalItems(data.total);
+        if (data.facets) {
+          const counts: Record<string, number> = {};
+          data.facets.tipo.forEach((facet: { valor: string; total: number }) => {
+            counts[facet.valor] = facet.total;
+          });
+          setTipoCounts(counts);
+        }
         
         if (!resetPage) {
           setPage(currentPage + 1);
@@ -191,12 +201,11 @@ export default function MyWardrobe() {
     fetchClothingItems(true);
   };
 
-  const filteredItems = selectedFilter === 'todos' 
-    ? clothingItems 
-    : clothingItems.filter(item => item.tipo === selectedFilter);
+  const filteredItems = clothingItems;
 
+  // Contagens do guarda-roupa inteiro, não só das páginas carregadas
   const getStatsForType = (type: string) => {
-    return clothingItems.filter(item => item.tipo === type).length;
+    return tipoCounts[type] || 0;
   };
 
   if (loading) {
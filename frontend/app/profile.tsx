@@ -19,7 +19,8 @@ import { BACKEND_URL } from '../config/api';
 interface UserProfile {
   email: string;
   nome: string;
-  foto_corpo: string | null;
+  foto_corpo_url: string | null;
+  foto_corpo_hash: string | null;
   ocasiao_preferida: string;
   created_at: string;
 }
@@ -35,6 +36,7 @@ export default function Profile() {
   const [user, setUser] = useState<UserProfile | null>(null);
   const [loading, setLoading] = useState(true);
   const [uploading, setUploading] = useState(false);
+  const [authToken, setAuthToken] = useState<string | null>(null);
 
   useEffect(() => {
     fetchUserProfile();
@@ -47,6 +49,7 @@ export default function Profile() {
         Alert.alert('Erro', 'Token de autenticação não encontrado.');
         return;
       }
+      setAuthToken(token);
 
       const response = await fetch(`${BACKEND_URL}/api/auth/me`, {
         headers: {
@@ -232,10 +235,13 @@ export default function Profile() {
           </Text>
           
           <View style={styles.bodyPhotoContainer}>
-            {user.foto_corpo ? (
+            {user.foto_corpo_url ? (
               <View style={styles.bodyPhotoWithImage}>
                 <Image 
-                  source={{ uri: user.foto_corpo }} 
+                  source={{
+                    uri: `${BACKEND_URL}${user.foto_corpo_url}`,
+                    headers: { 'Authorization': `Bearer ${authToken}` },
+                  }} 
                   style={styles.bodyPhotoImage}
                   resizeMode="cover"
                 />
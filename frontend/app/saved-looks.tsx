@@ -24,10 +24,12 @@ interface Look {
   id: string;
   nome: string;
   roupas_ids: string[];
+  roupas: ClothingItem[];  // Resumo das peças, já na ordem de roupas_ids
   ocasiao: string;
   clima?: string;
   favorito: boolean;
-  imagem_look?: string;
+  imagem_url?: string | null;  // Imagem completa do try-on, carregada só ao ampliar
+  capa_url?: string | null;  // Miniatura do look (try-on reduzido ou grade das peças)
   sugestao_ia?: string;  // Texto da sugestão gerado pela IA
   created_at: string;
 }
@@ -37,13 +39,12 @@ interface ClothingItem {
   nome: string;
   tipo: string;
   cor: string;
-  estilo: string;
-  imagem_original: string;
+  imagem_url: string;  // /api/roupas/{id}/imagem
 }
 
 export default function SavedLooks() {
   const [looks, setLooks] = useState<Look[]>([]);
-  const [clothingItems, setClothingItems] = useState<ClothingItem[]>([]);
+  const [authToken, setAuthToken] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
   const [refreshing, setRefreshing] = useState(false);
   const [loadingMore, setLoadingMore] = useState(false);
@@ -56,6 +57,12 @@ export default function SavedLooks() {
   
   const ITEMS_PER_PAGE = 20;
 
+  // Rotas de imagem da API (capa, imagem do look) exigem o token; data URIs antigos vão direto
+  const imageSource = (uri: string) =>
+    uri.startsWith('/api/')
+      ? { uri: `${BACKEND_URL}${uri}`, headers: { 'Authorization': `Bearer ${authToken}` } }
+      : { uri };
+
   const filters = [
     { id: 'todos', label: 'Todos' },
     { id: 'favoritos', label: 'Favoritos' },
@@ -76,13 +83,14 @@ export default function SavedLooks() {
         Alert.alert('Erro', 'Token de autenticação não encontrado.');
         return;
       }
+      setAuthToken(token);
 
       const currentPage = resetPage ? 0 : page;
       const skip = currentPage * ITEMS_PER_PAGE;
 
-      // Fetch looks with pagination
+      // Fetch looks with pagination (já vêm com as peças de cada look)
       const looksResponse = await fetch(
-        `${BACKEND_URL}/api/looks?skip=${skip}&limit=${ITEMS_PER_PAGE}`,
+        `${BACKEND_URL}/api/looks/completos?skip=${skip}&limit=${ITEMS_PER_PAGE}`,
         {
           headers: {
             'Authorization': `Bearer ${token}`,
@@ -90,16 +98,8 @@ export default function SavedLooks() {
         }
       );
 
-      // Fetch ALL clothing items (não paginado pois é usado como referência)
-      const clothesResponse = await fetch(`${BACKEND_URL}/api/roupas?skip=0&limit=1000`, {
-        headers: {
-          'Authorization': `Bearer ${token}`,
-        },
-      });
-
-      if (looksResponse.ok && clothesResponse.ok) {
+      if (looksResponse.ok) {
         const looksData = await looksResponse.json();
-        const clothesData = await clothesResponse.json();
         
         console.log('✅ Looks carregados:', looksData.items.length, 'Total:', looksData.total);
         
@@ -115,7 +115,6 @@ export default function SavedLooks() {
           });
         }
         
-        setClothingItems(clothesData.items || clothesData);
         setHasMore(looksData.has_more);
         setTotalLooks(looksData.total);
         
@@ -221,12 +220,6 @@ export default function SavedLooks() {
     fetchData(true);
   };
 
-  const getClothingDetails = (clothingIds: string[]) => {
-    return clothingIds.map(id => 
-      clothingItems.find(item => item.id === id)
-    ).filter(Boolean) as ClothingItem[];
-  };
-
   const filteredLooks = selectedFilter === 'todos' 
     ? looks 
     : selectedFilter === 'favoritos'
@@ -348,26 +341,28 @@ export default function SavedLooks() {
             data={filteredLooks}
             keyExtractor={(item) => item.id}
             renderItem={({ item: look }) => {
-              const clothingDetails = getClothingDetails(look.roupas_ids);
+              const clothingDetails = look.roupas || [];
               
               return (
                 <View style={styles.lookCard}>
-                      {/* Look Image (if available) */}
-                      {look.imagem_look && (
+                      {/* Look Image: miniatura na lista, imagem completa ao ampliar */}
+                      {(look.capa_url || look.imagem_url) && (
                         <TouchableOpacity
                           style={styles.lookImageContainer}
-                          onPress={() => setFullScreenImage(look.imagem_look!)}
+                          onPress={() => look.imagem_url && setFullScreenImage(look.imagem_url)}
                           activeOpacity={0.8}
                         >
                           <Image
-                            source={{ uri: look.imagem_look }}
+                            source={imageSource((look.capa_url || look.imagem_url)!)}
                             style={styles.lookImage}
                             resizeMode="cover"
                           />
-                          <View style={styles.imageOverlay}>
-                            <Ionicons name="expand" size={20} color="#fff" />
-                            <Text style={styles.imageOverlayText}>Toque para ampliar</Text>
-                          </View>
+                          {look.imagem_url && (
+                            <View style={styles.imageOverlay}>
+                              <Ionicons name="expand" size={20} color="#fff" />
+                              <Text style={styles.imageOverlayText}>Toque para ampliar</Text>
+                            </View>
+                          )}
                         </TouchableOpacity>
                       )}
                       
@@ -431,12 +426,12 @@ export default function SavedLooks() {
                             <TouchableOpacity
                               key={item.id}
                               style={styles.clothingCard}
-                              onPress={() => setFullScreenImage(item.imagem_original)}
+                              onPress={() => setFullScreenImage(item.imagem_url)}
                               activeOpacity={0.8}
                             >
-                              {item.imagem_original ? (
+                              {item.imagem_url ? (
                                 <Image
-                                  source={{ uri: item.imagem_original }}
+                                  source={imageSource(item.imagem_url)}
                                   style={styles.clothingImage}
                                   resizeMode="cover"
                                 />
@@ -516,7 +511,7 @@ export default function SavedLooks() {
           
           {fullScreenImage && (
             <Image
-              source={{ uri: fullScreenImage }}
+              source={imageSource(fullScreenImage)}
               style={styles.fullScreenImage}
               resizeMode="contain"
             />
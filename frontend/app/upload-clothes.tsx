@@ -201,7 +201,10 @@ export default function UploadClothes() {
       if (response.ok) {
         const data = await response.json();
         console.log('Success response:', data);
-        showModal('success', 'Sucesso!', 'Roupa adicionada com sucesso!', [
+        const message = data.possivel_duplicata
+          ? 'Roupa adicionada! Ela parece muito com uma peça que já está no seu guarda-roupa.'
+          : 'Roupa adicionada com sucesso!';
+        showModal('success', 'Sucesso!', message, [
           { 
             text: 'Ver no Guarda-roupa', 
             onPress: () => {
@@ -0,0 +1,56 @@
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+# Os módulos do backend são planos (import direto, como no server.py)
+BACKEND_DIR = str(Path(__file__).resolve().parent.parent / "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def mongo_db():
+    from mongomock_motor import AsyncMongoMockClient
+
+    # O mongomock compartilha os dados entre clientes: um banco novo por teste
+    return AsyncMongoMockClient()[f"test_{uuid.uuid4().hex}"]
+
+
+@pytest.fixture
+def api(monkeypatch, mongo_db):
+    """Cliente HTTP do server com o banco em memória no lugar do MongoDB"""
+    for name, value in {"MONGO_URL": "mongodb://localhost:1", "DB_NAME": "test", "OPENAI_API_KEY": "test"}.items():
+        monkeypatch.setenv(name, os.environ.get(name, value))
+    # A raiz do repositório também tem um server.py (o antigo), e o `python -m pytest` a põe no sys.path
+    monkeypatch.syspath_prepend(BACKEND_DIR)
+    import server
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(server, "db", mongo_db)
+    for attr, collection in (("users_repo", "users"), ("clothing_repo", "clothing_items"), ("looks_repo", "looks")):
+        if hasattr(server, attr):
+            monkeypatch.setattr(server, attr, type(getattr(server, attr))(mongo_db[collection]))
+    return TestClient(server.app)
+
+
+@pytest.fixture
+def auth_headers(api):
+    response = api.post("/api/auth/register", json={
+        "email": f"{uuid.uuid4().hex}@teste.com", "password": "senha-forte", "nome": "Teste", "ocasiao_preferida": "casual",
+    })
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+@pytest.fixture
+def user_id(api, auth_headers):
+    import anyio
+    import server
+
+    return anyio.run(server.db.users.find_one, {})["id"]
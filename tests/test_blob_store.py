@@ -0,0 +1,117 @@
+import asyncio
+import hashlib
+import io
+
+import numpy as np
+import pytest
+from PIL import Image, ImageOps
+
+import blob_store
+from blob_store import blob_id_for, fingerprint, load_bytes, load_image, release, store
+from image_upload import UploadedImage
+
+pytestmark = pytest.mark.anyio
+
+
+def image(data: bytes, content_type: str = "image/png") -> UploadedImage:
+    return UploadedImage(data, content_type, hashlib.sha256(data).hexdigest())
+
+
+def photo(fmt: str = "PNG", size: int = 64, tint=None) -> bytes:
+    """Imagem com gradientes suaves (como uma foto), sem empates entre pixels vizinhos"""
+    y, x = np.mgrid[0:256, 0:256] / 256
+    channels = [127 + 120 * np.sin(6 * x + 3 * y), 127 + 120 * np.cos(5 * y - 2 * x), 127 + 100 * np.sin(9 * x * y)]
+    img = Image.fromarray(np.stack(channels, axis=-1).astype(np.uint8)).resize((size, size))
+    if tint:
+        # Mesma peça em outra cor: mesmos tons de cinza relativos, outra cor
+        img = ImageOps.colorize(img.convert("L"), (0, 0, 0), tint)
+    buffer = io.BytesIO()
+    img.save(buffer, fmt, quality=80)
+    return buffer.getvalue()
+
+
+async def refcount(collection, blob_id):
+    doc = await collection.find_one({"_id": blob_id})
+    return None if doc is None else doc["refcount"]
+
+
+async def test_same_image_is_stored_once_per_user(mongo_db):
+    blobs = mongo_db.image_blobs
+    first = await store(blobs, "u1", image(b"foto"))
+    second = await store(blobs, "u1", image(b"foto"))
+    other_user = await store(blobs, "u2", image(b"foto"))
+
+    assert first == second == blob_id_for("u1", image(b"foto").sha256)
+    assert other_user != first
+    assert await refcount(blobs, first) == 2
+    assert await blobs.count_documents({}) == 2
+
+
+async def test_blob_is_deleted_with_the_last_reference(mongo_db):
+    blobs = mongo_db.image_blobs
+    blob_id = await store(blobs, "u1", image(b"foto"))
+    await store(blobs, "u1", image(b"foto"))
+
+    await release(blobs, blob_id)
+    assert await refcount(blobs, blob_id) == 1
+
+    await release(blobs, blob_id)
+    assert await refcount(blobs, blob_id) is None
+
+
+async def test_release_of_a_missing_blob_is_a_no_op(mongo_db):
+    await release(mongo_db.image_blobs, "u1:nao-existe")
+
+    assert await mongo_db.image_blobs.count_documents({}) == 0
+
+
+async def test_concurrent_stores_count_every_reference(mongo_db):
+    blobs = mongo_db.image_blobs
+
+    ids = await asyncio.gather(*(store(blobs, "u1", image(b"foto")) for _ in range(5)))
+
+    assert len(set(ids)) == 1
+    assert await refcount(blobs, ids[0]) == 5
+
+
+async def test_loaders_return_the_stored_bytes(mongo_db):
+    blobs = mongo_db.image_blobs
+    blob_id = await store(blobs, "u1", image(b"foto", "image/jpeg"))
+
+    assert await load_bytes(blobs, [blob_id, None, "u1:outro"]) == {blob_id: b"foto"}
+    loaded = await load_image(blobs, blob_id)
+    assert (loaded.data, loaded.content_type) == (b"foto", "image/jpeg")
+    assert await load_image(blobs, "u1:outro") is None
+
+
+def test_fingerprint_survives_reencoding():
+    (png, png_color), (jpeg, jpeg_color) = fingerprint(photo("PNG")), fingerprint(photo("JPEG", size=128))
+
+    assert bin(int(png, 16) ^ int(jpeg, 16)).count("1") <= blob_store.DHASH_MAX_DISTANCE
+    assert max(abs(a - b) for a, b in zip(png_color, jpeg_color)) <= blob_store.COLOR_MAX_DIFFERENCE
+    assert fingerprint(b"nao e imagem") is None
+
+
+async def test_perceptual_dedup_reuses_a_reencoded_photo(mongo_db, monkeypatch):
+    monkeypatch.setattr(blob_store, "PERCEPTUAL_DEDUP", True)
+    blobs = mongo_db.image_blobs
+
+    original = await store(blobs, "u1", image(photo("PNG")))
+    reencoded = await store(blobs, "u1", image(photo("JPEG", size=128), "image/jpeg"))
+
+    assert reencoded == original
+    assert await refcount(blobs, original) == 2
+
+
+async def test_same_shape_in_another_color_is_not_merged(mongo_db, monkeypatch):
+    monkeypatch.setattr(blob_store, "PERCEPTUAL_DEDUP", True)
+    blobs = mongo_db.image_blobs
+    red, blue = photo(tint=(220, 30, 30)), photo(tint=(30, 60, 220))
+    distance = bin(int(fingerprint(red)[0], 16) ^ int(fingerprint(blue)[0], 16)).count("1")
+    assert distance <= blob_store.DHASH_MAX_DISTANCE  # o dHash sozinho não distingue
+
+    red_id = await store(blobs, "u1", image(red))
+    blue_id = await store(blobs, "u1", image(blue))
+
+    assert blue_id != red_id
+    assert await refcount(blobs, red_id) == 1
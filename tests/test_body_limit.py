@@ -0,0 +1,62 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from body_limit import BodySizeLimitMiddleware, body_bytes_in_flight, body_rejections_total
+
+LIMITS = {("POST", "/upload"): 1000}
+DEFAULT_LIMIT = 100
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+
+    @app.post("/upload")
+    @app.post("/other")
+    async def echo(request: Request):
+        return {"size": len(await request.body())}
+
+    app.add_middleware(BodySizeLimitMiddleware, limits=LIMITS, default_limit=DEFAULT_LIMIT)
+    return TestClient(app)
+
+
+def chunks(total, size=100):
+    for start in range(0, total, size):
+        yield b"x" * min(size, total - start)
+
+
+def test_body_within_the_route_limit_passes(client):
+    response = client.post("/upload", content=b"x" * 1000)
+
+    assert response.status_code == 200
+    assert response.json() == {"size": 1000}
+
+
+def test_content_length_over_the_limit_is_rejected_before_reading(client):
+    response = client.post("/upload", content=b"x" * 1001)
+
+    assert response.status_code == 413
+    assert "tamanho máximo" in response.json()["detail"]
+
+
+def test_routes_without_their_own_limit_use_the_default(client):
+    assert client.post("/other", content=b"x" * 100).status_code == 200
+    assert client.post("/other", content=b"x" * 101).status_code == 413
+
+
+def test_chunked_body_is_cut_once_the_limit_is_crossed(client):
+    assert client.post("/upload", content=chunks(1000)).status_code == 200
+    rejected_before = body_rejections_total.value(route="/upload", reason="stream")
+
+    response = client.post("/upload", content=chunks(5000))
+
+    assert response.status_code == 413
+    assert body_rejections_total.value(route="/upload", reason="stream") == rejected_before + 1
+
+
+def test_in_flight_gauge_returns_to_zero(client):
+    client.post("/upload", content=chunks(1000))
+    client.post("/upload", content=chunks(5000))
+
+    assert body_bytes_in_flight.value(route="/upload") == 0
@@ -0,0 +1,54 @@
+import base64
+import io
+
+from PIL import Image
+
+
+def jpeg_bytes() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 48), (180, 120, 90)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_profile_references_body_photo_by_hash(api, auth_headers):
+    assert api.get("/api/auth/me", headers=auth_headers).json()["foto_corpo_url"] is None
+    assert api.get("/api/foto-corpo", headers=auth_headers).status_code == 404
+
+    data = jpeg_bytes()
+    response = api.post(
+        "/api/upload-foto-corpo",
+        files={"arquivo": ("corpo.jpg", data, "image/jpeg")},
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    sha256 = response.json()["foto_corpo_hash"]
+
+    profile = api.get("/api/auth/me", headers=auth_headers).json()
+    assert profile["foto_corpo_url"] == f"/api/foto-corpo?v={sha256}"
+    assert "foto_corpo" not in profile or profile["foto_corpo"] is None
+
+    photo = api.get("/api/foto-corpo", headers=auth_headers)
+    assert photo.status_code == 200
+    assert photo.content == data
+    assert photo.headers["content-type"] == "image/jpeg"
+    assert photo.headers["etag"] == f'"{sha256}"'
+
+    cached = api.get("/api/foto-corpo", headers={**auth_headers, "If-None-Match": photo.headers["etag"]})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+
+def test_legacy_data_uri_upload_gets_the_same_reference(api, auth_headers):
+    data = jpeg_bytes()
+    data_uri = f"data:image/jpeg;base64,{base64.b64encode(data).decode('ascii')}"
+
+    response = api.post("/api/upload-foto-corpo", data={"imagem": data_uri}, headers=auth_headers)
+    assert response.status_code == 200
+
+    photo = api.get(response.json()["foto_corpo_url"], headers=auth_headers)
+    assert photo.content == data
+    assert photo.headers["etag"] == f'"{response.json()["foto_corpo_hash"]}"'
+
+
+def test_upload_without_photo_is_rejected(api, auth_headers):
+    assert api.post("/api/upload-foto-corpo", data={}, headers=auth_headers).status_code == 400
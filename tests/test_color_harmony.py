@@ -0,0 +1,145 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import color_harmony
+from color_harmony import (
+    UNKNOWN_PAIR_SCORE,
+    WardrobeHarmony,
+    _fit_budget,
+    color_from_name,
+    color_pair_matrix,
+    dominant_colors,
+    score_outfits,
+    srgb_to_lab,
+)
+
+
+def roupa(item_id, tipo, cor, estilo="casual"):
+    return {"id": item_id, "tipo": tipo, "cor": cor, "estilo": estilo}
+
+
+def test_srgb_to_lab_reference_points():
+    assert srgb_to_lab((255, 255, 255)) == pytest.approx([100, 0, 0], abs=0.01)
+    assert srgb_to_lab((0, 0, 0)) == pytest.approx([0, 0, 0], abs=0.01)
+    assert srgb_to_lab((255, 0, 0)) == pytest.approx([53.24, 80.09, 67.20], abs=0.05)
+
+
+def test_color_names_accept_plural_gender_accents_and_modifiers():
+    assert color_from_name("Pretas") == pytest.approx(color_from_name("preto"))
+    assert color_from_name("branca") == pytest.approx(color_from_name("branco"))
+    assert color_from_name("Lilás") == pytest.approx(color_from_name("lilas"))
+    assert color_from_name("azul claro")[0] > color_from_name("azul")[0] > color_from_name("azul escuro")[0]
+    assert color_from_name("furta-cor") is None
+
+
+def test_neutrals_and_analogous_colors_score_above_clashing_ones():
+    labs = np.array([color_from_name(name) for name in ("preto", "branco", "vermelho", "verde", "azul", "marinho", "pink")])
+    scores = color_pair_matrix(labs)
+    preto, branco, vermelho, verde, azul, marinho, pink = range(7)
+
+    assert np.allclose(scores, scores.T)
+    assert scores[preto, branco] > scores[vermelho, verde]
+    assert scores[preto, pink] > scores[azul, pink]
+    assert scores[azul, marinho] > scores[azul, pink]
+
+
+def test_unknown_colors_get_the_neutral_pair_score():
+    labs = np.array([color_from_name("azul"), [np.nan] * 3])
+
+    scores = color_pair_matrix(labs)
+
+    assert scores[0, 1] == scores[1, 0] == UNKNOWN_PAIR_SCORE
+
+
+def test_score_outfits_ignores_empty_slots():
+    pair_scores = np.array([
+        [1.0, 0.8, 0.2],
+        [0.8, 1.0, 0.6],
+        [0.2, 0.6, 1.0],
+    ])
+    outfits = np.array([[0, 1, -1], [0, 1, 2], [2, -1, -1]])
+
+    scores = score_outfits(pair_scores, outfits)
+
+    assert scores[0] == pytest.approx(0.8)  # um único par
+    assert scores[1] == pytest.approx(0.7 * (0.8 + 0.2 + 0.6) / 3 + 0.3 * 0.2)
+    assert np.isnan(scores[2])
+
+
+def test_wardrobe_score_by_ids():
+    harmony = WardrobeHarmony.from_clothing([
+        roupa("a", "camiseta", "branca"),
+        roupa("b", "calca", "jeans"),
+        roupa("c", "tenis", "vermelho", "esportivo"),
+    ])
+
+    scores = harmony.score([["a", "b"], ["a", "b", "c"], ["a", "nao-existe"], []])
+
+    assert scores[0] is not None and 0 < scores[0] <= 1
+    assert scores[1] is not None
+    assert scores[2:] == [None, None]
+
+
+def test_best_outfits_combine_a_top_and_a_bottom_or_a_one_piece():
+    harmony = WardrobeHarmony.from_clothing([
+        roupa("top", "camiseta", "branca"),
+        roupa("bottom", "calca", "preta"),
+        roupa("dress", "vestido", "azul"),
+        roupa("shoes", "tenis", "branco"),
+    ])
+
+    outfits = harmony.best_outfits(limit=20)
+    combinations = [set(outfit["roupas_ids"]) for outfit in outfits]
+
+    assert {"top", "bottom"} in combinations
+    assert {"dress", "shoes"} in combinations
+    assert all(not {"top", "dress"} <= combination for combination in combinations)
+    assert [outfit["pontuacao"] for outfit in outfits] == sorted((o["pontuacao"] for o in outfits), reverse=True)
+
+
+def test_fit_budget_trims_the_largest_group_first():
+    groups = [np.arange(10), np.arange(10, 14), np.arange(14, 20)]
+
+    fitted = _fit_budget(groups, [False, False, True], budget=100)
+
+    sizes = [len(group) for group in fitted]
+    assert np.prod(sizes) <= 100
+    assert fitted[2][-1] == -1  # grupo opcional mantém a opção "sem a peça"
+    assert list(fitted[0]) == list(range(sizes[0]))  # corta do fim (menos relevantes)
+
+
+def test_candidate_outfits_stay_within_the_budget(monkeypatch):
+    monkeypatch.setattr(color_harmony, "MAX_COMBINATIONS", 500)
+    cores = ["preto", "branco", "azul", "vermelho", "verde", "bege", "cinza"]
+    roupas = [roupa(f"{tipo}{i}", tipo, cores[i % len(cores)]) for tipo in ("camiseta", "calca", "tenis", "jaqueta") for i in range(12)]
+    harmony = WardrobeHarmony.from_clothing(roupas)
+
+    outfits = harmony.candidate_outfits()
+
+    assert 0 < len(outfits) <= 500
+    assert outfits.shape[1] == 4
+
+
+def test_dominant_colors_of_a_photo():
+    img = Image.new("RGB", (64, 64), (250, 250, 250))
+    img.paste((200, 30, 40), (12, 8, 52, 58))
+    buffer = io.BytesIO()
+    img.save(buffer, "PNG")
+
+    colors = dominant_colors(buffer.getvalue())
+
+    assert colors
+    main = np.array(colors[0]["lab"])
+    assert np.linalg.norm(main - srgb_to_lab((200, 30, 40))) < 10
+    assert dominant_colors(b"nao e imagem") == []
+
+
+def test_harmony_cache_is_bounded_by_matrix_bytes():
+    harmony = WardrobeHarmony.from_clothing([roupa(str(i), "camiseta", "azul") for i in range(100)])
+
+    assert harmony.nbytes == 100 * 100 * 4  # float32
+    assert color_harmony.harmony_cache.weigh(harmony) == harmony.nbytes
+    assert color_harmony.harmony_cache.max_weight == color_harmony.HARMONY_CACHE_BYTES
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from concurrency import AdaptiveConcurrencyLimiter, ProviderSaturated
+
+pytestmark = pytest.mark.anyio
+
+
+def make_limiter(**kwargs):
+    options = dict(initial_limit=2, min_limit=1, max_limit=4, max_queue=2, queue_timeout=1.0, target_latency=10.0)
+    options.update(kwargs)
+    return AdaptiveConcurrencyLimiter("test", **options)
+
+
+def test_healthy_calls_raise_the_limit_additively():
+    limiter = make_limiter()
+
+    limiter._adjust(latency=1.0, ok=True)
+    assert limiter.limit == pytest.approx(2.5)
+
+    for _ in range(50):
+        limiter._adjust(latency=1.0, ok=True)
+    assert limiter.limit == 4  # max_limit
+
+
+def test_errors_and_slow_calls_cut_the_limit_multiplicatively():
+    limiter = make_limiter(initial_limit=4)
+
+    limiter._adjust(latency=1.0, ok=False)
+    assert limiter.limit == pytest.approx(3.0)
+
+    limiter._adjust(latency=16.0, ok=True)  # acima de 1.5 x target_latency
+    assert limiter.limit == pytest.approx(2.25)
+
+    for _ in range(10):
+        limiter._adjust(latency=1.0, ok=False)
+    assert limiter.limit == 1  # min_limit
+
+
+def test_latency_between_target_and_threshold_keeps_the_limit():
+    limiter = make_limiter()
+
+    limiter._adjust(latency=12.0, ok=True)
+
+    assert limiter.limit == 2
+
+
+async def test_calls_beyond_the_limit_wait_for_a_slot():
+    limiter = make_limiter(initial_limit=1)
+    await limiter.acquire()
+
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    assert not waiter.done()
+    assert len(limiter._waiters) == 1
+
+    limiter.release(latency=0.1, ok=True)
+    await asyncio.wait_for(waiter, 1)
+    assert limiter.in_flight == 1
+    assert not limiter._waiters
+
+
+async def test_full_queue_fails_fast():
+    limiter = make_limiter(initial_limit=1, max_queue=1, queue_timeout=5.0)
+    await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+
+    with pytest.raises(ProviderSaturated) as excinfo:
+        await limiter.acquire()
+
+    assert excinfo.value.reason == "queue_full"
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+
+
+async def test_queue_timeout_leaves_no_waiter_behind():
+    limiter = make_limiter(initial_limit=1, queue_timeout=0.05, target_latency=0.01)
+    await limiter.acquire()
+
+    with pytest.raises(ProviderSaturated) as excinfo:
+        await limiter.acquire()
+
+    assert excinfo.value.reason == "queue_timeout"
+    assert not limiter._waiters
+    assert limiter.in_flight == 1
+
+
+async def test_cancelled_waiter_does_not_leak_a_slot():
+    limiter = make_limiter(initial_limit=1)
+    await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    limiter.release(latency=0.1, ok=True)
+
+    assert limiter.in_flight == 0
+    assert not limiter._waiters
+
+
+async def test_slot_marks_exceptions_as_failures():
+    limiter = make_limiter(initial_limit=4)
+
+    with pytest.raises(RuntimeError):
+        async with limiter.slot():
+            raise RuntimeError("500 do provedor")
+
+    assert limiter.in_flight == 0
+    assert limiter.limit == pytest.approx(3.0)
@@ -0,0 +1,38 @@
+import anyio
+
+
+def dashboard(api, auth_headers):
+    response = api.get("/api/dashboard", headers=auth_headers)
+    assert response.status_code == 200
+    return {key: response.json()[key] for key in ("roupas", "looks", "favoritos")}
+
+
+def test_counters_follow_looks_and_garments(api, auth_headers, user_id):
+    import server
+
+    anyio.run(server.db.clothing_items.insert_many, [
+        {"id": "r1", "user_id": user_id, "tipo": "camisa", "cor": "azul", "imagem_blob_id": None},
+        {"id": "r2", "user_id": user_id, "tipo": "calça", "cor": "preta", "imagem_blob_id": None},
+    ])
+    assert dashboard(api, auth_headers) == {"roupas": 0, "looks": 0, "favoritos": 0}
+
+    response = api.post("/api/looks", json={"nome": "Trabalho", "roupas_ids": ["r1", "r2"], "ocasiao": "trabalho"}, headers=auth_headers)
+    assert response.status_code == 200
+    assert dashboard(api, auth_headers)["looks"] == 1
+
+    # O contador é recontado, então a inserção direta acima aparece depois da remoção
+    assert api.delete("/api/roupas/r2", headers=auth_headers).status_code == 200
+    assert dashboard(api, auth_headers)["roupas"] == 1
+
+    assert api.delete(f"/api/looks/{response.json()['id']}", headers=auth_headers).status_code == 200
+    assert dashboard(api, auth_headers) == {"roupas": 1, "looks": 0, "favoritos": 0}
+
+
+def test_dashboard_backfills_users_without_counters(api, auth_headers, user_id):
+    import server
+
+    anyio.run(server.db.users.update_one, {"id": user_id}, {"$unset": {"roupas_count": "", "looks_count": "", "favoritos_count": ""}})
+    anyio.run(server.db.clothing_items.insert_one, {"id": "r1", "user_id": user_id})
+    anyio.run(server.db.looks.insert_one, {"id": "l1", "user_id": user_id, "favorito": True})
+
+    assert dashboard(api, auth_headers) == {"roupas": 1, "looks": 1, "favoritos": 1}
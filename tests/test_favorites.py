@@ -0,0 +1,36 @@
+import anyio
+
+
+def insert_looks(user_id, looks):
+    import server
+
+    anyio.run(server.db.looks.insert_many, [
+        {"id": look_id, "user_id": user_id, "nome": look_id, "roupas_ids": [], "ocasiao": "casual", "favorito": favorito}
+        for look_id, favorito in looks
+    ])
+    # Como um usuário anterior ao contador: a primeira leitura reconta
+    anyio.run(server.db.users.update_one, {"id": user_id}, {"$unset": {"favoritos_count": ""}})
+
+
+def favorites(api, auth_headers):
+    return api.get("/api/looks/stats/favoritos", headers=auth_headers).json()["count"]
+
+
+def test_deleting_a_favorite_look_decrements_the_count(api, auth_headers, user_id):
+    insert_looks(user_id, [("l1", True), ("l2", True), ("l3", False)])
+    assert favorites(api, auth_headers) == 2
+
+    assert api.delete("/api/looks/l1", headers=auth_headers).status_code == 200
+    assert favorites(api, auth_headers) == 1
+
+    assert api.delete("/api/looks/l3", headers=auth_headers).status_code == 200
+    assert favorites(api, auth_headers) == 1
+
+
+def test_unknown_look_leaves_the_count_alone(api, auth_headers, user_id):
+    insert_looks(user_id, [("l1", True)])
+    assert favorites(api, auth_headers) == 1
+
+    assert api.delete("/api/looks/outro", headers=auth_headers).status_code == 404
+    assert api.post("/api/looks/outro/favoritar", headers=auth_headers).status_code == 404
+    assert favorites(api, auth_headers) == 1
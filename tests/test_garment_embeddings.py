@@ -0,0 +1,95 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import garment_embeddings
+from garment_embeddings import (
+    EMBEDDING_DIM,
+    SimilarityIndex,
+    embed_image,
+    unpack,
+)
+
+
+def packed(vector) -> bytes:
+    vector = np.asarray(vector, dtype=np.float32)
+    return (vector / np.linalg.norm(vector)).astype(np.float16).tobytes()
+
+
+def axis(i: int, weight: float = 1.0) -> np.ndarray:
+    vector = np.full(EMBEDDING_DIM, 0.01, dtype=np.float32)
+    vector[i] = weight
+    return vector
+
+
+def garment_photo(color, stripes: bool = False) -> bytes:
+    img = Image.new("RGB", (64, 64), (250, 250, 250))
+    img.paste(color, (12, 8, 52, 58))
+    if stripes:
+        for y in range(8, 58, 6):
+            img.paste((20, 20, 20), (12, y, 52, y + 2))
+    buffer = io.BytesIO()
+    img.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_top_k_ranks_by_cosine_similarity():
+    index = SimilarityIndex([
+        {"id": "a", "embedding": packed(axis(0))},
+        {"id": "b", "embedding": packed(axis(0) + axis(1))},
+        {"id": "c", "embedding": packed(axis(5))},
+    ])
+
+    results = index.top_k(axis(0), k=2)
+
+    assert [item_id for item_id, _ in results] == ["a", "b"]
+    assert results[0][1] == pytest.approx(1.0, abs=1e-2)
+    assert results[0][1] > results[1][1]
+
+
+def test_top_k_excludes_the_query_item_and_caps_k():
+    index = SimilarityIndex([
+        {"id": "a", "embedding": packed(axis(0))},
+        {"id": "b", "embedding": packed(axis(1))},
+    ])
+
+    results = index.top_k(index.vector("a"), k=10, exclude="a")
+
+    assert [item_id for item_id, _ in results] == ["b"]
+
+
+def test_index_skips_missing_and_malformed_embeddings():
+    index = SimilarityIndex([
+        {"id": "a", "embedding": packed(axis(0))},
+        {"id": "sem", "embedding": None},
+        {"id": "vazio", "embedding": b""},
+        {"id": "curto", "embedding": b"\x00" * 10},
+    ])
+
+    assert len(index) == 1
+    assert index.vector("vazio") is None
+    assert SimilarityIndex([]).top_k(axis(0), k=3) == []
+
+
+def test_photos_of_the_same_garment_are_near_duplicates():
+    red = unpack(embed_image(garment_photo((200, 30, 40))))
+    red_again = unpack(embed_image(garment_photo((205, 28, 45))))
+    blue = unpack(embed_image(garment_photo((30, 60, 200))))
+
+    assert red.shape == (EMBEDDING_DIM,)
+    assert float(red @ red_again) >= garment_embeddings.DUPLICATE_SIMILARITY
+    assert float(red @ blue) < garment_embeddings.DUPLICATE_SIMILARITY
+
+
+def test_texture_separates_plain_from_striped():
+    plain = unpack(embed_image(garment_photo((200, 30, 40))))
+    striped = unpack(embed_image(garment_photo((200, 30, 40), stripes=True)))
+
+    assert float(plain @ striped) < garment_embeddings.DUPLICATE_SIMILARITY
+
+
+def test_unreadable_image_has_no_embedding():
+    assert embed_image(b"nao e imagem") is None
+
@@ -0,0 +1,112 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+from garment_retrieval import (
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_DIMENSIONS,
+    TextIndex,
+    build_index,
+    embed_batched,
+    garment_text,
+    query_text,
+)
+from repositories import ClothingSummary
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeEmbeddings:
+    """Vetor de cada texto = soma de um eixo por palavra; registra as chamadas"""
+
+    def __init__(self):
+        self.calls = []
+
+    @staticmethod
+    def vector(text):
+        vector = np.zeros(EMBEDDING_DIMENSIONS)
+        for word in text.lower().replace(",", " ").replace(":", " ").split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % EMBEDDING_DIMENSIONS] += 1
+        return vector.tolist()
+
+    async def __call__(self, texts):
+        self.calls.append(list(texts))
+        return [self.vector(text) for text in texts]
+
+
+def summary(item_id, tipo, cor="preto", estilo="casual", nome=None):
+    return ClothingSummary(item_id, tipo, None, cor, estilo, nome or f"{tipo} {cor}")
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_select_keeps_a_minimum_per_category():
+    categories = ["tops"] * 4 + ["bottoms"] * 2
+    matrix = np.array([unit([1, 0.1 * i]) for i in range(4)] + [unit([0, 1]), unit([0.1, 1])])
+    index = TextIndex([f"id{i}" for i in range(6)], categories, matrix)
+
+    chosen = index.select(unit([1, 0]), k=3, per_category=1)
+
+    assert len(chosen) == 3
+    assert chosen[0] == "id0"
+    assert {"id4", "id5"} & set(chosen)  # a melhor calça entra mesmo com score menor
+
+
+def test_select_orders_by_similarity():
+    matrix = np.array([unit([0, 1]), unit([1, 0]), unit([1, 1])])
+    index = TextIndex(["a", "b", "c"], ["tops", "tops", "tops"], matrix)
+
+    assert index.select(unit([1, 0]), k=3, per_category=3) == ["b", "c", "a"]
+
+
+async def test_embed_batched_splits_large_inputs():
+    embed = FakeEmbeddings()
+    texts = [f"roupa {i}" for i in range(EMBEDDING_BATCH_SIZE + 3)]
+
+    vectors = await embed_batched(embed, texts)
+
+    assert [len(call) for call in embed.calls] == [EMBEDDING_BATCH_SIZE, 3]
+    assert vectors.shape == (len(texts), EMBEDDING_DIMENSIONS)
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1)
+
+
+async def test_build_index_reuses_stored_vectors_and_embeds_only_stale_ones():
+    embed = FakeEmbeddings()
+    roupas = [summary("a", "camiseta"), summary("b", "calca", "azul")]
+    _, first_updates, _ = await build_index(roupas, {}, embed)
+    stored = {item_id: {"hash": digest, "vetor": vector} for item_id, (digest, vector) in first_updates.items()}
+
+    changed = [roupas[0], summary("b", "calca", "verde")]  # cor alterada: texto novo
+    embed.calls.clear()
+    index, updates, extra = await build_index(changed, stored, embed, extra_texts=["Roupa para trabalho"])
+
+    assert embed.calls == [["Roupa para trabalho", garment_text(changed[1])]]
+    assert set(updates) == {"b"}
+    assert extra.shape == (1, EMBEDDING_DIMENSIONS)
+    assert index.ids == ["a", "b"]
+    assert list(index.categories) == ["tops", "bottoms"]
+
+
+async def test_query_retrieves_the_matching_garments():
+    embed = FakeEmbeddings()
+    roupas = [
+        summary("blazer", "blazer", estilo="social", nome="Blazer social"),
+        summary("calca-social", "calca", estilo="social", nome="Calça social"),
+        summary("regata", "regata", estilo="praia", nome="Regata praia"),
+        summary("bermuda", "bermuda", estilo="praia", nome="Bermuda praia"),
+    ]
+    query = query_text("trabalho", None, "look social")
+    index, _, extra = await build_index(roupas, {}, embed, extra_texts=[query])
+
+    chosen = index.select(extra[0], k=2, per_category=1)
+
+    assert set(chosen) == {"blazer", "calca-social"}
+
+
+def test_query_text_includes_optional_parts():
+    assert query_text("festa", None, None) == "Roupa para festa"
+    assert query_text("festa", "frio", "algo preto") == "Roupa para festa, temperatura frio, algo preto"
@@ -0,0 +1,50 @@
+import pytest
+
+from garment_taxonomy import (
+    BOTTOMS,
+    ONE_PIECE,
+    OUTERWEAR,
+    SHOES,
+    TOP,
+    TOPS,
+    garment_fields,
+    lookup,
+    normalize,
+)
+
+
+def test_normalize_folds_accents_case_and_spaces():
+    assert normalize(" Calça ") == "calca"
+    assert normalize("ÓCULOS") == "oculos"
+
+
+@pytest.mark.parametrize("tipo, key", [
+    ("Calça", "calca"),
+    ("calcas", "calca"),
+    ("Bermuda", "shorts"),
+    ("T-Shirt", "camiseta"),
+    ("Tênis", "tenis"),
+])
+def test_lookup_accepts_free_text_and_synonyms(tipo, key):
+    assert lookup(tipo).key == key
+
+
+def test_lookup_of_unknown_or_empty_tipo():
+    assert lookup("capa de chuva") is None
+    assert lookup("") is None
+    assert lookup(None) is None
+
+
+def test_rendering_attributes():
+    jaqueta, vestido, tenis = lookup("jaqueta"), lookup("vestido"), lookup("tenis")
+
+    assert (jaqueta.fal_category, jaqueta.layer) == ("tops", OUTERWEAR)
+    assert vestido.layer == ONE_PIECE < TOP
+    assert tenis.category == SHOES and not tenis.renderable
+    assert lookup("camisa").category_label == "parte de cima"
+
+
+def test_garment_fields_keep_the_canonical_key_apart():
+    assert garment_fields("Calças") == {"tipo_canonico": "calca", "categoria": BOTTOMS}
+    assert garment_fields("Regata") == {"tipo_canonico": "camiseta", "categoria": TOPS}
+    assert garment_fields("capa de chuva") == {"tipo_canonico": None, "categoria": None}
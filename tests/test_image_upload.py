@@ -0,0 +1,74 @@
+import base64
+import hashlib
+import io
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from image_upload import decode_data_uri, read_upload, sniff_content_type
+
+pytestmark = pytest.mark.anyio
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x01" * 200
+JPEG = b"\xff\xd8\xff\xe0" + b"\x02" * 200
+
+
+def upload(data: bytes) -> UploadFile:
+    return UploadFile(io.BytesIO(data), filename="foto")
+
+
+@pytest.mark.parametrize("head, content_type", [
+    (PNG, "image/png"),
+    (JPEG, "image/jpeg"),
+    (b"RIFF\x00\x00\x00\x00WEBPVP8 ", "image/webp"),
+    (b"\x00\x00\x00\x18ftypheic", "image/heic"),
+])
+def test_content_type_comes_from_the_bytes(head, content_type):
+    assert sniff_content_type(head[:16]) == content_type
+
+
+def test_other_formats_are_rejected():
+    with pytest.raises(HTTPException) as excinfo:
+        sniff_content_type(b"%PDF-1.7")
+    assert excinfo.value.status_code == 400
+
+
+async def test_upload_is_hashed_while_read():
+    image = await read_upload(upload(PNG))
+
+    assert (image.data, image.content_type, image.size) == (PNG, "image/png", len(PNG))
+    assert image.sha256 == hashlib.sha256(PNG).hexdigest()
+
+
+async def test_upload_over_the_limit_is_rejected():
+    with pytest.raises(HTTPException) as excinfo:
+        await read_upload(upload(PNG), max_bytes=100)
+    assert excinfo.value.status_code == 413
+
+
+async def test_empty_upload_is_rejected():
+    with pytest.raises(HTTPException) as excinfo:
+        await read_upload(upload(b""))
+    assert excinfo.value.status_code == 400
+
+
+def test_data_uri_round_trip():
+    data_uri = "data:image/jpeg;base64," + base64.b64encode(JPEG).decode()
+
+    image = decode_data_uri(data_uri)
+
+    assert image.content_type == "image/jpeg"
+    assert image.sha256 == hashlib.sha256(JPEG).hexdigest()
+    assert image.to_data_uri() == data_uri
+
+
+@pytest.mark.parametrize("value, status", [
+    ("nao e data uri", 400),
+    ("data:text/plain;base64,aGVsbG8=", 400),
+    ("data:image/png;base64,%%%", 400),
+    ("data:image/png;base64," + base64.b64encode(PNG).decode(), 413),
+])
+def test_invalid_or_large_data_uris(value, status):
+    with pytest.raises(HTTPException) as excinfo:
+        decode_data_uri(value, max_bytes=100)
+    assert excinfo.value.status_code == status
@@ -0,0 +1,76 @@
+import logging
+import queue
+
+from log_config import (
+    REDACTED,
+    DeferredQueueHandler,
+    RedactingFilter,
+    SamplingFilter,
+    redact,
+    redact_text,
+)
+
+PREFIX = "data:image/png;base64,"
+DATA_URI = PREFIX + "A" * (4096 - len(PREFIX))  # 4 KB no total
+
+
+def record(msg, *args, level=logging.INFO, **extra):
+    rec = logging.LogRecord("test", level, __file__, 1, msg, args or None, None)
+    rec.__dict__.update(extra)
+    return rec
+
+
+def test_redact_masks_secrets_and_summarizes_images():
+    value = {"email": "a@b.com", "password": "segredo", "Token": "abc", "imagem_original": DATA_URI, "nested": [{"reset_code": "123"}]}
+
+    redacted = redact(value)
+
+    assert redacted["email"] == "a@b.com"
+    assert redacted["password"] == redacted["Token"] == redacted["nested"][0]["reset_code"] == REDACTED
+    assert redacted["imagem_original"] == "<image/png 4.0KB>"
+    assert value["password"] == "segredo"  # o original não é alterado
+
+
+def test_redact_text_replaces_inline_base64_and_truncates():
+    text = f"payload {DATA_URI} fim"
+
+    assert redact_text(text, 512) == "payload <image/png 4.0KB> fim"
+    assert redact_text("x" * 20, 10) == "x" * 10 + "…(+10 chars)"
+
+
+def test_redacting_filter_applies_to_args():
+    rec = record("login %s", {"email": "a@b.com", "password": "segredo"})
+
+    RedactingFilter().filter(rec)
+
+    assert "segredo" not in rec.getMessage()
+
+
+def test_sampling_only_drops_marked_info_logs():
+    never = SamplingFilter(0.0)
+
+    assert not never.filter(record("x", sample=True))
+    assert never.filter(record("x"))
+    assert never.filter(record("x", level=logging.WARNING, sample=True))
+
+
+def test_queue_handler_formats_the_message_before_enqueueing():
+    log_queue = queue.Queue()
+    handler = DeferredQueueHandler(log_queue)
+    payload = {"roupas": ["a"]}
+
+    handler.handle(record("look %s", payload))
+    payload["roupas"].append("b")  # a requisição continua alterando o objeto
+
+    queued = log_queue.get_nowait()
+    assert queued.getMessage() == "look {'roupas': ['a']}"
+    assert queued.args is None
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DeferredQueueHandler(queue.Queue(maxsize=1))
+
+    handler.handle(record("primeiro"))
+    handler.handle(record("segundo"))
+
+    assert handler.queue.qsize() == 1
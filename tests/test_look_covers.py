@@ -0,0 +1,91 @@
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+
+import look_covers
+from look_covers import COVER_SIZE, delete_cover, load_cover, render_cover, save_cover, schedule
+
+pytestmark = pytest.mark.anyio
+
+
+def encode(img: Image.Image, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def decode(data: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(data)).convert("RGB")
+
+
+def test_look_image_is_cropped_to_the_cover_size():
+    cover = decode(render_cover(encode(Image.new("RGB", (600, 600), (200, 30, 30)), "JPEG"), []))
+
+    assert cover.size == COVER_SIZE
+    r, g, b = cover.getpixel((COVER_SIZE[0] // 2, COVER_SIZE[1] // 2))
+    assert r > 150 and g < 80 and b < 80
+
+
+def test_transparent_garments_get_a_white_background():
+    garment = Image.new("RGBA", (100, 100), (0, 0, 0, 0))
+    garment.paste((0, 0, 255, 255), (40, 40, 60, 60))
+
+    cover = decode(render_cover(None, [encode(garment, "PNG")]))
+
+    assert cover.size == COVER_SIZE
+    assert min(cover.getpixel((2, 2))) > 240
+
+
+def test_unreadable_look_image_falls_back_to_the_grid():
+    garments = [encode(Image.new("RGB", (50, 80), color), "PNG") for color in ("red", "green", "blue", "black", "white")]
+
+    cover = render_cover(b"nao e imagem", garments)
+
+    assert decode(cover).size == COVER_SIZE
+    assert render_cover(b"nao e imagem", [b"nem esta"]) is None
+
+
+async def test_cover_is_stored_per_look_and_owner(mongo_db):
+    sha256 = await save_cover(mongo_db.look_covers, "u1", "l1", b"jpeg")
+
+    cover = await load_cover(mongo_db.look_covers, "u1", "l1")
+    assert (bytes(cover["data"]), cover["sha256"]) == (b"jpeg", sha256)
+    assert await load_cover(mongo_db.look_covers, "u2", "l1") is None
+
+    await delete_cover(mongo_db.look_covers, "l1")
+    assert await load_cover(mongo_db.look_covers, "u1", "l1") is None
+
+
+async def test_schedule_skips_looks_already_rendering():
+    calls = []
+    release = asyncio.Event()
+
+    async def job():
+        calls.append(1)
+        await release.wait()
+
+    schedule(job, "l1")
+    schedule(job, "l1", if_idle=True)
+    await asyncio.sleep(0)
+    assert calls == [1]
+
+    release.set()
+    while look_covers._pending:
+        await asyncio.sleep(0)
+    schedule(job, "l1", if_idle=True)
+    await asyncio.sleep(0)
+    assert calls == [1, 1]
+    await asyncio.gather(*look_covers._pending)
+
+
+async def test_failed_job_is_only_logged(caplog):
+    async def job():
+        raise RuntimeError("pool fora do ar")
+
+    schedule(job, "l1")
+    await asyncio.gather(*look_covers._pending)
+
+    assert "Falha ao gerar a capa do look l1" in caplog.text
+    assert "l1" not in look_covers._pending_looks
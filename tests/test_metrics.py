@@ -0,0 +1,69 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import metrics
+from metrics import MetricsRegistry, metrics_middleware
+
+
+def test_counter_exposition_escapes_label_values():
+    registry = MetricsRegistry()
+    counter = registry.counter("jobs_total", "Tarefas", ["name"])
+    counter.inc(name='a"b')
+    counter.inc(2, name='a"b')
+
+    assert registry.render() == (
+        "# HELP jobs_total Tarefas\n"
+        "# TYPE jobs_total counter\n"
+        'jobs_total{name="a\\"b"} 3.0\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency_seconds", "Latência", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+
+    lines = registry.render().splitlines()
+
+    assert 'latency_seconds_bucket{le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{le="1.0"} 3' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert "latency_seconds_sum 3.65" in lines
+    assert "latency_seconds_count 4" in lines
+
+
+def test_labels_must_match_the_declaration():
+    gauge = MetricsRegistry().gauge("in_progress", "Em andamento", ["method"])
+
+    with pytest.raises(ValueError):
+        gauge.inc(route="/x")
+
+
+def test_duplicate_metric_names_are_rejected():
+    registry = MetricsRegistry()
+    registry.counter("x_total", "x")
+
+    with pytest.raises(ValueError):
+        registry.gauge("x_total", "x")
+
+
+def test_middleware_labels_requests_by_route_template():
+    app = FastAPI()
+
+    @app.get("/looks/{look_id}")
+    async def get_look(look_id: str):
+        return {"id": look_id}
+
+    app.middleware("http")(metrics_middleware)
+    client = TestClient(app)
+    before = metrics.http_requests_total.value(method="GET", route="/looks/{look_id}", status="200")
+
+    client.get("/looks/1")
+    client.get("/looks/2")
+    client.get("/nao-existe")
+
+    assert metrics.http_requests_total.value(method="GET", route="/looks/{look_id}", status="200") == before + 2
+    assert metrics.http_requests_total.value(method="GET", route="unmatched", status="404") >= 1
+    assert metrics.http_requests_in_progress.value(method="GET") == 0
@@ -0,0 +1,105 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from quota import LOOKS_QUOTA, QuotaExceeded, QuotaPolicy, remaining, reserve
+
+pytestmark = pytest.mark.anyio
+
+
+async def looks_usados(users, user_id="u1"):
+    return (await users.find_one({"id": user_id}))["looks_usados"]
+
+
+async def test_reserve_counts_until_the_free_limit(mongo_db):
+    await mongo_db.users.insert_one({"id": "u1", "looks_usados": 3})
+
+    first = await reserve(mongo_db.users, "u1", "free", LOOKS_QUOTA)
+    second = await reserve(mongo_db.users, "u1", "free", LOOKS_QUOTA)
+
+    assert (first.used, second.used) == (4, 5)
+    with pytest.raises(QuotaExceeded) as excinfo:
+        await reserve(mongo_db.users, "u1", "free", LOOKS_QUOTA)
+    assert excinfo.value.limit == 5
+    assert await looks_usados(mongo_db.users) == 5
+
+
+async def test_reserve_initializes_a_missing_counter(mongo_db):
+    await mongo_db.users.insert_one({"id": "u1"})
+
+    reservation = await reserve(mongo_db.users, "u1", "free", LOOKS_QUOTA)
+
+    assert reservation.used == 1
+
+
+async def test_paid_plans_are_unlimited(mongo_db):
+    await mongo_db.users.insert_one({"id": "u1", "looks_usados": 500})
+
+    reservation = await reserve(mongo_db.users, "u1", "mensal", LOOKS_QUOTA)
+
+    assert reservation.used == 501
+    assert remaining({"looks_usados": 501}, "mensal", LOOKS_QUOTA) is None
+
+
+async def test_concurrent_reservations_never_exceed_the_limit(mongo_db):
+    await mongo_db.users.insert_one({"id": "u1", "looks_usados": 0})
+
+    results = await asyncio.gather(
+        *(reserve(mongo_db.users, "u1", "free", LOOKS_QUOTA) for _ in range(8)),
+        return_exceptions=True,
+    )
+
+    assert sum(not isinstance(result, QuotaExceeded) for result in results) == 5
+    assert await looks_usados(mongo_db.users) == 5
+
+
+async def test_refund_gives_the_unit_back_once(mongo_db):
+    await mongo_db.users.insert_one({"id": "u1", "looks_usados": 4})
+    reservation = await reserve(mongo_db.users, "u1", "free", LOOKS_QUOTA)
+
+    await reservation.refund()
+    await reservation.refund()
+
+    assert await looks_usados(mongo_db.users) == 4
+
+
+async def test_refund_after_commit_is_ignored(mongo_db):
+    await mongo_db.users.insert_one({"id": "u1", "looks_usados": 0})
+    reservation = await reserve(mongo_db.users, "u1", "free", LOOKS_QUOTA)
+
+    await reservation.commit()
+    await reservation.refund()
+
+    assert await looks_usados(mongo_db.users) == 1
+
+
+async def test_context_manager_commits_or_refunds(mongo_db):
+    await mongo_db.users.insert_one({"id": "u1", "looks_usados": 0})
+
+    async with await reserve(mongo_db.users, "u1", "free", LOOKS_QUOTA):
+        pass
+    with pytest.raises(RuntimeError):
+        async with await reserve(mongo_db.users, "u1", "free", LOOKS_QUOTA):
+            raise RuntimeError("fal.ai falhou")
+
+    assert await looks_usados(mongo_db.users) == 1
+
+
+async def test_windowed_quota_resets_after_the_window(mongo_db):
+    policy = QuotaPolicy(name="diario", counter_field="usos", limits={"default": 2}, window=timedelta(days=1))
+    await mongo_db.users.insert_one({"id": "u1", "usos": 2, "usos_inicio": datetime.utcnow()})
+
+    with pytest.raises(QuotaExceeded):
+        await reserve(mongo_db.users, "u1", "free", policy)
+
+    await mongo_db.users.update_one({"id": "u1"}, {"$set": {"usos_inicio": datetime.utcnow() - timedelta(days=2)}})
+    reservation = await reserve(mongo_db.users, "u1", "free", policy)
+
+    assert reservation.used == 1
+
+
+def test_remaining_never_goes_negative():
+    assert remaining({"looks_usados": 2}, "free", LOOKS_QUOTA) == 3
+    assert remaining({}, "free", LOOKS_QUOTA) == 5
+    assert remaining({"looks_usados": 9}, "free", LOOKS_QUOTA) == 0
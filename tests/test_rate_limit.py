@@ -0,0 +1,86 @@
+import pytest
+
+import rate_limit
+from rate_limit import BucketSpec, InMemoryBucketBackend, MongoBucketBackend, RateLimiter, RouteLimit
+
+pytestmark = pytest.mark.anyio
+
+ROUTE = ("POST", "/api/gerar-look-visual")
+SLOW_REFILL = 1 / 3600  # praticamente sem reposição durante o teste
+
+
+@pytest.fixture(params=["memory", "mongo"])
+def backend(request, mongo_db):
+    if request.param == "memory":
+        return InMemoryBucketBackend()
+    return MongoBucketBackend(mongo_db.rate_limits)
+
+
+def limiter(backend, per_user=2, global_=3):
+    limits = {ROUTE: RouteLimit(BucketSpec(per_user, SLOW_REFILL), BucketSpec(global_, SLOW_REFILL))}
+    return RateLimiter(backend, identify=None, limits=limits)
+
+
+async def allowed(limiter, identity):
+    decision, _ = await limiter.check(*ROUTE, identity)
+    return decision.allowed
+
+
+async def test_bucket_allows_a_burst_up_to_capacity(backend):
+    spec = BucketSpec(3, SLOW_REFILL)
+
+    decisions = [await backend.take("k", spec) for _ in range(4)]
+
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    assert decisions[2].remaining == pytest.approx(0, abs=1e-3)
+    assert decisions[3].retry_after > 0
+
+
+async def test_bucket_refills_over_time(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: clock[0])
+    backend = InMemoryBucketBackend()
+    spec = BucketSpec.per_minute(capacity=1, per_minute=6)  # um token a cada 10s
+
+    assert (await backend.take("k", spec)).allowed
+    denied = await backend.take("k", spec)
+    assert not denied.allowed
+    assert denied.retry_after == pytest.approx(10)
+
+    clock[0] += 10
+    assert (await backend.take("k", spec)).allowed
+
+
+async def test_refund_never_exceeds_capacity(backend):
+    spec = BucketSpec(2, SLOW_REFILL)
+    await backend.take("k", spec)
+
+    await backend.refund("k", spec)
+    await backend.refund("k", spec)
+
+    assert [(await backend.take("k", spec)).allowed for _ in range(3)] == [True, True, False]
+
+
+async def test_user_limit_does_not_consume_the_global_bucket(backend):
+    rl = limiter(backend, per_user=2, global_=3)
+
+    assert [await allowed(rl, "abuser") for _ in range(5)] == [True, True, False, False, False]
+    # Só as 2 requisições aceitas gastaram o global: ainda sobra 1 vaga
+    assert await allowed(rl, "other")
+    assert not await allowed(rl, "third")
+
+
+async def test_global_denial_refunds_the_user_token(backend):
+    rl = limiter(backend, per_user=1, global_=1)
+
+    assert await allowed(rl, "a")
+    assert not await allowed(rl, "b")  # global esgotado
+    # O token de "b" foi devolvido: negado só pelo global, não pelo próprio limite
+    decision, _ = await rl.check(*ROUTE, "b")
+    assert decision.retry_after == pytest.approx(1 / SLOW_REFILL, rel=0.01)
+    user_bucket = await backend.take("user:b:/api/gerar-look-visual", BucketSpec(1, SLOW_REFILL))
+    assert user_bucket.allowed
+
+
+async def test_routes_without_limits_are_not_checked(backend):
+    assert await limiter(backend).check("GET", "/api/roupas", "a") is None
@@ -0,0 +1,148 @@
+import pytest
+
+from repositories import BodyPhoto, ClothingRepository, ClothingSummary, LookRepository, UserRepository
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def users(mongo_db):
+    return UserRepository(mongo_db.users)
+
+
+@pytest.fixture
+def clothing(mongo_db):
+    return ClothingRepository(mongo_db.clothing_items)
+
+
+@pytest.fixture
+def looks(mongo_db):
+    return LookRepository(mongo_db.looks)
+
+
+def garment(item_id, user_id="u1", **fields):
+    return {
+        "id": item_id, "user_id": user_id, "tipo": "camisa", "cor": "azul", "estilo": "casual", "nome": item_id,
+        "imagem_original": "data:image/jpeg;base64,AAAA", **fields,
+    }
+
+
+async def test_profile_never_carries_the_body_photo_or_password(users):
+    await users.insert({
+        "id": "u1", "email": "a@b.com", "nome": "Ana", "password_hash": "hash", "foto_corpo": "data:image/jpeg;base64,AAAA",
+        "foto_corpo_hash": "abc", "reset_code": "123456",
+    })
+
+    profile = await users.get("u1")
+    assert profile["email"] == "a@b.com"
+    assert not {"foto_corpo", "password_hash", "reset_code", "_id"} & profile.keys()
+    assert await users.get_by_email("a@b.com") == profile
+
+    assert (await users.get_credentials("a@b.com"))["password_hash"] == "hash"
+    assert (await users.get_reset_code("a@b.com"))["reset_code"] == "123456"
+    assert await users.get_body_photo("u1") == BodyPhoto("data:image/jpeg;base64,AAAA", "abc")
+
+
+async def test_body_photo_hash_is_only_backfilled_once(users):
+    await users.insert({"id": "u1", "email": "a@b.com"})
+
+    await users.set_body_photo_hash_if_missing("u1", None)
+    await users.set_body_photo_hash_if_missing("u1", "tarde-demais")
+    assert (await users.get("u1"))["foto_corpo_hash"] is None
+
+    await users.set_body_photo("u1", "data:image/jpeg;base64,AAAA", "abc")
+    assert (await users.get_body_photo("u1")).sha256 == "abc"
+
+
+async def test_get_many_keeps_the_requested_order_and_owner(clothing):
+    for doc in (garment("r1"), garment("r2"), garment("r3", user_id="u2")):
+        await clothing.insert(doc)
+
+    items = await clothing.get_many("u1", ["r2", "r3", "r1"])
+
+    assert [item["id"] for item in items] == ["r2", "r1"]
+    assert "busca" not in items[0] and "_id" not in items[0]
+    assert await clothing.missing_ids("u1", ["r1", "r3", "r9"]) == ["r3", "r9"]
+    assert await clothing.owner_of("r3") == "u2"
+    assert await clothing.owner_of("r9") is None
+
+
+async def test_summaries_have_no_images(clothing):
+    await clothing.insert(garment("r1", categoria="top"))
+
+    assert await clothing.summaries("u1") == [ClothingSummary("r1", "camisa", "top", "azul", "casual", "r1")]
+
+
+async def test_delete_returns_the_image_reference(clothing):
+    await clothing.insert(garment("r1", imagem_blob_id="u1:sha"))
+
+    assert await clothing.delete("u2", "r1") is None
+    assert await clothing.delete("u1", "r1") == {"id": "r1", "imagem_blob_id": "u1:sha"}
+    assert await clothing.count("u1") == 0
+
+
+class FakeLooks:
+    """find_one_and_update com pipeline, que o mongomock ignora"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def find_one_and_update(self, query, update, projection, return_document):
+        doc = next((d for d in self.docs if d["id"] == query["id"] and d["user_id"] == query["user_id"]), None)
+        if doc is None:
+            return None
+        assert update == [{"$set": {"favorito": {"$ne": ["$favorito", True]}}}]
+        doc["favorito"] = doc.get("favorito") is not True
+        return {"favorito": doc["favorito"]}
+
+
+async def test_toggle_favorite_flips_and_reports_missing_looks():
+    looks = LookRepository(FakeLooks([{"id": "l1", "user_id": "u1"}]))
+
+    assert await looks.toggle_favorite("u1", "l1") is True
+    assert await looks.toggle_favorite("u1", "l1") is False
+    assert await looks.toggle_favorite("u2", "l1") is None
+
+
+async def test_look_listing_leaves_the_full_image_out(looks):
+    await looks.insert({"id": "l1", "user_id": "u1", "created_at": 1, "imagem_blob_id": "u1:sha"})
+    await looks.insert({"id": "l2", "user_id": "u1", "created_at": 2, "imagem_look": "data:image/png;base64,AAAA"})
+    await looks.insert({"id": "l3", "user_id": "u1", "created_at": 3, "imagem_look": None})
+
+    page = await looks.list_page("u1", 0, 10)
+
+    assert [(look["id"], look["tem_imagem"]) for look in page] == [("l3", False), ("l2", True), ("l1", True)]
+    assert not any("imagem_look" in look for look in page)
+
+
+class FakeAggregate:
+    """aggregate que devolve documentos prontos: o mongomock não roda $lookup com pipeline"""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.pipeline = None
+
+    def aggregate(self, pipeline, **kwargs):
+        self.pipeline = pipeline
+        return self
+
+    async def to_list(self, length):
+        return self.docs
+
+
+async def test_look_clothing_follows_roupas_ids_and_skips_deleted_items():
+    collection = FakeAggregate([{
+        "id": "l1", "roupas_ids": ["r2", "r9", "r1"],
+        "roupas": [{"id": "r1", "nome": "Camisa"}, {"id": "r2", "nome": "Calça"}],
+    }])
+
+    page = await LookRepository(collection).list_page_with_clothing("u1", 0, 20)
+
+    assert [roupa["id"] for roupa in page[0]["roupas"]] == ["r2", "r1"]
+    lookup = next(stage["$lookup"] for stage in collection.pipeline if "$lookup" in stage)
+    assert lookup["from"] == "clothing_items"
+    assert lookup["pipeline"] == [
+        {"$match": {"user_id": "u1"}},
+        {"$project": LookRepository.CLOTHING_SUMMARY_PROJECTION},
+    ]
+    assert "imagem_original" not in LookRepository.CLOTHING_SUMMARY_PROJECTION
@@ -0,0 +1,232 @@
+import anyio
+import pytest
+
+import resilience
+from concurrency import ProviderSaturated
+from resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryPolicy,
+    TransientProviderError,
+    is_safe_to_resend,
+    is_transient,
+    resilient_call,
+)
+
+pytestmark = pytest.mark.anyio
+
+NO_WAIT = RetryPolicy(max_attempts=3, base_delay=0.0, max_delay=0.0, deadline=5.0)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(resilience, "_breakers", {})
+
+
+class ConnectTimeout(Exception):
+    pass
+
+
+class ClientError(Exception):
+    status_code = 400
+
+
+def open_breaker(clock, threshold=2):
+    breaker = CircuitBreaker("test", failure_threshold=threshold, reset_timeout=30.0)
+    for _ in range(threshold):
+        breaker.before_call()
+        breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30.0)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.before_call()
+    assert excinfo.value.retry_after == pytest.approx(30.0)
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    breaker.before_call()
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_success()
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_allows_a_single_probe(clock):
+    breaker = open_breaker(clock)
+    clock.now += 30
+
+    breaker.before_call()
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_probe_result_closes_or_reopens(clock):
+    breaker = open_breaker(clock)
+    clock.now += 30
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now += 30
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_client_error_on_the_probe_closes_the_breaker(clock):
+    breaker = open_breaker(clock)
+    clock.now += 30
+    breaker.before_call()
+
+    breaker.record_neutral()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_released_probe_keeps_the_breaker_half_open(clock):
+    breaker = open_breaker(clock)
+    clock.now += 30
+    breaker.before_call()
+
+    breaker.release_probe()
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call()  # outra chamada pode ser a sonda
+
+
+def test_error_classification():
+    assert is_transient(TransientProviderError("x", 503))
+    assert is_transient(ConnectTimeout())  # pelo nome da classe
+    assert not is_transient(ClientError())
+
+    assert is_safe_to_resend(TransientProviderError("x", 429))
+    assert not is_safe_to_resend(TransientProviderError("x", 503))
+    wrapped = RuntimeError("falha ao enviar")
+    wrapped.__cause__ = ConnectTimeout()
+    assert is_safe_to_resend(wrapped)
+
+
+async def test_resilient_call_retries_transient_errors(clock):
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise TransientProviderError("test", 503)
+        return "ok"
+
+    assert await resilient_call("test", flaky, policy=NO_WAIT) == "ok"
+    assert len(calls) == 3
+
+
+async def test_non_idempotent_calls_are_not_resent_after_reaching_the_provider(clock):
+    calls = []
+
+    async def post():
+        calls.append(1)
+        raise TransientProviderError("test", 503)
+
+    with pytest.raises(TransientProviderError):
+        await resilient_call("test", post, idempotent=False, policy=NO_WAIT)
+    assert len(calls) == 1
+
+
+async def test_non_idempotent_calls_are_resent_on_connect_errors(clock):
+    calls = []
+
+    async def post():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectTimeout()
+        return "ok"
+
+    assert await resilient_call("test", post, idempotent=False, policy=NO_WAIT) == "ok"
+    assert len(calls) == 2
+
+
+async def test_client_errors_are_not_retried(clock):
+    calls = []
+
+    async def bad_request():
+        calls.append(1)
+        raise ClientError()
+
+    with pytest.raises(ClientError):
+        await resilient_call("test", bad_request, policy=NO_WAIT)
+    assert len(calls) == 1
+
+
+async def test_local_saturation_does_not_touch_the_breaker(clock):
+    breaker = resilience.get_breaker("test")
+    breaker.failure_threshold = 1
+    breaker.before_call()
+    breaker.record_failure()
+    clock.now += breaker.reset_timeout
+
+    async def saturated():
+        raise ProviderSaturated("test", 10.0, "queue_full")
+
+    with pytest.raises(ProviderSaturated):
+        await resilient_call("test", saturated, policy=NO_WAIT)
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker._probe_in_flight
+
+
+async def test_cancelled_probe_frees_the_half_open_slot(clock):
+    breaker = resilience.get_breaker("test")
+    breaker.failure_threshold = 1
+    breaker.before_call()
+    breaker.record_failure()
+    clock.now += breaker.reset_timeout
+    started = anyio.Event()
+
+    async def hanging():
+        started.set()
+        await anyio.sleep_forever()
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(resilient_call, "test", hanging, True, NO_WAIT)
+        await started.wait()
+        tg.cancel_scope.cancel()
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    async def ok():
+        return "ok"
+
+    assert await resilient_call("test", ok, policy=NO_WAIT) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
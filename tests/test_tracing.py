@@ -0,0 +1,89 @@
+import pytest
+
+from tracing import (
+    NOOP_SPAN,
+    SPAN_KIND_CLIENT,
+    STATUS_ERROR,
+    current_span,
+    inject_headers,
+    span,
+    tracer,
+)
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+class Recorder:
+    def __init__(self):
+        self.spans = []
+
+    def on_end(self, finished):
+        self.spans.append(finished)
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    recorder = Recorder()
+    monkeypatch.setattr(tracer, "enabled", True)
+    monkeypatch.setattr(tracer, "sample_rate", 1.0)
+    monkeypatch.setattr(tracer, "processor", recorder)
+    return recorder
+
+
+def test_disabled_tracer_hands_out_the_noop_span():
+    with span("qualquer") as current:
+        assert current is NOOP_SPAN
+    assert inject_headers({}) == {}
+
+
+def test_nested_spans_share_the_trace(recorder):
+    with span("pai") as parent:
+        with span("filho", kind=SPAN_KIND_CLIENT, provider="fal") as child:
+            assert current_span() is child
+            headers = inject_headers({})
+
+    assert [s.name for s in recorder.spans] == ["filho", "pai"]
+    assert child.trace_id == parent.trace_id
+    assert child.parent_id == parent.span_id
+    assert child.attributes == {"provider": "fal"}
+    assert headers["traceparent"] == f"00-{child.trace_id}-{child.span_id}-01"
+    assert current_span() is NOOP_SPAN
+
+
+def test_exceptions_mark_the_span_as_error(recorder):
+    with pytest.raises(RuntimeError):
+        with span("falha"):
+            raise RuntimeError("boom")
+
+    assert recorder.spans[0].status == STATUS_ERROR
+    assert recorder.spans[0].status_message == "RuntimeError: boom"
+
+
+def test_remote_traceparent_is_continued(recorder):
+    root = tracer.start_span("HTTP GET", traceparent=f"00-{TRACE_ID}-{PARENT_ID}-01")
+
+    assert (root.trace_id, root.parent_id, root.sampled) == (TRACE_ID, PARENT_ID, True)
+    assert tracer.start_span("x", traceparent="lixo").trace_id != TRACE_ID
+
+
+def test_unsampled_spans_are_not_exported(recorder, monkeypatch):
+    monkeypatch.setattr(tracer, "sample_rate", 0.0)
+
+    with span("descartado"):
+        pass
+
+    assert recorder.spans == []
+
+
+def test_otlp_encoding(recorder):
+    with span("op", count=3, ratio=0.5, ok=True, route="/x") as current:
+        pass
+
+    encoded = current.to_otlp()
+
+    assert encoded["traceId"] == current.trace_id
+    assert "parentSpanId" not in encoded
+    assert {"key": "count", "value": {"intValue": "3"}} in encoded["attributes"]
+    assert {"key": "ok", "value": {"boolValue": True}} in encoded["attributes"]
+    assert int(encoded["endTimeUnixNano"]) >= int(encoded["startTimeUnixNano"])
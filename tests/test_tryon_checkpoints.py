@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+import pytest
+
+import tryon_checkpoints
+from tryon_checkpoints import checkpoint_key, find_resume_point, save_checkpoint
+
+pytestmark = pytest.mark.anyio
+
+
+def test_key_depends_on_user_photo_and_garment_order():
+    key = checkpoint_key("u1", "foto", ["a", "b"])
+
+    assert key == checkpoint_key("u1", "foto", ["a", "b"])
+    assert key != checkpoint_key("u1", "foto", ["b", "a"])
+    assert key != checkpoint_key("u1", "outra-foto", ["a", "b"])
+    assert key != checkpoint_key("u2", "foto", ["a", "b"])
+
+
+async def test_resume_from_the_longest_saved_prefix(mongo_db):
+    checkpoints = mongo_db.tryon_checkpoints
+    await save_checkpoint(checkpoints, "u1", "foto", ["a"], "img-a")
+    await save_checkpoint(checkpoints, "u1", "foto", ["a", "b"], "img-ab")
+
+    assert await find_resume_point(checkpoints, "u1", "foto", ["a", "b", "c"]) == (2, "img-ab")
+    assert await find_resume_point(checkpoints, "u1", "foto", ["a", "c"]) == (1, "img-a")
+
+
+async def test_nothing_to_resume(mongo_db):
+    checkpoints = mongo_db.tryon_checkpoints
+    await save_checkpoint(checkpoints, "u1", "foto", ["a"], "img-a")
+
+    assert await find_resume_point(checkpoints, "u1", "foto", ["b", "a"]) == (0, None)
+    assert await find_resume_point(checkpoints, "u1", "outra-foto", ["a"]) == (0, None)
+
+
+async def test_expired_checkpoints_are_ignored(mongo_db, monkeypatch):
+    monkeypatch.setattr(tryon_checkpoints, "CHECKPOINT_TTL", timedelta(seconds=-1))
+    await save_checkpoint(mongo_db.tryon_checkpoints, "u1", "foto", ["a"], "img-a")
+
+    assert await find_resume_point(mongo_db.tryon_checkpoints, "u1", "foto", ["a"]) == (0, None)
+
+
+async def test_saving_the_same_step_again_replaces_the_image(mongo_db):
+    checkpoints = mongo_db.tryon_checkpoints
+    await save_checkpoint(checkpoints, "u1", "foto", ["a"], "img-1")
+    await save_checkpoint(checkpoints, "u1", "foto", ["a"], "img-2")
+
+    assert await checkpoints.count_documents({}) == 1
+    assert await find_resume_point(checkpoints, "u1", "foto", ["a"]) == (1, "img-2")
+
+
+async def test_save_failures_do_not_interrupt_the_tryon():
+    class Failing:
+        async def update_one(self, *args, **kwargs):
+            raise RuntimeError("mongo fora do ar")
+
+    await save_checkpoint(Failing(), "u1", "foto", ["a"], "img")
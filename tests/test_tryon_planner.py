@@ -0,0 +1,47 @@
+from tryon_planner import SKIP_COVERED, SKIP_UNDER_ONE_PIECE, SKIP_UNRENDERABLE, plan_tryon
+
+
+def roupa(item_id, tipo, cor="preto", nome=None):
+    return {"id": item_id, "tipo": tipo, "cor": cor, "nome": nome or tipo}
+
+
+def test_steps_follow_the_garment_layers_whatever_the_selection_order():
+    plan = plan_tryon([roupa("j", "jaqueta"), roupa("c", "camiseta"), roupa("p", "calca")])
+
+    assert [step.clothing["id"] for step in plan.steps] == ["p", "c", "j"]
+    assert [step.category for step in plan.steps] == ["bottoms", "tops", "tops"]
+    assert plan.skipped == []
+
+
+def test_shoes_and_accessories_are_skipped():
+    plan = plan_tryon([roupa("c", "camiseta"), roupa("t", "tênis"), roupa("o", "óculos")])
+
+    assert [step.clothing["id"] for step in plan.steps] == ["c"]
+    assert {item["id"]: item["motivo"] for item in plan.skipped} == {"t": SKIP_UNRENDERABLE, "o": SKIP_UNRENDERABLE}
+
+
+def test_only_the_last_garment_of_a_slot_is_applied():
+    plan = plan_tryon([roupa("c1", "camiseta"), roupa("c2", "blusa")])
+
+    assert [step.clothing["id"] for step in plan.steps] == ["c2"]
+    assert plan.skipped == [{"id": "c1", "nome": "camiseta", "motivo": SKIP_COVERED}]
+
+
+def test_one_piece_replaces_top_and_bottom():
+    plan = plan_tryon([roupa("c", "camiseta"), roupa("v", "vestido"), roupa("s", "saia"), roupa("j", "jaqueta")])
+
+    assert [step.clothing["id"] for step in plan.steps] == ["v", "j"]
+    assert {item["id"] for item in plan.skipped if item["motivo"] == SKIP_UNDER_ONE_PIECE} == {"c", "s"}
+
+
+def test_unknown_types_are_left_to_the_model():
+    plan = plan_tryon([roupa("x", "colete de lã", cor="verde", nome="Colete"), roupa("c", "camiseta")])
+
+    assert {step.clothing["id"]: step.category for step in plan.steps} == {"c": "tops", "x": "auto"}
+    assert next(step for step in plan.steps if step.category == "auto").description == "verde colete de lã - Colete"
+
+
+def test_descriptions_are_in_english_for_the_model():
+    (step,) = plan_tryon([roupa("c", "Calça", cor="azul", nome="Jeans")]).steps
+
+    assert step.description == "azul pants - Jeans"
@@ -0,0 +1,67 @@
+import base64
+import io
+from datetime import timedelta
+
+import pytest
+from PIL import Image
+
+import tryon_results
+from tryon_results import load_result, save_result
+
+pytestmark = pytest.mark.anyio
+
+
+def png_bytes() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), (20, 90, 160)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+PNG = png_bytes()
+DATA_URI = "data:image/png;base64," + base64.b64encode(PNG).decode()
+
+
+async def test_saved_result_is_loaded_by_its_owner(mongo_db):
+    result_id = await save_result(mongo_db.tryon_results, "u1", DATA_URI, ["r1", "r2"])
+
+    image = await load_result(mongo_db.tryon_results, "u1", result_id)
+
+    assert (image.data, image.content_type) == (PNG, "image/png")
+    assert image.to_data_uri() == DATA_URI
+    assert await load_result(mongo_db.tryon_results, "u2", result_id) is None
+
+
+async def test_expired_result_is_not_loaded(mongo_db, monkeypatch):
+    monkeypatch.setattr(tryon_results, "RESULT_TTL", timedelta(seconds=-1))
+    result_id = await save_result(mongo_db.tryon_results, "u1", DATA_URI, ["r1"])
+
+    assert await load_result(mongo_db.tryon_results, "u1", result_id) is None
+
+
+async def test_unreadable_image_is_not_saved(mongo_db):
+    assert await save_result(mongo_db.tryon_results, "u1", "https://fal.media/x.png", ["r1"]) is None
+    assert await mongo_db.tryon_results.count_documents({}) == 0
+
+
+async def test_storage_failure_does_not_interrupt_the_tryon(mongo_db):
+    class Failing:
+        async def insert_one(self, doc):
+            raise RuntimeError("mongo fora do ar")
+
+    assert await save_result(Failing(), "u1", DATA_URI, ["r1"]) is None
+
+
+def test_legacy_look_image_goes_to_the_blob_store(api, auth_headers, user_id):
+    import anyio
+    import server
+
+    anyio.run(server.db.clothing_items.insert_one, {"id": "r1", "user_id": user_id})
+    response = api.post("/api/looks", json={
+        "nome": "Antigo", "roupas_ids": ["r1"], "ocasiao": "casual", "imagem_look": DATA_URI,
+    }, headers=auth_headers)
+    assert response.status_code == 200
+
+    look = anyio.run(server.db.looks.find_one, {"id": response.json()["id"]})
+    assert look["imagem_look"] is None
+    blob = anyio.run(server.db.image_blobs.find_one, {"_id": look["imagem_blob_id"]})
+    assert (bytes(blob["data"]), blob["refcount"]) == (PNG, 1)
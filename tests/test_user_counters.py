@@ -0,0 +1,52 @@
+import pytest
+
+from user_counters import FAVORITOS, LOOKS, ROUPAS, initial_counters, read, refresh
+
+pytestmark = pytest.mark.anyio
+
+
+async def user_doc(db, user_id="u1"):
+    return await db.users.find_one({"id": user_id}, {"_id": 0})
+
+
+async def test_refresh_follows_inserts_and_deletes(mongo_db):
+    await mongo_db.users.insert_one({"id": "u1", **initial_counters()})
+
+    await mongo_db.looks.insert_many([{"id": "l1", "user_id": "u1"}, {"id": "l2", "user_id": "u1", "favorito": True}])
+    assert await refresh(mongo_db, "u1", LOOKS) == 2
+    assert await refresh(mongo_db, "u1", FAVORITOS) == 1
+
+    await mongo_db.looks.delete_one({"id": "l2"})
+    await refresh(mongo_db, "u1", LOOKS)
+    await refresh(mongo_db, "u1", FAVORITOS)
+
+    user = await user_doc(mongo_db)
+    assert (user["looks_count"], user["favoritos_count"]) == (1, 0)
+
+
+async def test_a_missed_refresh_is_corrected_by_the_next_one(mongo_db):
+    await mongo_db.users.insert_one({"id": "u1", "favoritos_count": 7})  # valor errado
+    await mongo_db.looks.insert_one({"id": "l1", "user_id": "u1", "favorito": True})
+
+    await refresh(mongo_db, "u1", FAVORITOS)
+
+    assert (await user_doc(mongo_db))["favoritos_count"] == 1
+
+
+async def test_counts_are_per_user(mongo_db):
+    await mongo_db.users.insert_many([{"id": "u1"}, {"id": "u2"}])
+    await mongo_db.clothing_items.insert_many([{"user_id": "u1"}, {"user_id": "u2"}, {"user_id": "u2"}])
+
+    assert await refresh(mongo_db, "u1", ROUPAS) == 1
+    assert await refresh(mongo_db, "u2", ROUPAS) == 2
+
+
+async def test_read_backfills_missing_counters_once(mongo_db):
+    await mongo_db.users.insert_one({"id": "u1", "roupas_count": 3, "looks_count": -1})
+    await mongo_db.looks.insert_one({"id": "l1", "user_id": "u1", "favorito": True})
+    user = await user_doc(mongo_db)
+
+    values = await read(mongo_db, user)
+
+    assert values == {"roupas_count": 3, "looks_count": 0, "favoritos_count": 1}
+    assert (await user_doc(mongo_db))["favoritos_count"] == 1
@@ -0,0 +1,46 @@
+from versioned_cache import VersionedLRU
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = VersionedLRU(max_entries=2)
+    cache.put(("u1", 1), "a")
+    cache.put(("u2", 1), "b")
+    assert cache.get(("u1", 1)) == "a"  # passa a ser o mais recente
+
+    cache.put(("u3", 1), "c")
+
+    assert cache.get(("u2", 1)) is None
+    assert cache.get(("u1", 1)) == "a"
+    assert cache.get(("u1", 2)) is None  # outra versão do guarda-roupa
+    assert len(cache) == 2
+
+
+def test_total_weight_is_bounded():
+    cache = VersionedLRU(max_entries=10, max_weight=100, weigh=len)
+    cache.put("a", "x" * 40)
+    cache.put("b", "x" * 40)
+
+    cache.put("c", "x" * 40)
+
+    assert cache.get("a") is None
+    assert cache.weight == 80
+    assert len(cache) == 2
+
+
+def test_replacing_a_key_updates_the_weight():
+    cache = VersionedLRU(max_entries=10, max_weight=100, weigh=len)
+    cache.put("a", "x" * 40)
+
+    cache.put("a", "x" * 10)
+
+    assert cache.weight == 10
+
+
+def test_value_larger_than_the_cache_is_not_stored():
+    cache = VersionedLRU(max_entries=10, max_weight=100, weigh=len)
+    cache.put("a", "x" * 40)
+
+    cache.put("big", "x" * 101)
+
+    assert cache.get("big") is None
+    assert cache.get("a") == "x" * 40
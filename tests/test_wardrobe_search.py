@@ -0,0 +1,66 @@
+import pytest
+
+from repositories import ClothingRepository
+from wardrobe_search import build_filter, search_fields
+
+pytestmark = pytest.mark.anyio
+
+
+def test_search_fields_are_normalized():
+    doc = {"nome": "Calça Jeans Azul", "tipo": "Calças", "cor": "Azul-Marinho", "estilo": "Casual"}
+
+    assert search_fields(doc) == {"nome": "calca jeans azul", "tipo": "calca", "cor": "azul-marinho", "estilo": "casual"}
+
+
+def test_build_filter_only_includes_the_given_filters():
+    assert build_filter("u1") == {"user_id": "u1"}
+    assert build_filter("u1", tipo="Calças", cor="Azul", estilo="Casual", categoria="bottoms") == {
+        "user_id": "u1",
+        "busca.tipo": "calca",
+        "busca.cor": "azul",
+        "busca.estilo": "casual",
+        "categoria": "bottoms",
+    }
+
+
+def test_build_filter_prefix_and_text():
+    query = build_filter("u1", prefixo="Calç.", texto="  jeans  ")
+
+    assert query["busca.nome"] == {"$regex": "^calc\\."}
+    assert query["$text"] == {"$search": "jeans"}
+    assert "busca.nome" not in build_filter("u1", prefixo="   ")
+
+
+async def test_legacy_garments_are_found_after_the_backfill(mongo_db):
+    repo = ClothingRepository(mongo_db.clothing_items)
+    # Cadastradas antes de busca/categoria/tipo_canonico
+    await mongo_db.clothing_items.insert_many([
+        {"id": "a", "user_id": "u1", "nome": "Calça Jeans", "tipo": "Calça", "cor": "Azul", "estilo": "casual"},
+        {"id": "b", "user_id": "u1", "nome": "Capa", "tipo": "capa de chuva", "cor": "Amarela", "estilo": "casual"},
+    ])
+    await repo.insert({"id": "c", "user_id": "u1", "nome": "Blusa", "tipo": "blusa", "cor": "Preta",
+                       "estilo": "casual", "tipo_canonico": "blusa", "categoria": "tops"})
+
+    assert await repo.backfill_search_fields() == 2
+    assert await repo.backfill_search_fields() == 0  # tipo desconhecido não volta a cada startup
+
+    total, items = await repo.search(build_filter("u1", categoria="bottoms"), 0, 10)
+    assert total == 1
+    assert items[0]["id"] == "a"
+    assert items[0]["tipo"] == "Calça"  # o que o usuário escreveu é preservado
+    assert items[0]["tipo_canonico"] == "calca"
+    assert "busca" not in items[0]
+
+    total, items = await repo.search(build_filter("u1", tipo="calcas", cor="azul"), 0, 10)
+    assert [item["id"] for item in items] == ["a"]
+
+
+async def test_facet_counts_use_the_normalized_fields(mongo_db):
+    repo = ClothingRepository(mongo_db.clothing_items)
+    for i, (tipo, cor) in enumerate([("Calça", "Azul"), ("calcas", "azul"), ("Blusa", "Preta")]):
+        await repo.insert({"id": str(i), "user_id": "u1", "nome": "x", "tipo": tipo, "cor": cor, "estilo": "casual"})
+
+    facets = await repo.facet_counts("u1")
+
+    assert facets["tipo"] == [{"valor": "calca", "total": 2}, {"valor": "blusa", "total": 1}]
+    assert facets["cor"][0] == {"valor": "azul", "total": 2}